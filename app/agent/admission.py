@@ -0,0 +1,281 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import jsonify
+
+# 各端点类别的默认限制
+DEFAULT_LIMITS = {
+    # 视频分析：max_concurrent + max_queue 为系统中（运行+排队）允许的任务总数
+    'video': {'max_concurrent': 2, 'max_queue': 16, 'queue_timeout': 0},
+    'chat': {'max_concurrent': 16, 'max_queue': 32, 'queue_timeout': 10},
+    'plan': {'max_concurrent': 4, 'max_queue': 8, 'queue_timeout': 15},
+}
+
+
+class AdmissionRejected(Exception):
+    """
+    请求被准入控制拒绝
+    """
+
+    def __init__(self, endpoint_class, status_code, retry_after, reason):
+        super().__init__(reason)
+        self.endpoint_class = endpoint_class
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _ClassState:
+    def __init__(self, max_concurrent, max_queue, queue_timeout):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        # 平均占用时长（秒）的指数滑动平均，用于估算 Retry-After
+        self.avg_service_seconds = 1.0
+        self.stats = {
+            'admitted': 0,
+            'queued': 0,
+            'shed_queue_full': 0,
+            'shed_timeout': 0,
+            'max_wait_seconds': 0.0,
+        }
+
+
+class AdmissionController:
+    """
+    端点准入控制
+
+    按端点类别（video/chat/plan）限制并发数和排队深度：
+    - 有空闲槽位：立即放行
+    - 槽位已满但队列未满：最多排队 queue_timeout 秒，超时返回503
+    - 队列已满：立即返回429
+    两种拒绝都附带根据平均占用时长估算的 Retry-After。
+    """
+
+    def __init__(self, limits=None):
+        self._cond = threading.Condition()
+        self._classes = {}
+        self.configure(limits or DEFAULT_LIMITS)
+
+    def configure(self, limits):
+        """
+        更新各类别的限制
+
+        Args:
+            limits: {类别: {'max_concurrent', 'max_queue', 'queue_timeout'}}
+        """
+        with self._cond:
+            for endpoint_class, limit in limits.items():
+                state = self._classes.get(endpoint_class)
+                if state is None:
+                    self._classes[endpoint_class] = _ClassState(**limit)
+                else:
+                    state.max_concurrent = limit['max_concurrent']
+                    state.max_queue = limit['max_queue']
+                    state.queue_timeout = limit['queue_timeout']
+            self._cond.notify_all()
+
+    def acquire(self, endpoint_class):
+        """
+        获取一个执行槽位，必要时排队等待
+
+        Args:
+            endpoint_class: 端点类别
+
+        Returns:
+            started_at: 获得槽位的时间，释放时传回
+
+        Raises:
+            AdmissionRejected: 队列已满或排队超时
+        """
+        state = self._classes[endpoint_class]
+        with self._cond:
+            if state.active < state.max_concurrent:
+                state.active += 1
+                state.stats['admitted'] += 1
+                return time.monotonic()
+
+            if state.waiting >= state.max_queue or state.queue_timeout <= 0:
+                state.stats['shed_queue_full'] += 1
+                raise AdmissionRejected(endpoint_class, 429, self._retry_after(state), 'Too many requests')
+
+            state.waiting += 1
+            state.stats['queued'] += 1
+            wait_start = time.monotonic()
+            deadline = wait_start + state.queue_timeout
+            try:
+                while state.active >= state.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        state.stats['shed_timeout'] += 1
+                        raise AdmissionRejected(endpoint_class, 503, self._retry_after(state), 'Server busy')
+                    self._cond.wait(remaining)
+            finally:
+                state.waiting -= 1
+
+            waited = time.monotonic() - wait_start
+            state.stats['max_wait_seconds'] = max(state.stats['max_wait_seconds'], waited)
+            state.active += 1
+            state.stats['admitted'] += 1
+            return time.monotonic()
+
+    def try_reserve(self, endpoint_class):
+        """
+        为后台任务预留容量（不等待）
+
+        后台任务在 release() 之前一直占用容量，容量为 max_concurrent + max_queue。
+
+        Args:
+            endpoint_class: 端点类别
+
+        Returns:
+            started_at: 预留的时间，释放时传回
+
+        Raises:
+            AdmissionRejected: 容量已满
+        """
+        state = self._classes[endpoint_class]
+        with self._cond:
+            if state.active >= state.max_concurrent + state.max_queue:
+                state.stats['shed_queue_full'] += 1
+                raise AdmissionRejected(endpoint_class, 429, self._retry_after(state), 'Too many requests')
+            state.active += 1
+            state.stats['admitted'] += 1
+            return time.monotonic()
+
+    def capacity(self, endpoint_class):
+        """
+        后台任务可预留的总容量（max_concurrent + max_queue）
+
+        Args:
+            endpoint_class: 端点类别
+
+        Returns:
+            capacity: 容量
+        """
+        state = self._classes[endpoint_class]
+        with self._cond:
+            return state.max_concurrent + state.max_queue
+
+    def release(self, endpoint_class, started_at):
+        """
+        释放槽位
+
+        Args:
+            endpoint_class: 端点类别
+            started_at: acquire()/try_reserve() 的返回值
+        """
+        state = self._classes[endpoint_class]
+        elapsed = time.monotonic() - started_at
+        with self._cond:
+            state.active -= 1
+            state.avg_service_seconds = 0.8 * state.avg_service_seconds + 0.2 * elapsed
+            self._cond.notify_all()
+
+    def releaser(self, endpoint_class, started_at):
+        """
+        创建只会生效一次的释放函数
+
+        用于释放时机不确定、可能从多处触发的场景（如流式响应关闭时）。
+
+        Args:
+            endpoint_class: 端点类别
+            started_at: acquire()/try_reserve() 的返回值
+
+        Returns:
+            release: 无参数的释放函数，重复调用不会重复释放
+        """
+        lock = threading.Lock()
+        released = []
+
+        def release():
+            with lock:
+                if released:
+                    return
+                released.append(True)
+            self.release(endpoint_class, started_at)
+
+        return release
+
+    @contextmanager
+    def slot(self, endpoint_class):
+        """
+        以上下文管理器的方式占用一个槽位
+        """
+        started_at = self.acquire(endpoint_class)
+        try:
+            yield
+        finally:
+            self.release(endpoint_class, started_at)
+
+    def limit(self, endpoint_class):
+        """
+        为视图函数添加准入控制的装饰器，被拒绝时返回429/503和 Retry-After
+
+        Args:
+            endpoint_class: 端点类别
+
+        Returns:
+            decorator: 装饰器
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                try:
+                    started_at = self.acquire(endpoint_class)
+                except AdmissionRejected as e:
+                    return rejection_response(e)
+                try:
+                    return view(*args, **kwargs)
+                finally:
+                    self.release(endpoint_class, started_at)
+
+            return wrapper
+
+        return decorator
+
+    def get_stats(self):
+        """
+        获取各类别的准入统计
+        """
+        with self._cond:
+            return {
+                endpoint_class: dict(
+                    state.stats,
+                    active=state.active,
+                    waiting=state.waiting,
+                    max_concurrent=state.max_concurrent,
+                    max_queue=state.max_queue,
+                    avg_service_seconds=round(state.avg_service_seconds, 3),
+                )
+                for endpoint_class, state in self._classes.items()
+            }
+
+    def _retry_after(self, state):
+        """
+        估算客户端应等待的秒数（调用方需持有锁）
+        """
+        backlog = state.waiting + 1
+        seconds = state.avg_service_seconds * backlog / max(1, state.max_concurrent)
+        return max(1, int(math.ceil(seconds)))
+
+
+def rejection_response(error):
+    """
+    将 AdmissionRejected 转换为带 Retry-After 的JSON响应
+
+    Args:
+        error: AdmissionRejected异常
+
+    Returns:
+        response: Flask响应
+    """
+    response = jsonify({'error': error.reason, 'retry_after': error.retry_after})
+    response.status_code = error.status_code
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
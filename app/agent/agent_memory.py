@@ -3,20 +3,223 @@ from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_openai import ChatOpenAI
+import bisect
 import json
 import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
+from enum import IntEnum
+from app.agent.memory_journal import MemoryJournal, replay
+from app.agent.token_utils import estimate_tokens
+
+# 每条消息除内容外的固定开销（角色标记、分隔符等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# 聊天历史分页的默认和最大每页条数
+DEFAULT_HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
+
+_message_id_lock = threading.Lock()
+_last_message_id = 0
+
+
+def next_message_id():
+    """
+    生成消息ID
+    
+    以微秒时间戳为基础，进程内严格递增；对话被清空后也不会复用，可以作为分页游标。
+    
+    Returns:
+        message_id: 消息ID
+    """
+    global _last_message_id
+    with _message_id_lock:
+        _last_message_id = max(_last_message_id + 1, time.time_ns() // 1000)
+        return _last_message_id
+
+
+def text_tokens(text):
+    """
+    估算一条消息文本占用的token数量（含固定开销）
+    """
+    return estimate_tokens(text) + MESSAGE_OVERHEAD_TOKENS
+
+
+def message_tokens(message):
+    """
+    估算一条消息占用的token数量
+    
+    Args:
+        message: LangChain 消息对象
+        
+    Returns:
+        tokens: 估算的token数量
+    """
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    return text_tokens(content)
+
+
+class Role(IntEnum):
+    """
+    消息角色
+    """
+    USER = 0
+    ASSISTANT = 1
+
+
+# 角色名称（接口和持久化格式中使用）与 Role 的对应关系
+ROLES = {"user": Role.USER, "assistant": Role.ASSISTANT}
+ROLE_NAMES = {Role.USER: "user", Role.ASSISTANT: "assistant"}
+
+
+class MessageRecord:
+    """
+    紧凑的消息记录
+    
+    LangChain 消息是带元数据字典的 pydantic 模型，每条占用上千字节；对话历史内部只保存
+    ID、角色、文本、时间戳和缓存的token数，在链需要时才通过 to_message() 转换。
+    """
+    __slots__ = ('id', 'role', 'text', 'ts', 'tokens')
+    
+    def __init__(self, id, role, text, ts, tokens):
+        self.id = id
+        self.role = role
+        self.text = text
+        self.ts = ts
+        self.tokens = tokens
+    
+    def to_message(self):
+        """
+        转换为 LangChain 消息
+        """
+        if self.role == Role.USER:
+            return HumanMessage(content=self.text)
+        return AIMessage(content=self.text)
+    
+    def to_dict(self):
+        """
+        转换为前端可用的格式
+        """
+        return {"id": self.id, "role": ROLE_NAMES[self.role], "content": self.text}
+
 
 # 自定义聊天历史存储类
 class InMemoryChatHistory(BaseChatMessageHistory):
-    def __init__(self):
-        self.messages = []
+    def __init__(self, complete=True):
+        # 消息记录（MessageRecord），按ID递增
+        self.records = []
+        # 每条消息的ID，与 records 一一对应（与记录共享同一个int对象），用于二分查找
+        self.ids = []
+        # 是否包含全部历史；从持久化存储只加载最近的消息时为False
+        self.complete = complete
+    
+    @property
+    def messages(self):
+        """
+        全部消息的 LangChain 形式（每次调用都会新建消息对象，只取窗口时使用 get_window）
+        """
+        return [record.to_message() for record in self.records]
+    
+    @property
+    def token_counts(self):
+        return [record.tokens for record in self.records]
+    
+    def __len__(self):
+        return len(self.records)
+    
+    def append(self, role, text, message_id=None, ts=None):
+        """
+        添加一条消息
+        
+        Args:
+            role: 角色（Role）
+            text: 消息文本
+            message_id: 消息ID，不提供（或不大于最后一条消息的ID）时生成新的ID
+            ts: 时间戳（秒），默认为当前时间
+            
+        Returns:
+            record: 消息记录
+        """
+        if message_id is None or (self.ids and message_id <= self.ids[-1]):
+            message_id = next_message_id()
+        record = MessageRecord(message_id, role, text, ts if ts is not None else time.time(), text_tokens(text))
+        # 先写ID：并发读取时 ids 只会比 records 多，不会少
+        self.ids.append(message_id)
+        self.records.append(record)
+        return record
     
-    def add_message(self, message):
-        self.messages.append(message)
+    def add_message(self, message, message_id=None):
+        role = Role.USER if isinstance(message, HumanMessage) else Role.ASSISTANT
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        self.append(role, content, message_id)
     
     def clear(self):
-        self.messages = []
+        self.records = []
+        self.ids = []
+    
+    def covers(self, message_id):
+        """
+        判断 message_id 之后（不含）的消息是否都在内存中
+        """
+        return self.complete or (bool(self.ids) and message_id >= self.ids[0])
+    
+    def contains(self, message_id):
+        i = bisect.bisect_left(self.ids, message_id)
+        return i < len(self.ids) and self.ids[i] == message_id
+    
+    def get_page(self, before=None, after=None, limit=DEFAULT_HISTORY_PAGE_SIZE):
+        """
+        按ID范围读取一页消息，只转换这一页
+        
+        Args:
+            before: 只返回ID小于该值的消息（取最新的 limit 条）
+            after: 只返回ID大于该值的消息（取最早的 limit 条）
+            limit: 每页条数
+            
+        Returns:
+            (page, has_more): 按时间顺序排列的消息字典列表；游标方向上是否还有更多消息
+        """
+        records, ids = self.records, self.ids
+        # 只在前 count 条中查找（并发追加时 ids 可能多出一条）
+        count = len(records)
+        lo = bisect.bisect_right(ids, after, 0, count) if after is not None else 0
+        hi = bisect.bisect_left(ids, before, 0, count) if before is not None else count
+        if after is not None:
+            start, end = lo, min(hi, lo + limit)
+            has_more = end < count
+        else:
+            start, end = max(lo, hi - limit), hi
+            has_more = start > 0 or not self.complete
+        return [records[i].to_dict() for i in range(start, end)], has_more
+    
+    def get_window(self, token_budget, start=0):
+        """
+        获取在token预算内的最近消息
+        
+        从最新的消息向前累加缓存的token数，直到超出预算；窗口总是从用户消息开始，
+        避免把一轮对话从中间截断。只有窗口内的消息会转换为 LangChain 消息。
+        
+        Args:
+            token_budget: token预算
+            start: 只从该位置之后的消息中选择（之前的消息已被摘要覆盖）
+            
+        Returns:
+            messages: 按时间顺序排列的消息列表
+        """
+        records = self.records
+        used = 0
+        first = len(records)
+        for i in range(len(records) - 1, start - 1, -1):
+            used += records[i].tokens
+            if used > token_budget:
+                break
+            first = i
+        
+        while first < len(records) and records[first].role != Role.USER:
+            first += 1
+        return [record.to_message() for record in records[first:]]
 
 class AgentMemory:
     def __init__(self):
@@ -26,6 +229,108 @@ class AgentMemory:
         self.ski_history = {}
         # 初始化用户学习计划存储
         self.learning_plans = {}
+        # 对话滚动摘要：{'version', 'text', 'covered_until', 'updated_at'}
+        self.summaries = {}
+        self._summary_lock = threading.Lock()
+        # 后台摘要器（ConversationSummarizer），未配置时不做摘要
+        self.summarizer = None
+        # 持久化存储（SQLMemoryStore），未配置时只保存在内存中
+        self.store = None
+        # 配置持久化存储时，上面的字典是最近活跃用户的读缓存，最多缓存 max_cached_users 个用户
+        self.max_cached_users = 1000
+        # 其他进程也会写入同一用户的数据：命中缓存超过 cache_revalidate_interval 秒时与数据库
+        # 核对最新消息ID，不一致时重新加载；加载超过 cache_max_age 秒后无条件重新加载
+        self.cache_revalidate_interval = 5.0
+        self.cache_max_age = 300.0
+        # {user_id: {'loaded_at', 'checked_at'}}
+        self._cached_users = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_stats = {'hits': 0, 'misses': 0, 'evicted': 0, 'revalidated': 0, 'reloaded': 0}
+        # save_to_disk 使用的追加写入日志，以及每个用户已写入日志的数据位置
+        self.journal = MemoryJournal()
+        self._journal_offsets = {}
+        self._journal_lock = threading.Lock()
+    
+    def _ensure_loaded(self, user_id):
+        """
+        配置持久化存储时，确保用户数据已在读缓存中且没有过期
+        
+        Args:
+            user_id: 用户ID
+        """
+        if self.store is None:
+            return
+        now = time.monotonic()
+        with self._cache_lock:
+            entry = self._cached_users.get(user_id)
+            if entry is not None:
+                self._cached_users.move_to_end(user_id)
+                if now - entry['checked_at'] < self.cache_revalidate_interval:
+                    self.cache_stats['hits'] += 1
+                    return
+        
+        if entry is None:
+            with self._cache_lock:
+                self.cache_stats['misses'] += 1
+        elif now - entry['loaded_at'] < self.cache_max_age and self._is_current(user_id):
+            with self._cache_lock:
+                entry['checked_at'] = now
+                self.cache_stats['hits'] += 1
+                self.cache_stats['revalidated'] += 1
+            return
+        else:
+            # 其他进程追加或清空了对话，或者缓存已超过最长保留时间
+            with self._cache_lock:
+                self.cache_stats['reloaded'] += 1
+        
+        # 在锁外读取数据库；并发加载同一用户时保留先写入缓存的结果
+        data = self.store.load_user(user_id)
+        session_history = InMemoryChatHistory(complete=data['complete'])
+        for message_id, role, content in data['chat_history']:
+            session_history.append(ROLES.get(role, Role.ASSISTANT), content, message_id)
+        
+        with self._cache_lock:
+            current = self._cached_users.get(user_id)
+            if current is not None and current is not entry:
+                return
+            self.chat_histories[user_id] = session_history
+            self.ski_history[user_id] = data['ski_history']
+            self.learning_plans[user_id] = data['learning_plans']
+            self._cached_users[user_id] = {'loaded_at': now, 'checked_at': now}
+            self._cached_users.move_to_end(user_id)
+            if entry is not None:
+                # 摘要覆盖的消息位置基于旧的历史，重新加载后不再适用
+                with self._summary_lock:
+                    self.summaries.pop(user_id, None)
+            while len(self._cached_users) > self.max_cached_users:
+                evicted, _ = self._cached_users.popitem(last=False)
+                self.chat_histories.pop(evicted, None)
+                self.ski_history.pop(evicted, None)
+                self.learning_plans.pop(evicted, None)
+                self.cache_stats['evicted'] += 1
+                with self._summary_lock:
+                    self.summaries.pop(evicted, None)
+    
+    def _is_current(self, user_id):
+        """
+        缓存中的对话历史是否与数据库（含尚未写入的操作）一致
+        
+        只比较最新消息ID：其他进程追加消息或清空对话都会改变它。
+        """
+        session_history = self.chat_histories.get(user_id)
+        cached_latest = session_history.ids[-1] if session_history is not None and session_history.ids else None
+        return self.store.latest_message_id(user_id) == cached_latest
+    
+    def get_cache_stats(self):
+        """
+        获取读缓存、持久化存储和磁盘日志的统计信息
+        """
+        with self._cache_lock:
+            stats = dict(self.cache_stats, cached_users=len(self._cached_users))
+        stats['journal'] = self.journal.get_stats()
+        if self.store is not None:
+            stats['store'] = self.store.get_stats()
+        return stats
     
     def get_session_history(self, user_id):
         """
@@ -37,6 +342,7 @@ class AgentMemory:
         Returns:
             session_history: 会话历史对象
         """
+        self._ensure_loaded(user_id)
         if user_id not in self.chat_histories:
             # 创建新的会话历史
             self.chat_histories[user_id] = InMemoryChatHistory()
@@ -53,12 +359,18 @@ class AgentMemory:
             content: 消息内容
         """
         session_history = self.get_session_history(user_id)
+        message_id = next_message_id()
+        if self.store is not None and role in ("user", "assistant"):
+            self.store.append_message(user_id, role, content, message_id)
         
         # 根据角色添加消息
         if role == "user":
-            session_history.add_message(HumanMessage(content=content))
+            session_history.append(Role.USER, content, message_id)
         elif role == "assistant":
-            session_history.add_message(AIMessage(content=content))
+            session_history.append(Role.ASSISTANT, content, message_id)
+            # 一轮对话结束后检查是否需要在后台更新摘要
+            if self.summarizer is not None:
+                self.summarizer.maybe_schedule(user_id)
     
     def get_history(self, user_id):
         """
@@ -70,28 +382,70 @@ class AgentMemory:
         Returns:
             history: 对话历史列表
         """
+        self._ensure_loaded(user_id)
         if user_id not in self.chat_histories:
             return []
         
-        session_history = self.chat_histories[user_id]
-        history = []
-        
         # 转换为前端可用的格式
-        for message in session_history.messages:
-            if isinstance(message, HumanMessage):
-                # 用户消息
-                history.append({
-                    "role": "user",
-                    "content": message.content
-                })
-            elif isinstance(message, AIMessage):
-                # 助手消息
-                history.append({
-                    "role": "assistant",
-                    "content": message.content
-                })
-        
-        return history
+        return [
+            {"role": ROLE_NAMES[record.role], "content": record.text}
+            for record in self.chat_histories[user_id].records
+        ]
+    
+    def get_history_page(self, user_id, before=None, after=None, since=None, limit=DEFAULT_HISTORY_PAGE_SIZE):
+        """
+        分页获取对话历史
+        
+        默认返回最新的 limit 条；before/after 按消息ID向前/向后翻页；since 为增量模式：
+        返回该消息之后的新消息，since 指向的消息已不存在（对话被清空）时返回最新一页
+        并标记 reset，客户端应丢弃已缓存的历史。
+        
+        Args:
+            user_id: 用户ID
+            before: 返回ID小于该值的消息
+            after: 返回ID大于该值的消息
+            since: 客户端已有的最新消息ID
+            limit: 每页条数
+            
+        Returns:
+            page: {'history', 'has_more', 'reset'}
+        """
+        limit = max(1, min(limit, MAX_HISTORY_PAGE_SIZE))
+        self._ensure_loaded(user_id)
+        session_history = self.chat_histories.get(user_id)
+        if session_history is None:
+            return {'history': [], 'has_more': False, 'reset': since is not None}
+        
+        reset = False
+        if since is not None:
+            if session_history.covers(since):
+                exists = session_history.contains(since) or (bool(session_history.ids) and since > session_history.ids[-1])
+            else:
+                exists = self.store.message_exists(user_id, since)
+            if exists:
+                after = since
+            else:
+                reset = True
+                before = after = None
+        
+        if after is not None:
+            in_memory = session_history.covers(after)
+        elif before is not None:
+            in_memory = session_history.covers(self._page_floor(session_history, before, limit))
+        else:
+            in_memory = True
+        
+        if in_memory or self.store is None:
+            history, has_more = session_history.get_page(before=before, after=after, limit=limit)
+        else:
+            # 需要的范围早于内存中的窗口，从持久化存储读取
+            history, has_more = self.store.read_messages(user_id, before=before, after=after, limit=limit)
+        return {'history': history, 'has_more': has_more, 'reset': reset}
+    
+    def _page_floor(self, session_history, before, limit):
+        # 向前翻页时这一页最早的消息ID；内存中不够一页时返回0，表示需要读取持久化存储
+        i = bisect.bisect_left(session_history.ids, before) - limit
+        return session_history.ids[i] if i >= 0 else 0
     
     def clear_history(self, user_id):
         """
@@ -100,8 +454,59 @@ class AgentMemory:
         Args:
             user_id: 用户ID
         """
+        if self.store is not None:
+            self.store.clear_history(user_id)
         if user_id in self.chat_histories:
             del self.chat_histories[user_id]
+        with self._summary_lock:
+            self.summaries.pop(user_id, None)
+    
+    def get_summary(self, user_id):
+        """
+        获取对话摘要
+        
+        Args:
+            user_id: 用户ID
+            
+        Returns:
+            summary: 最新版本的摘要，covered_until 为摘要覆盖到的消息位置；没有摘要时返回None
+        """
+        with self._summary_lock:
+            return self.summaries.get(user_id)
+    
+    def save_summary(self, user_id, text, covered_until, expected_version=0, session_history=None):
+        """
+        保存新版本的对话摘要
+        
+        只有当前版本等于 expected_version 且对话未被清空时才保存，避免旧的后台任务
+        覆盖更新的摘要。
+        
+        Args:
+            user_id: 用户ID
+            text: 摘要文本
+            covered_until: 摘要覆盖到的消息位置
+            expected_version: 生成摘要时基于的版本
+            session_history: 生成摘要时读取的会话历史（对话被清空后会换成新对象）
+            
+        Returns:
+            saved: 是否保存成功
+        """
+        with self._summary_lock:
+            current = self.summaries.get(user_id)
+            if (current['version'] if current else 0) != expected_version:
+                return False
+            current_history = self.chat_histories.get(user_id)
+            if current_history is None or len(current_history) < covered_until:
+                return False
+            if session_history is not None and current_history is not session_history:
+                return False
+            self.summaries[user_id] = {
+                'version': expected_version + 1,
+                'text': text,
+                'covered_until': covered_until,
+                'updated_at': datetime.now().isoformat()
+            }
+            return True
     
     def add_ski_history(self, user_id, ski_data):
         """
@@ -111,12 +516,15 @@ class AgentMemory:
             user_id: 用户ID
             ski_data: 滑雪数据
         """
+        self._ensure_loaded(user_id)
         if user_id not in self.ski_history:
             self.ski_history[user_id] = []
         
         # 添加时间戳
         ski_data['timestamp'] = datetime.now().isoformat()
         self.ski_history[user_id].append(ski_data)
+        if self.store is not None:
+            self.store.append_ski_history(user_id, ski_data)
     
     def get_ski_history(self, user_id):
         """
@@ -128,6 +536,7 @@ class AgentMemory:
         Returns:
             history: 滑雪历史列表
         """
+        self._ensure_loaded(user_id)
         if user_id not in self.ski_history:
             return []
         
@@ -141,6 +550,7 @@ class AgentMemory:
             user_id: 用户ID
             plan: 学习计划
         """
+        self._ensure_loaded(user_id)
         if user_id not in self.learning_plans:
             self.learning_plans[user_id] = []
         
@@ -150,6 +560,8 @@ class AgentMemory:
             'created_at': datetime.now().isoformat()
         }
         self.learning_plans[user_id].append(plan_data)
+        if self.store is not None:
+            self.store.append_learning_plan(user_id, plan)
     
     def get_learning_plan(self, user_id):
         """
@@ -161,6 +573,7 @@ class AgentMemory:
         Returns:
             plan: 最新的学习计划
         """
+        self._ensure_loaded(user_id)
         if user_id not in self.learning_plans or not self.learning_plans[user_id]:
             return None
         
@@ -185,13 +598,12 @@ class AgentMemory:
         
         return profile
     
-    def save_to_disk(self, user_id, file_path=None):
+    def _journal_paths(self, user_id, file_path=None):
         """
-        保存用户数据到磁盘
+        获取用户的日志路径和旧版 JSON 文件路径
         
-        Args:
-            user_id: 用户ID
-            file_path: 文件路径
+        Returns:
+            (journal_path, legacy_path)
         """
         if not file_path:
             # 默认保存路径
@@ -201,61 +613,117 @@ class AgentMemory:
                 'data',
                 f'user_{user_id}.json'
             )
+        base = file_path[:-len('.jsonl')] if file_path.endswith('.jsonl') else file_path
+        if base.endswith('.json'):
+            base = base[:-len('.json')]
+        return f"{base}.jsonl", f"{base}.json"
+    
+    def save_to_disk(self, user_id, file_path=None):
+        """
+        保存用户数据到磁盘
         
-        # 确保目录存在
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        
-        # 准备数据
-        data = {
-            'chat_history': self.get_history(user_id),
-            'ski_history': self.get_ski_history(user_id),
-            'learning_plans': self.learning_plans.get(user_id, [])
-        }
+        数据以追加写入的方式保存到用户的 JSONL 日志：只写入上次保存之后新增的消息、
+        滑雪历史、学习计划和摘要；第一次保存（或数据被整体替换后）写入一个 reset
+        记录和完整快照。日志由 MemoryJournal 在后台批量 fsync 和压缩。
         
-        # 保存到文件
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        Args:
+            user_id: 用户ID
+            file_path: 文件路径（保存为同名的 .jsonl 日志）
+        """
+        file_path, _ = self._journal_paths(user_id, file_path)
+        # 同一用户并发保存时避免重复写入新增的记录
+        with self._journal_lock:
+            session_history = self.chat_histories.get(user_id)
+            messages = list(session_history.records) if session_history is not None else []
+            ski_history = self.ski_history.get(user_id)
+            learning_plans = self.learning_plans.get(user_id)
+            summary = self.get_summary(user_id)
+
+            offsets = self._journal_offsets.get((user_id, file_path))
+            records = []
+            if (offsets is None
+                    or (offsets['ski_history_list'] is not None and ski_history is not offsets['ski_history_list'])
+                    or (offsets['learning_plans_list'] is not None and learning_plans is not offsets['learning_plans_list'])):
+                # 日志内容未知或数据被整体替换：从完整快照开始
+                records.append({'op': 'reset'})
+                offsets = {'history': session_history, 'messages': 0, 'ski_history_list': None, 'ski_history': 0,
+                           'learning_plans_list': None, 'learning_plans': 0, 'summary': None}
+            elif offsets['history'] is not None and session_history is not offsets['history']:
+                # 对话被清空过
+                records.append({'op': 'clear_history'})
+                offsets['messages'] = 0
+                offsets['summary'] = None
+
+            for record in messages[offsets['messages']:]:
+                records.append({'op': 'message', **record.to_dict()})
+            for data in (ski_history or [])[offsets['ski_history']:]:
+                records.append({'op': 'ski_history', 'data': data})
+            for data in (learning_plans or [])[offsets['learning_plans']:]:
+                records.append({'op': 'learning_plan', 'data': data})
+            if summary is not None and summary != offsets['summary']:
+                records.append({'op': 'summary', 'data': summary})
+
+            self.journal.append(file_path, records)
+            self._journal_offsets[(user_id, file_path)] = {
+                'history': session_history,
+                'messages': len(messages),
+                'ski_history_list': ski_history,
+                'ski_history': len(ski_history or []),
+                'learning_plans_list': learning_plans,
+                'learning_plans': len(learning_plans or []),
+                'summary': summary,
+            }
     
     def load_from_disk(self, user_id, file_path=None):
         """
         从磁盘加载用户数据
         
+        逐行读取用户的 JSONL 日志并重放；没有日志时读取旧版的 user_<id>.json。
+        
         Args:
             user_id: 用户ID
             file_path: 文件路径
         """
-        if not file_path:
-            # 默认加载路径
-            file_path = os.path.join(
-                os.path.dirname(__file__),
-                '..',
-                'data',
-                f'user_{user_id}.json'
-            )
+        journal_path, legacy_path = self._journal_paths(user_id, file_path)
         
-        if not os.path.exists(file_path):
+        if os.path.exists(journal_path):
+            data = replay(self.journal.read(journal_path))
+        elif os.path.exists(legacy_path):
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        else:
             return
         
-        # 加载数据
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # 恢复对话历史
-        if 'chat_history' in data:
-            # 清空现有历史
-            if user_id in self.chat_histories:
-                del self.chat_histories[user_id]
-            # 添加历史消息
-            for msg in data['chat_history']:
-                self.add_message(user_id, msg['role'], msg['content'])
-        
-        # 恢复滑雪历史
-        if 'ski_history' in data:
-            self.ski_history[user_id] = data['ski_history']
+        # 恢复对话历史（直接重建，不触发摘要和持久化存储写入）
+        session_history = InMemoryChatHistory()
+        for msg in data.get('chat_history', []):
+            # 旧版文件中的消息没有ID，加载时重新生成
+            if msg['role'] in ROLES:
+                session_history.append(ROLES[msg['role']], msg['content'], msg.get('id'))
+        self.chat_histories[user_id] = session_history
         
-        # 恢复学习计划
-        if 'learning_plans' in data:
-            self.learning_plans[user_id] = data['learning_plans']
+        # 恢复对话摘要
+        with self._summary_lock:
+            if data.get('summary'):
+                self.summaries[user_id] = data['summary']
+            else:
+                self.summaries.pop(user_id, None)
+        
+        # 恢复滑雪历史和学习计划
+        self.ski_history[user_id] = data.get('ski_history', [])
+        self.learning_plans[user_id] = data.get('learning_plans', [])
+        
+        # 从日志加载后，下次保存只追加新增的数据
+        if os.path.exists(journal_path):
+            self._journal_offsets[(user_id, journal_path)] = {
+                'history': session_history,
+                'messages': len(session_history),
+                'ski_history_list': self.ski_history[user_id],
+                'ski_history': len(self.ski_history[user_id]),
+                'learning_plans_list': self.learning_plans[user_id],
+                'learning_plans': len(self.learning_plans[user_id]),
+                'summary': data.get('summary'),
+            }
     
     def create_runnable_with_history(self, runnable):
         """
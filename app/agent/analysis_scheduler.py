@@ -0,0 +1,202 @@
+import heapq
+import itertools
+import threading
+import time
+
+# 各LLM提供商单次评价的大致耗时（秒），用于估算任务成本
+PROVIDER_LATENCY_SECONDS = {
+    'openai': 8.0,
+    'qianwen': 6.0,
+    'google': 8.0,
+}
+DEFAULT_PROVIDER_LATENCY_SECONDS = 8.0
+
+# 解码 1 秒 720p 视频的大致耗时（秒）；抽帧需要顺序读完整个视频，成本与 时长×分辨率 成正比
+DECODE_SECONDS_PER_720P_SECOND = 0.05
+PIXELS_720P = 1280 * 720
+
+
+class AnalysisJob:
+    __slots__ = ('task_id', 'user_id', 'cost', 'fn', 'submitted_at', 'seq', 'sort_key')
+
+    def __init__(self, task_id, user_id, cost, fn, submitted_at, seq, sort_key):
+        self.task_id = task_id
+        self.user_id = user_id
+        self.cost = cost
+        self.fn = fn
+        self.submitted_at = submitted_at
+        self.seq = seq
+        self.sort_key = sort_key
+
+
+class AnalysisScheduler:
+    """
+    视频分析任务调度器
+
+    按估算成本做最短作业优先（SJF）调度，避免少数长视频阻塞大量短视频：
+    - 老化：等待时间按 aging_rate 抵扣成本，长任务不会被无限推迟。
+      有效优先级 = 成本 - aging_rate × 等待时间，其中 aging_rate × 当前时间 对所有任务相同，
+      因此只需按静态键 成本 + aging_rate × 提交时间 排序，可以直接使用堆。
+    - 用户公平：每个用户有独立的堆，调度时比较各用户队首，并按该用户正在运行的任务数加罚，
+      同一用户的大量提交不会挤占其他用户。
+    """
+
+    def __init__(self, max_workers=2, aging_rate=1.0, fairness_penalty=30.0):
+        self.max_workers = max_workers
+        self.aging_rate = aging_rate
+        self.fairness_penalty = fairness_penalty
+        # user_id -> [(sort_key, seq, job)]
+        self._queues = {}
+        self._running = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._workers = []
+        self.stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'total_wait_seconds': 0.0,
+        }
+
+    def estimate_cost(self, video_info, llm_provider):
+        """
+        估算分析任务的成本（约等于处理耗时，单位秒）
+
+        Args:
+            video_info: VideoProcessor.get_video_info 返回的视频信息，获取失败时为None
+            llm_provider: LLM提供商
+
+        Returns:
+            cost: 估算成本
+        """
+        llm_cost = PROVIDER_LATENCY_SECONDS.get(llm_provider, DEFAULT_PROVIDER_LATENCY_SECONDS)
+        if not video_info:
+            return llm_cost
+
+        pixels = max(1, video_info.get('width', 0) * video_info.get('height', 0))
+        duration = max(0, video_info.get('duration', 0))
+        decode_cost = duration * (pixels / PIXELS_720P) * DECODE_SECONDS_PER_720P_SECOND
+        return decode_cost + llm_cost
+
+    def submit(self, task_id, user_id, cost, fn):
+        """
+        提交分析任务
+
+        Args:
+            task_id: 任务ID
+            user_id: 用户ID
+            cost: 估算成本
+            fn: 任务函数（在工作线程中无参调用）
+
+        Returns:
+            position: 提交后在队列中的大致位置（从1开始）
+        """
+        now = time.monotonic()
+        seq = next(self._seq)
+        job = AnalysisJob(task_id, user_id, cost, fn, now, seq, cost + self.aging_rate * now)
+
+        with self._cond:
+            heapq.heappush(self._queues.setdefault(user_id, []), (job.sort_key, seq, job))
+            self.stats['submitted'] += 1
+            self._ensure_workers()
+            self._cond.notify()
+            return self._position_locked(task_id)
+
+    def queue_position(self, task_id):
+        """
+        获取任务在队列中的大致位置
+
+        Args:
+            task_id: 任务ID
+
+        Returns:
+            position: 位置（从1开始），任务不在队列中时返回None
+        """
+        with self._cond:
+            return self._position_locked(task_id)
+
+    def queue_depth(self):
+        """
+        获取排队中的任务数量
+        """
+        with self._cond:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def get_stats(self):
+        """
+        获取调度器统计信息
+        """
+        with self._cond:
+            stats = dict(self.stats)
+            stats['queued'] = sum(len(queue) for queue in self._queues.values())
+            stats['running'] = sum(self._running.values())
+            stats['workers'] = len(self._workers)
+            finished = stats['completed'] + stats['failed']
+            stats['avg_wait_seconds'] = stats['total_wait_seconds'] / finished if finished else 0.0
+            return stats
+
+    def _position_locked(self, task_id):
+        """
+        按当前调度键估算任务位置（调用方需持有锁）
+        """
+        jobs = [entry[2] for queue in self._queues.values() for entry in queue]
+        target = next((job for job in jobs if job.task_id == task_id), None)
+        if target is None:
+            return None
+        target_key = self._effective_key(target)
+        return 1 + sum(1 for job in jobs if job is not target and self._effective_key(job) < target_key)
+
+    def _effective_key(self, job):
+        return job.sort_key + self.fairness_penalty * self._running.get(job.user_id, 0)
+
+    def _ensure_workers(self):
+        """
+        按需启动工作线程（调用方需持有锁）
+        """
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f"analysis-worker-{len(self._workers)}",
+                daemon=True
+            )
+            self._workers.append(worker)
+            worker.start()
+
+    def _pop_next(self):
+        """
+        从各用户队首中选出有效优先级最高的任务（调用方需持有锁）
+        """
+        best_user = None
+        best_key = None
+        for user_id, queue in self._queues.items():
+            key = self._effective_key(queue[0][2])
+            if best_key is None or key < best_key:
+                best_user, best_key = user_id, key
+
+        queue = self._queues[best_user]
+        _, _, job = heapq.heappop(queue)
+        if not queue:
+            del self._queues[best_user]
+        return job
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while not self._queues:
+                    self._cond.wait()
+                job = self._pop_next()
+                self._running[job.user_id] = self._running.get(job.user_id, 0) + 1
+                self.stats['total_wait_seconds'] += time.monotonic() - job.submitted_at
+
+            failed = False
+            try:
+                job.fn()
+            except Exception as e:
+                failed = True
+                print(f"Analysis job {job.task_id} failed: {str(e)}")
+            finally:
+                with self._cond:
+                    self._running[job.user_id] -= 1
+                    if not self._running[job.user_id]:
+                        del self._running[job.user_id]
+                    self.stats['failed' if failed else 'completed'] += 1
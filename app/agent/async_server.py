@@ -0,0 +1,327 @@
+"""
+异步LLM服务
+
+Flask 视图在 WSGI 线程里同步等待LLM，一个线程同一时间只能服务一个对话。本模块用
+aiohttp 提供聊天和学习计划接口的异步版本，LLM 调用走 ainvoke/astream，等待网络时
+不占用线程，单个进程即可同时保持数百个进行中的对话。
+
+与 Flask 应用共享 ChatManager 和 AgentMemory（同一进程内），接口路径和请求格式
+与 /api/agent 下的同名接口一致，可由反向代理把这些路径转发到本服务。
+
+用法：
+    python -m app.agent.async_server --port 5001
+    gunicorn app.agent.async_server:create_gunicorn_app --worker-class aiohttp.GunicornWebWorker
+"""
+import argparse
+import asyncio
+import json
+import math
+import time
+
+from aiohttp import web
+
+from app.agent.streaming import sse_event
+
+# 同时进行中的LLM调用上限
+DEFAULT_MAX_INFLIGHT = 500
+# 槽位已满时的最大排队数和排队超时（秒）
+DEFAULT_MAX_QUEUE = 1000
+DEFAULT_QUEUE_TIMEOUT = 10
+
+
+class AsyncAdmission:
+    """
+    异步端点的准入控制
+
+    与 AdmissionController 的语义一致：有空闲槽位立即放行，槽位已满时最多排队
+    queue_timeout 秒（超时返回503），队列已满立即返回429。
+    """
+
+    def __init__(self, max_inflight=DEFAULT_MAX_INFLIGHT, max_queue=DEFAULT_MAX_QUEUE,
+                 queue_timeout=DEFAULT_QUEUE_TIMEOUT):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_inflight)
+        self.active = 0
+        self.waiting = 0
+        self.avg_service_seconds = 1.0
+        self.stats = {'admitted': 0, 'shed_queue_full': 0, 'shed_timeout': 0}
+
+    async def acquire(self):
+        """
+        获取槽位
+
+        Returns:
+            started_at: 获取时间，释放时传回 release()
+
+        Raises:
+            web.HTTPException: 请求被拒绝（429/503）
+        """
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                self.stats['shed_queue_full'] += 1
+                raise self._rejection(web.HTTPTooManyRequests, 'Too many in-flight requests')
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.stats['shed_timeout'] += 1
+                raise self._rejection(web.HTTPServiceUnavailable, 'Timed out waiting for a slot')
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+
+        self.active += 1
+        self.stats['admitted'] += 1
+        return time.monotonic()
+
+    def release(self, started_at):
+        """
+        释放槽位并更新平均占用时长
+        """
+        self.active -= 1
+        self._semaphore.release()
+        elapsed = time.monotonic() - started_at
+        self.avg_service_seconds = 0.8 * self.avg_service_seconds + 0.2 * elapsed
+
+    def get_stats(self):
+        return dict(
+            self.stats,
+            active=self.active,
+            waiting=self.waiting,
+            max_inflight=self.max_inflight,
+            avg_service_seconds=round(self.avg_service_seconds, 3),
+        )
+
+    def _rejection(self, error_cls, reason):
+        # 按平均占用时长估算排到一个槽位的时间
+        backlog = self.waiting + 1
+        retry_after = max(1, math.ceil(self.avg_service_seconds * backlog / max(1, self.max_inflight)))
+        return error_cls(
+            text=json.dumps({'error': reason, 'retry_after': retry_after}),
+            content_type='application/json',
+            headers={'Retry-After': str(retry_after)},
+        )
+
+
+def _json_error(message, status):
+    return web.json_response({'error': message}, status=status)
+
+
+async def _read_json(request):
+    try:
+        data = await request.json()
+    except (ValueError, UnicodeDecodeError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _cache_requested(request, data):
+    """
+    与 Flask 接口相同：cache 为 false 或 Cache-Control: no-cache 时跳过回复缓存
+    """
+    if data.get('cache', True) is False:
+        return False
+    return 'no-cache' not in request.headers.get('Cache-Control', '').lower()
+
+
+def _resolve_chat_manager(data):
+    """
+    校验提供商并获取共享的 ChatManager
+
+    Returns:
+        (chat_manager, error_response)
+    """
+    from app.agent.routes import get_chat_manager, llm_manager
+
+    user_id = data.get('user_id', 'default')
+    llm_provider = data.get('llm_provider', 'openai')
+    llm_model = data.get('llm_model', None)
+    provider_error = llm_manager.check_provider(llm_provider)
+    if provider_error is not None:
+        status, message = provider_error
+        return None, _json_error(message, status)
+    return get_chat_manager(user_id, llm_provider, llm_model), None
+
+
+async def send_chat_message(request):
+    """
+    POST /api/agent/chat/message 的异步版本
+    """
+    data = await _read_json(request)
+    message = data.get('message', '')
+    user_id = data.get('user_id', 'default')
+    if not message:
+        return _json_error('No message provided', 400)
+
+    chat_manager, error = _resolve_chat_manager(data)
+    if error is not None:
+        return error
+
+    admission = request.app['admission']
+    started_at = await admission.acquire()
+    try:
+        response = await chat_manager.ahandle_message(message, user_id, use_cache=_cache_requested(request, data))
+    finally:
+        admission.release(started_at)
+
+    return web.json_response({'response': response, 'conversation_id': user_id})
+
+
+async def stream_chat_message(request):
+    """
+    POST /api/agent/chat/message/stream 的异步版本（SSE）
+    """
+    data = await _read_json(request)
+    message = data.get('message', '')
+    user_id = data.get('user_id', 'default')
+    if not message:
+        return _json_error('No message provided', 400)
+
+    chat_manager, error = _resolve_chat_manager(data)
+    if error is not None:
+        return error
+
+    admission = request.app['admission']
+    started_at = await admission.acquire()
+    chunks = chat_manager.astream_message(message, user_id, use_cache=_cache_requested(request, data))
+    pending = None
+    try:
+        response = web.StreamResponse(headers={
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+        })
+        await response.prepare(request)
+        await response.write(sse_event({}, event='start').encode('utf-8'))
+
+        keepalive_interval = request.app['sse_keepalive_seconds']
+        parts = []
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(chunks.__anext__())
+            # 不能用 wait_for：超时会取消正在等待的 __anext__ 并破坏生成器
+            done, _ = await asyncio.wait({pending}, timeout=keepalive_interval)
+            if not done:
+                await response.write(b': keep-alive\n\n')
+                continue
+
+            task, pending = pending, None
+            try:
+                chunk = task.result()
+            except StopAsyncIteration:
+                event = sse_event({'response': ''.join(parts)}, event='done')
+                await response.write(event.encode('utf-8'))
+                break
+            except Exception as e:
+                await response.write(sse_event({'error': str(e)}, event='error').encode('utf-8'))
+                break
+
+            parts.append(chunk)
+            await response.write(sse_event({'token': chunk}, event='token').encode('utf-8'))
+
+        await response.write_eof()
+        return response
+    finally:
+        # 客户端断开时写入会抛出 ConnectionResetError（或处理协程被取消），
+        # 关闭生成器后不会保存不完整的回复
+        if pending is not None:
+            # 先等待被取消的 __anext__ 结束，否则 aclose() 会因生成器仍在运行而失败
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+        await chunks.aclose()
+        admission.release(started_at)
+
+
+async def generate_learning_plan(request):
+    """
+    POST /api/agent/plan/generate 的异步版本
+    """
+    data = await _read_json(request)
+    user_id = data.get('user_id', 'default')
+    ski_type = data.get('ski_type', '双板')
+    skill_level = data.get('skill_level', '中级')
+    goals = data.get('goals', '提高技术水平')
+
+    chat_manager, error = _resolve_chat_manager(data)
+    if error is not None:
+        return error
+
+    admission = request.app['admission']
+    started_at = await admission.acquire()
+    try:
+        plan = await chat_manager.agenerate_learning_plan(
+            ski_type, skill_level, goals, user_id, use_cache=_cache_requested(request, data)
+        )
+    finally:
+        admission.release(started_at)
+
+    return web.json_response({'plan': plan})
+
+
+async def get_metrics(request):
+    """
+    GET /api/agent/async/metrics：异步服务的并发、排队和LLM限流统计
+    """
+    from app.agent.llm_router import llm_router
+
+    return web.json_response({
+        'admission': request.app['admission'].get_stats(),
+        'llm_rate_limiter': llm_router.limiter.get_stats(),
+    })
+
+
+def create_async_app(flask_app=None):
+    """
+    创建异步LLM服务
+
+    Args:
+        flask_app: Flask 应用（读取配置；默认用 create_app() 创建）
+
+    Returns:
+        app: aiohttp 应用
+    """
+    if flask_app is None:
+        from app import create_app
+        flask_app = create_app()
+
+    config = flask_app.config
+    app = web.Application()
+    app['flask_app'] = flask_app
+    app['sse_keepalive_seconds'] = config.get('SSE_KEEPALIVE_SECONDS', 15)
+
+    async def on_startup(app):
+        # Semaphore 需要在服务的事件循环中创建
+        app['admission'] = AsyncAdmission(
+            max_inflight=config.get('ASYNC_AGENT_MAX_INFLIGHT', DEFAULT_MAX_INFLIGHT),
+            max_queue=config.get('ASYNC_AGENT_MAX_QUEUE', DEFAULT_MAX_QUEUE),
+            queue_timeout=config.get('ASYNC_AGENT_QUEUE_TIMEOUT', DEFAULT_QUEUE_TIMEOUT),
+        )
+
+    app.on_startup.append(on_startup)
+    app.router.add_post('/api/agent/chat/message', send_chat_message)
+    app.router.add_post('/api/agent/chat/message/stream', stream_chat_message)
+    app.router.add_post('/api/agent/plan/generate', generate_learning_plan)
+    app.router.add_get('/api/agent/async/metrics', get_metrics)
+    return app
+
+
+async def create_gunicorn_app():
+    """
+    gunicorn aiohttp.GunicornWebWorker 使用的应用工厂
+    """
+    return create_async_app()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Async LLM server for agent chat and plans')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=5001, help='监听端口')
+    args = parser.parse_args()
+    web.run_app(create_async_app(), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,24 +1,45 @@
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableLambda
+from langchain_core.messages import SystemMessage
 from app.agent.llm_manager import llm_manager
+from app.agent.llm_router import llm_router
+from app.agent.agent_memory import message_tokens
+from app.agent.semantic_cache import is_context_free
+from app.agent.plan_library import build_plan_prompt, compose_personalized_plan
+from app.agent.token_utils import estimate_tokens
+import time
+
+# LLM不可用或调用失败时返回给用户的提示（不会写入缓存）
+LLM_UNAVAILABLE_MESSAGE = "抱歉，我暂时无法处理您的请求。请检查模型配置并稍后再试。"
+LLM_ERROR_MESSAGE = "抱歉，我暂时无法处理您的请求。请稍后再试。"
 
 class ChatManager:
-    def __init__(self, agent_memory, llm_provider='openai', llm_model=None):
+    def __init__(self, agent_memory, llm_provider='openai', llm_model=None, semantic_cache=None, prompt_cache=None,
+                 plan_library=None):
         self.agent_memory = agent_memory
+        # 通用问题的语义回复缓存（SemanticCache），为None时不使用
+        self.semantic_cache = semantic_cache
+        # LLM调用的精确匹配缓存（PromptCache），为None时不使用
+        self.prompt_cache = prompt_cache
+        # 预生成的学习计划模板库（PlanLibrary），为None时总是完整生成
+        self.plan_library = plan_library
         # 初始化大语言模型
         self.llm_provider = llm_provider
         self.llm_model = llm_model
         self.llm = self._init_llm()
         # 构建滑雪教练prompt
         self.prompt = self._build_ski_coach_prompt()
+        # 历史消息的token预算，系统提示词的token数只计算一次
+        self.history_token_budget = llm_manager.get_history_token_budget(llm_provider, llm_model)
+        self.system_prompt_tokens = estimate_tokens(self.prompt.messages[0].prompt.template)
     
     def _init_llm(self):
         """
         初始化LLM模型
         """
         try:
-            return llm_manager.get_llm(self.llm_provider, self.llm_model)
+            return llm_router.get_llm(self.llm_provider, self.llm_model)
         except Exception as e:
             # 如果初始化失败，返回None，使用模拟回复
             print(f"Failed to initialize LLM: {str(e)}")
@@ -54,41 +75,42 @@ class ChatManager:
                 "- 鼓励性，激发用户的学习热情\n"
                 "- 安全第一，强调滑雪安全的重要性\n"
             ),
+            MessagesPlaceholder(variable_name="pinned_context", optional=True),
             MessagesPlaceholder(variable_name="chat_history"),
             ("human", "{input}")
         ])
         
         return prompt
     
-    def handle_message(self, message, user_id):
+    def handle_message(self, message, user_id, use_cache=True):
         """
         处理用户消息
         
         Args:
             message: 用户消息
             user_id: 用户ID
+            use_cache: 是否使用缓存（请求可通过 cache:false 或 Cache-Control: no-cache 绕过）
             
         Returns:
             response: 助手回复
         """
-        # 获取用户的对话记忆
-        memory = self.agent_memory.get_memory(user_id)
-        
         # 检查LLM是否可用
         llm = self._get_llm()
         if not llm:
             # 如果LLM不可用，返回错误消息
-            response = "抱歉，我暂时无法处理您的请求。请检查模型配置并稍后再试。"
+            response = LLM_UNAVAILABLE_MESSAGE
+        elif use_cache and self._use_semantic_cache(message):
+            # 通用问题先查语义缓存，未命中时不带用户上下文生成，回复可供其他用户复用
+            response = self.semantic_cache.lookup(message, self._cache_namespace())
+            if response is None:
+                started_at = time.perf_counter()
+                served = []
+                chain = self._build_chain(llm, user_id, with_context=False, served=served)
+                response = self._generate_response(chain, message)
+                self._store_cached_response(message, response, time.perf_counter() - started_at, served)
         else:
             # 构建对话链
-            chain = (
-                RunnablePassthrough.assign(
-                    chat_history=lambda _: memory.chat_memory.messages
-                )
-                | self.prompt
-                | llm
-                | StrOutputParser()
-            )
+            chain = self._build_chain(llm, user_id, use_cache=use_cache)
             
             # 生成回复
             response = self._generate_response(chain, message)
@@ -99,39 +121,339 @@ class ChatManager:
         
         return response
     
-    def generate_learning_plan(self, ski_type, skill_level, goals, user_id):
+    def stream_message(self, message, user_id, use_cache=True):
+        """
+        流式处理用户消息，逐块返回助手回复
+        
+        完整生成后才把这一轮对话保存到记忆；如果调用方提前关闭生成器（客户端断开），
+        不保存不完整的回复。
+        
+        Args:
+            message: 用户消息
+            user_id: 用户ID
+            use_cache: 是否使用缓存（请求可通过 cache:false 或 Cache-Control: no-cache 绕过）
+            
+        Returns:
+            chunks: 回复文本块生成器
+        """
+        llm = self._get_llm()
+        cacheable = bool(llm) and use_cache and self._use_semantic_cache(message)
+        cached = self.semantic_cache.lookup(message, self._cache_namespace()) if cacheable else None
+        if not llm:
+            response = LLM_UNAVAILABLE_MESSAGE
+            yield response
+        elif cached is not None:
+            response = cached
+            yield response
+        else:
+            served = []
+            chain = self._build_chain(llm, user_id, with_context=not cacheable, use_cache=use_cache, served=served)
+            started_at = time.perf_counter()
+            chunks = []
+            try:
+                for chunk in chain.stream({"input": message}):
+                    if not chunk:
+                        continue
+                    chunks.append(chunk)
+                    yield chunk
+            except Exception as e:
+                print(f"Failed to stream response: {str(e)}")
+                # 已经输出了部分内容时无法再替换为错误提示，交给调用方处理
+                if chunks:
+                    raise
+                chunks = [LLM_ERROR_MESSAGE]
+                yield chunks[0]
+            response = ''.join(chunks)
+            if cacheable:
+                self._store_cached_response(message, response, time.perf_counter() - started_at, served)
+        
+        # 保存对话到记忆
+        self.agent_memory.add_message(user_id, "user", message)
+        self.agent_memory.add_message(user_id, "assistant", response)
+    
+    async def ahandle_message(self, message, user_id, use_cache=True):
+        """
+        异步处理用户消息（ainvoke），等待LLM期间不占用线程
+        
+        Args:
+            message: 用户消息
+            user_id: 用户ID
+            use_cache: 是否使用缓存（请求可通过 cache:false 或 Cache-Control: no-cache 绕过）
+            
+        Returns:
+            response: 助手回复
+        """
+        llm = self._get_llm()
+        if not llm:
+            response = LLM_UNAVAILABLE_MESSAGE
+        elif use_cache and self._use_semantic_cache(message):
+            response = self.semantic_cache.lookup(message, self._cache_namespace())
+            if response is None:
+                started_at = time.perf_counter()
+                served = []
+                chain = self._build_chain(llm, user_id, with_context=False, served=served)
+                response = await self._agenerate_response(chain, message)
+                self._store_cached_response(message, response, time.perf_counter() - started_at, served)
+        else:
+            chain = self._build_chain(llm, user_id, use_cache=use_cache)
+            response = await self._agenerate_response(chain, message)
+        
+        # 保存对话到记忆
+        self.agent_memory.add_message(user_id, "user", message)
+        self.agent_memory.add_message(user_id, "assistant", response)
+        
+        return response
+    
+    async def astream_message(self, message, user_id, use_cache=True):
+        """
+        异步流式处理用户消息（astream），语义与 stream_message 相同
+        
+        Args:
+            message: 用户消息
+            user_id: 用户ID
+            use_cache: 是否使用缓存（请求可通过 cache:false 或 Cache-Control: no-cache 绕过）
+            
+        Returns:
+            chunks: 回复文本块异步生成器
+        """
+        llm = self._get_llm()
+        cacheable = bool(llm) and use_cache and self._use_semantic_cache(message)
+        cached = self.semantic_cache.lookup(message, self._cache_namespace()) if cacheable else None
+        if not llm:
+            response = LLM_UNAVAILABLE_MESSAGE
+            yield response
+        elif cached is not None:
+            response = cached
+            yield response
+        else:
+            served = []
+            chain = self._build_chain(llm, user_id, with_context=not cacheable, use_cache=use_cache, served=served)
+            started_at = time.perf_counter()
+            chunks = []
+            try:
+                async for chunk in chain.astream({"input": message}):
+                    if not chunk:
+                        continue
+                    chunks.append(chunk)
+                    yield chunk
+            except Exception as e:
+                print(f"Failed to stream response: {str(e)}")
+                if chunks:
+                    raise
+                chunks = [LLM_ERROR_MESSAGE]
+                yield chunks[0]
+            response = ''.join(chunks)
+            if cacheable:
+                self._store_cached_response(message, response, time.perf_counter() - started_at, served)
+        
+        # 保存对话到记忆
+        self.agent_memory.add_message(user_id, "user", message)
+        self.agent_memory.add_message(user_id, "assistant", response)
+    
+    def generate_learning_plan(self, ski_type, skill_level, goals, user_id, use_cache=True):
         """
         生成学习计划
         
+        学习计划只由滑雪类型、水平和目标决定，不带用户的对话上下文生成，
+        相同输入在不同用户之间可以命中缓存。有预生成模板时，目标与模板类别完全一致
+        直接返回模板，否则只让LLM生成简短的个性化调整附加在模板后面。
+        
         Args:
             ski_type: 滑雪类型（单板/双板）
             skill_level: 当前技能水平
             goals: 学习目标
             user_id: 用户ID
+            use_cache: 是否使用缓存
             
         Returns:
             plan: 学习计划
         """
         # 构建学习计划prompt
-        plan_prompt = f"请为一位{skill_level}水平的{ski_type}滑雪者制定一个学习计划，目标是{goals}。\n\n"
-        plan_prompt += "学习计划应该包括：\n"
-        plan_prompt += "1. 短期目标（1-2周）\n"
-        plan_prompt += "2. 中期目标（1-2个月）\n"
-        plan_prompt += "3. 长期目标（3-6个月）\n"
-        plan_prompt += "4. 每周练习计划，包括具体的练习内容和时间安排\n"
-        plan_prompt += "5. 技术要点和注意事项\n"
-        plan_prompt += "6. 安全提示\n"
-        plan_prompt += "7. 装备建议（如适用）\n\n"
-        plan_prompt += "请根据滑雪者的水平和目标，制定详细、实用的学习计划。"
+        plan_prompt = build_plan_prompt(ski_type, skill_level, goals)
+        
+        template, personalize_prompt = self._match_plan_template(ski_type, skill_level, goals)
         
         # 生成学习计划
-        response = self.handle_message(plan_prompt, user_id)
+        llm = self._get_llm()
+        if llm:
+            # 学习计划排在交互聊天之后限流
+            llm = llm.with_priority('plan')
+        if template is not None and (personalize_prompt is None or not llm):
+            response = template
+        elif not llm:
+            response = LLM_UNAVAILABLE_MESSAGE
+        elif template is not None:
+            chain = self._build_chain(llm, user_id, with_context=False, use_cache=use_cache)
+            adjustments = self._generate_response(chain, personalize_prompt)
+            response = self._personalized_plan(template, adjustments)
+        else:
+            chain = self._build_chain(llm, user_id, with_context=False, use_cache=use_cache)
+            response = self._generate_response(chain, plan_prompt)
         
-        # 保存学习计划
+        # 保存对话和学习计划
+        self.agent_memory.add_message(user_id, "user", plan_prompt)
+        self.agent_memory.add_message(user_id, "assistant", response)
         self.agent_memory.save_learning_plan(user_id, response)
         
         return response
     
+    async def agenerate_learning_plan(self, ski_type, skill_level, goals, user_id, use_cache=True):
+        """
+        异步生成学习计划
+        
+        Args:
+            ski_type: 滑雪类型（单板/双板）
+            skill_level: 当前技能水平
+            goals: 学习目标
+            user_id: 用户ID
+            use_cache: 是否使用缓存
+            
+        Returns:
+            plan: 学习计划
+        """
+        plan_prompt = build_plan_prompt(ski_type, skill_level, goals)
+        template, personalize_prompt = self._match_plan_template(ski_type, skill_level, goals)
+        llm = self._get_llm()
+        if llm:
+            # 学习计划排在交互聊天之后限流
+            llm = llm.with_priority('plan')
+        if template is not None and (personalize_prompt is None or not llm):
+            response = template
+        elif not llm:
+            response = LLM_UNAVAILABLE_MESSAGE
+        elif template is not None:
+            chain = self._build_chain(llm, user_id, with_context=False, use_cache=use_cache)
+            adjustments = await self._agenerate_response(chain, personalize_prompt)
+            response = self._personalized_plan(template, adjustments)
+        else:
+            chain = self._build_chain(llm, user_id, with_context=False, use_cache=use_cache)
+            response = await self._agenerate_response(chain, plan_prompt)
+        
+        self.agent_memory.add_message(user_id, "user", plan_prompt)
+        self.agent_memory.add_message(user_id, "assistant", response)
+        self.agent_memory.save_learning_plan(user_id, response)
+        return response
+    
+    def _match_plan_template(self, ski_type, skill_level, goals):
+        """
+        查找预生成的学习计划模板
+        
+        Returns:
+            (template, personalize_prompt): 见 PlanLibrary.match
+        """
+        if self.plan_library is None:
+            return None, None
+        return self.plan_library.match(ski_type, skill_level, goals)
+    
+    def _personalized_plan(self, template, adjustments):
+        """
+        组合模板和个性化调整；调整生成失败时只返回模板
+        """
+        if adjustments in (LLM_UNAVAILABLE_MESSAGE, LLM_ERROR_MESSAGE):
+            return template
+        return compose_personalized_plan(template, adjustments)
+    
+    def _build_chain(self, llm, user_id, with_context=True, use_cache=True, served=None):
+        """
+        构建带用户对话历史的对话链
+        
+        Args:
+            llm: 大语言模型对象
+            user_id: 用户ID
+            with_context: 是否放入用户的摘要、学习计划和对话历史
+            use_cache: 是否使用精确匹配缓存
+            served: 可选的列表，记录实际生成回复的 (提供商, 模型)
+            
+        Returns:
+            chain: 对话链
+        """
+        if served is not None and hasattr(llm, 'with_listener'):
+            llm = llm.with_listener(served.append)
+        if with_context:
+            select_context = lambda inputs: self._select_context(user_id, inputs["input"])
+        else:
+            select_context = lambda inputs: {"pinned_context": [], "chat_history": []}
+        
+        generate = llm | StrOutputParser()
+        if self.prompt_cache is not None:
+            if use_cache:
+                generate = self.prompt_cache.wrap(
+                    llm,
+                    provider=self.llm_provider,
+                    model=getattr(llm, 'model_name', None) or self.llm_model,
+                    temperature=getattr(llm, 'temperature', None)
+                )
+            else:
+                self.prompt_cache.record_bypass()
+        
+        return (
+            RunnableLambda(
+                lambda inputs: {**inputs, **select_context(inputs)}
+            )
+            | self.prompt
+            | generate
+        )
+    
+    def _select_context(self, user_id, message):
+        """
+        选择放入prompt的上下文：对话摘要 + 固定的学习计划 + 预算内的最近对话
+        
+        系统提示词、对话摘要、最新的学习计划和当前输入总是保留，剩余预算用于摘要之后的最近对话轮次。
+        
+        Args:
+            user_id: 用户ID
+            message: 当前用户消息
+            
+        Returns:
+            context: {"pinned_context": 消息列表, "chat_history": 消息列表}
+        """
+        session_history = self.agent_memory.get_session_history(user_id)
+        budget = self.history_token_budget - self.system_prompt_tokens - estimate_tokens(message)
+        
+        pinned = []
+        plan = self.agent_memory.get_learning_plan(user_id)
+        if plan:
+            pinned.append(SystemMessage(content=f"用户当前的学习计划：\n{plan['plan']}"))
+            budget -= message_tokens(pinned[-1])
+        
+        # 已被摘要覆盖的较早对话用摘要代替原文
+        summary = self.agent_memory.get_summary(user_id)
+        covered_until = 0
+        if summary:
+            summary_message = SystemMessage(content=f"此前对话摘要：\n{summary['text']}")
+            pinned.insert(0, summary_message)
+            budget -= message_tokens(summary_message)
+            covered_until = summary['covered_until']
+        
+        history = session_history.get_window(max(0, budget), start=covered_until)
+        # 学习计划仍在窗口内时不重复放入
+        if plan and any(item.content == plan['plan'] for item in history):
+            pinned = [item for item in pinned if not item.content.startswith("用户当前的学习计划")]
+        return {"pinned_context": pinned, "chat_history": history}
+    
+    def _use_semantic_cache(self, message):
+        """
+        判断消息是否走语义缓存（已配置缓存且消息为通用问题）
+        """
+        return self.semantic_cache is not None and is_context_free(message)
+    
+    def _cache_namespace(self):
+        """
+        语义缓存的命名空间：不同模型的回复互不复用
+        """
+        return f"{self.llm_provider}:{self.llm_model or 'default'}"
+    
+    def _store_cached_response(self, message, response, latency, served=()):
+        """
+        缓存通用问题的回复；失败提示，以及故障切换到备用模型生成的回复不缓存
+        """
+        if not response or response in (LLM_UNAVAILABLE_MESSAGE, LLM_ERROR_MESSAGE):
+            return
+        route_key = getattr(self.llm, 'route_key', None)
+        if route_key is not None and any(served_key != route_key for served_key in served):
+            return
+        self.semantic_cache.store(message, response, latency, self._cache_namespace())
+    
     def _get_llm(self):
         """
         获取大语言模型
@@ -142,7 +464,7 @@ class ChatManager:
         if not self.llm:
             # 如果LLM未初始化，尝试重新初始化
             try:
-                self.llm = llm_manager.get_llm(self.llm_provider, self.llm_model)
+                self.llm = llm_router.get_llm(self.llm_provider, self.llm_model)
             except Exception as e:
                 print(f"Failed to initialize LLM: {str(e)}")
                 # 如果初始化失败，返回None
@@ -168,7 +490,24 @@ class ChatManager:
         except Exception as e:
             print(f"Failed to generate response: {str(e)}")
             # 如果LLM调用失败，返回错误消息
-            return "抱歉，我暂时无法处理您的请求。请稍后再试。"
+            return LLM_ERROR_MESSAGE
+    
+    async def _agenerate_response(self, chain, message):
+        """
+        异步生成回复
+        
+        Args:
+            chain: 对话链
+            message: 用户消息
+            
+        Returns:
+            response: 助手回复
+        """
+        try:
+            return await chain.ainvoke({"input": message})
+        except Exception as e:
+            print(f"Failed to generate response: {str(e)}")
+            return LLM_ERROR_MESSAGE
     
     def analyze_video(self, video_path, ski_type, skill_level, user_id):
         """
@@ -202,18 +541,8 @@ class ChatManager:
         
         # 使用LLM生成分析结果
         try:
-            # 获取用户的对话记忆
-            memory = self.agent_memory.get_memory(user_id)
-            
             # 构建对话链
-            chain = (
-                RunnablePassthrough.assign(
-                    chat_history=lambda _: memory.chat_memory.messages
-                )
-                | self.prompt
-                | self._get_llm()
-                | StrOutputParser()
-            )
+            chain = self._build_chain(self._get_llm(), user_id)
             
             # 生成分析结果
             analysis_text = self._generate_response(chain, video_analysis_prompt)
@@ -0,0 +1,170 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# dHash 的尺寸：9×8 灰度图，比较水平相邻像素得到 8×8=64 位
+HASH_SIZE = 8
+# pHash 的尺寸：32×32 灰度图做 DCT，取左上角 8×8 低频系数
+PHASH_SIZE = 32
+PHASH_LOW_FREQ = 8
+# 把64位哈希分为8段，每段8位；汉明距离不超过7的两个哈希至少有一段完全相同（抽屉原理）
+BAND_COUNT = 8
+BAND_BITS = 64 // BAND_COUNT
+BAND_MASK = (1 << BAND_BITS) - 1
+
+def dhash(image):
+    """
+    计算图像的差值哈希（dHash）
+
+    Args:
+        image: BGR图像
+
+    Returns:
+        hash_value: 64位整数哈希
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def phash(image):
+    """
+    计算图像的感知哈希（pHash），比 dHash 更能区分背景相同、前景不同的帧
+
+    Args:
+        image: BGR图像
+
+    Returns:
+        hash_value: 64位整数哈希
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (PHASH_SIZE, PHASH_SIZE), interpolation=cv2.INTER_AREA)
+    low = cv2.dct(np.float32(small))[:PHASH_LOW_FREQ, :PHASH_LOW_FREQ]
+    # 直流分量只反映整体亮度，不参与计算中位数
+    bits = (low > np.median(low.flatten()[1:])).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distance(a, b):
+    """
+    计算两个哈希之间的汉明距离
+    """
+    return bin(a ^ b).count('1')
+
+
+class PoseHashIndex:
+    """
+    帧感知哈希 -> 姿态结果 索引
+
+    近似重复的视频（裁剪后重新上传、同一段滑行导出两次等）整体内容哈希不同，
+    但大部分帧几乎一致。对每帧计算 dHash 作为索引键，汉明距离在 max_distance 内、
+    且 32×32 pHash 的汉明距离在 confirm_distance 内的帧直接复用已有的关键点和角度，
+    无需再次运行 MediaPipe。9×8 的 dHash 主要由雪坡背景决定，单独使用会把不同动作的
+    帧当成重复帧，因此必须经过 pHash 确认；命名空间由调用方按用户隔离。
+
+    按8段分桶做候选筛选，查询只比较至少有一段相同的哈希；超过容量时按LRU淘汰。
+    """
+
+    def __init__(self, max_distance=0, confirm_distance=2, max_entries=50000):
+        if max_distance >= BAND_COUNT:
+            raise ValueError(f'max_distance must be less than {BAND_COUNT}')
+        self.max_distance = max_distance
+        self.confirm_distance = confirm_distance
+        self.max_entries = max_entries
+        # (命名空间, 哈希) -> (确认哈希, 姿态结果)
+        self._entries = OrderedDict()
+        # (命名空间, 段序号, 段值) -> 哈希集合
+        self._bands = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def lookup(self, hash_value, confirm_hash, namespace='default'):
+        """
+        查找与给定哈希足够接近的帧的姿态结果
+
+        Args:
+            hash_value: 帧的 dHash
+            confirm_hash: 帧的 pHash
+            namespace: 命名空间（不同用户、不同姿态模型的结果互不复用）
+
+        Returns:
+            result: 姿态结果；没有足够接近的帧时返回None
+        """
+        with self._lock:
+            best_key = None
+            best_distance = None
+            seen = set()
+            for band_key in self._band_keys(hash_value, namespace):
+                for candidate in self._bands.get(band_key, ()):
+                    if candidate in seen:
+                        continue
+                    seen.add(candidate)
+                    distance = hamming_distance(hash_value, candidate)
+                    if distance > self.max_distance:
+                        continue
+                    confirm_distance = hamming_distance(confirm_hash, self._entries[(namespace, candidate)][0])
+                    if confirm_distance > self.confirm_distance:
+                        continue
+                    distance += confirm_distance
+                    if best_distance is None or distance < best_distance:
+                        best_key, best_distance = (namespace, candidate), distance
+
+            if best_key is None:
+                self.stats['misses'] += 1
+                return None
+
+            self._entries.move_to_end(best_key)
+            self.stats['hits'] += 1
+            return self._entries[best_key][1]
+
+    def add(self, hash_value, confirm_hash, result, namespace='default'):
+        """
+        保存帧的姿态结果
+
+        Args:
+            hash_value: 帧的 dHash
+            confirm_hash: 帧的 pHash
+            result: 姿态结果（landmarks、angles）
+            namespace: 命名空间
+        """
+        with self._lock:
+            key = (namespace, hash_value)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._entries[key] = (confirm_hash, result)
+                return
+
+            self._entries[key] = (confirm_hash, result)
+            for band_key in self._band_keys(hash_value, namespace):
+                self._bands.setdefault(band_key, set()).add(hash_value)
+
+            while len(self._entries) > self.max_entries:
+                (old_namespace, old_hash), _ = self._entries.popitem(last=False)
+                for band_key in self._band_keys(old_hash, old_namespace):
+                    bucket = self._bands.get(band_key)
+                    if bucket is not None:
+                        bucket.discard(old_hash)
+                        if not bucket:
+                            del self._bands[band_key]
+                self.stats['evictions'] += 1
+
+    def get_stats(self):
+        """
+        获取索引统计信息
+        """
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return dict(
+                self.stats,
+                size=len(self._entries),
+                hit_rate=self.stats['hits'] / lookups if lookups else 0.0,
+            )
+
+    def _band_keys(self, hash_value, namespace):
+        return [
+            (namespace, band, (hash_value >> (band * BAND_BITS)) & BAND_MASK)
+            for band in range(BAND_COUNT)
+        ]
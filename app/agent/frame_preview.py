@@ -0,0 +1,225 @@
+import cv2
+import hashlib
+import json
+import math
+import os
+import threading
+
+import numpy as np
+
+
+class FramePreviewCache:
+    """
+    分析帧预览缓存
+
+    将 task_info['frames'] 中的原始帧（服务器临时文件）缩放为小尺寸的
+    WebP/JPEG 预览图，并缓存到磁盘，同一预览只解码、编码一次。
+    """
+
+    # 支持的输出格式：格式名 -> (扩展名, mimetype, 编码参数)
+    FORMATS = {
+        'webp': ('.webp', 'image/webp', [cv2.IMWRITE_WEBP_QUALITY, 75]),
+        'jpeg': ('.jpg', 'image/jpeg', [cv2.IMWRITE_JPEG_QUALITY, 80]),
+    }
+
+    def __init__(self, cache_dir, thumb_width=320, sprite_tile_width=160, sprite_columns=10):
+        self.cache_dir = cache_dir
+        self.thumb_width = thumb_width
+        self.sprite_tile_width = sprite_tile_width
+        self.sprite_columns = sprite_columns
+        # 预览文件路径 -> ETag，避免每次请求都重新计算哈希
+        self._etags = {}
+        self._lock = threading.Lock()
+
+    def negotiate_format(self, accept_mimetypes, requested=None):
+        """
+        根据请求参数和Accept头选择输出格式
+
+        Args:
+            accept_mimetypes: 请求的Accept头（werkzeug MIMEAccept）
+            requested: 显式指定的格式（webp/jpeg）
+
+        Returns:
+            fmt: 输出格式
+        """
+        webp_supported = cv2.haveImageWriter('.webp')
+        if requested in self.FORMATS:
+            if requested == 'webp' and not webp_supported:
+                return 'jpeg'
+            return requested
+        if webp_supported and accept_mimetypes.quality('image/webp') > 0:
+            return 'webp'
+        return 'jpeg'
+
+    def get_frame_preview(self, task_id, frames, index, fmt='jpeg'):
+        """
+        获取单帧预览图
+
+        Args:
+            task_id: 任务ID
+            frames: 帧路径列表
+            index: 帧序号
+            fmt: 输出格式（webp/jpeg）
+
+        Returns:
+            preview: (图片字节, mimetype, ETag)；帧不存在时返回None
+        """
+        if index < 0 or index >= len(frames):
+            return None
+
+        ext, mimetype, _ = self.FORMATS[fmt]
+        cache_path = os.path.join(self._task_dir(task_id), f"frame_{index}_{self.thumb_width}{ext}")
+
+        def render():
+            image = cv2.imread(frames[index])
+            if image is None:
+                return None
+            return self._resize(image, self.thumb_width)
+
+        return self._get_or_render(cache_path, render, fmt, mimetype)
+
+    def get_sprite_sheet(self, task_id, frames, fmt='jpeg'):
+        """
+        获取所有帧拼接而成的雪碧图
+
+        Args:
+            task_id: 任务ID
+            frames: 帧路径列表
+            fmt: 输出格式（webp/jpeg）
+
+        Returns:
+            sprite: (图片字节, mimetype, ETag, 布局信息)；没有可用帧时返回None
+        """
+        if not frames:
+            return None
+
+        ext, mimetype, _ = self.FORMATS[fmt]
+        cache_path = os.path.join(
+            self._task_dir(task_id),
+            f"sprite_{len(frames)}_{self.sprite_tile_width}{ext}"
+        )
+        layout_path = cache_path + '.json'
+
+        def render():
+            tiles = []
+            for frame_path in frames:
+                image = cv2.imread(frame_path)
+                if image is None:
+                    continue
+                tiles.append(self._resize(image, self.sprite_tile_width))
+            if not tiles:
+                return None
+
+            # 所有格子使用第一帧的尺寸，保证客户端可以按固定步长定位
+            tile_height, tile_width = tiles[0].shape[:2]
+            columns = min(self.sprite_columns, len(tiles))
+            rows = int(math.ceil(len(tiles) / columns))
+            sheet = np.zeros((rows * tile_height, columns * tile_width, 3), dtype=np.uint8)
+            for i, tile in enumerate(tiles):
+                if tile.shape[:2] != (tile_height, tile_width):
+                    tile = cv2.resize(tile, (tile_width, tile_height), interpolation=cv2.INTER_AREA)
+                row, col = divmod(i, columns)
+                sheet[row * tile_height:(row + 1) * tile_height, col * tile_width:(col + 1) * tile_width] = tile
+
+            layout = {
+                'count': len(tiles),
+                'columns': columns,
+                'rows': rows,
+                'tile_width': tile_width,
+                'tile_height': tile_height,
+            }
+            os.makedirs(os.path.dirname(layout_path), exist_ok=True)
+            with open(layout_path, 'w', encoding='utf-8') as f:
+                json.dump(layout, f)
+            return sheet
+
+        result = self._get_or_render(cache_path, render, fmt, mimetype)
+        if result is None:
+            return None
+
+        data, mimetype, etag = result
+        with open(layout_path, 'r', encoding='utf-8') as f:
+            layout = json.load(f)
+        return data, mimetype, etag, layout
+
+    def _get_or_render(self, cache_path, render, fmt, mimetype):
+        """
+        读取缓存的预览图，不存在时渲染并写入缓存
+
+        Args:
+            cache_path: 缓存文件路径
+            render: 渲染函数，返回BGR图像或None
+            fmt: 输出格式
+            mimetype: 输出格式对应的mimetype
+
+        Returns:
+            preview: (图片字节, mimetype, ETag)；渲染失败时返回None
+        """
+        if os.path.exists(cache_path):
+            with open(cache_path, 'rb') as f:
+                data = f.read()
+        else:
+            image = render()
+            if image is None:
+                return None
+            data = self._encode(image, fmt)
+            if data is None:
+                return None
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            # 先写临时文件再原子替换，避免并发请求读到写了一半的文件
+            tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, cache_path)
+
+        with self._lock:
+            etag = self._etags.get(cache_path)
+            if etag is None:
+                etag = hashlib.sha256(data).hexdigest()[:32]
+                self._etags[cache_path] = etag
+
+        return data, mimetype, etag
+
+    def _encode(self, image, fmt):
+        """
+        编码图像
+        """
+        ext, _, params = self.FORMATS[fmt]
+        ok, buffer = cv2.imencode(ext, image, params)
+        return buffer.tobytes() if ok else None
+
+    def _resize(self, image, width):
+        """
+        按宽度等比缩放图像（不放大）
+        """
+        height, orig_width = image.shape[:2]
+        if orig_width <= width:
+            return image
+        new_height = max(1, int(round(height * width / orig_width)))
+        return cv2.resize(image, (width, new_height), interpolation=cv2.INTER_AREA)
+
+    def _task_dir(self, task_id):
+        return os.path.join(self.cache_dir, task_id)
+
+    def clear(self, task_id):
+        """
+        清理任务的预览缓存
+
+        Args:
+            task_id: 任务ID
+        """
+        task_dir = self._task_dir(task_id)
+        if not os.path.isdir(task_dir):
+            return
+        with self._lock:
+            for name in os.listdir(task_dir):
+                path = os.path.join(task_dir, name)
+                self._etags.pop(path, None)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        try:
+            os.rmdir(task_dir)
+        except OSError:
+            pass
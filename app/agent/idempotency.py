@@ -0,0 +1,209 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, jsonify, make_response, request
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+class _IdempotencyEntry:
+    __slots__ = ('fingerprint', 'created_at', 'done', 'response')
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.created_at = time.monotonic()
+        self.done = threading.Event()
+        # 完成后为 (状态码, 响应体, mimetype)；处理失败时保持None
+        self.response = None
+
+
+class IdempotencyStore:
+    """
+    幂等键响应存储
+
+    记录每个 Idempotency-Key 的请求指纹和响应，短时间内的重复请求直接返回原始响应，
+    原始请求仍在处理时则等待其完成。数据保存在进程内存中，多进程部署时每个进程各自独立。
+    """
+
+    # begin() 的返回状态
+    NEW = 'new'
+    REPLAY = 'replay'
+    IN_FLIGHT = 'in_flight'
+    MISMATCH = 'mismatch'
+
+    def __init__(self, ttl=3600, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'new': 0, 'replayed': 0, 'attached': 0, 'mismatched': 0}
+
+    def begin(self, scope, key, fingerprint):
+        """
+        登记一个幂等请求
+
+        Args:
+            scope: 作用域（通常为端点名）
+            key: 幂等键
+            fingerprint: 请求指纹，用于发现同一个键被用于不同的请求
+
+        Returns:
+            result: (状态, 条目)，状态为 NEW/REPLAY/IN_FLIGHT/MISMATCH
+        """
+        with self._lock:
+            self._purge_expired()
+            entry = self._entries.get((scope, key))
+            if entry is None:
+                entry = _IdempotencyEntry(fingerprint)
+                self._entries[(scope, key)] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                self.stats['new'] += 1
+                return self.NEW, entry
+
+            if entry.fingerprint != fingerprint:
+                self.stats['mismatched'] += 1
+                return self.MISMATCH, entry
+            if entry.done.is_set():
+                self.stats['replayed'] += 1
+                return self.REPLAY, entry
+            self.stats['attached'] += 1
+            return self.IN_FLIGHT, entry
+
+    def complete(self, entry, status_code, body, mimetype):
+        """
+        保存请求的响应并唤醒等待中的重复请求
+
+        Args:
+            entry: begin() 返回的条目
+            status_code: 响应状态码
+            body: 响应体
+            mimetype: 响应类型
+        """
+        entry.response = (status_code, body, mimetype)
+        entry.done.set()
+
+    def abandon(self, scope, key, entry):
+        """
+        放弃一个幂等请求（处理失败），允许客户端使用同一个键重试
+
+        Args:
+            scope: 作用域
+            key: 幂等键
+            entry: begin() 返回的条目
+        """
+        with self._lock:
+            if self._entries.get((scope, key)) is entry:
+                del self._entries[(scope, key)]
+        entry.done.set()
+
+    def size(self):
+        """
+        获取当前保存的条目数量
+        """
+        with self._lock:
+            return len(self._entries)
+
+    def _purge_expired(self):
+        """
+        清理过期条目（调用方需持有锁）
+        """
+        deadline = time.monotonic() - self.ttl
+        while self._entries:
+            scope_key, entry = next(iter(self._entries.items()))
+            if entry.created_at >= deadline:
+                break
+            del self._entries[scope_key]
+
+
+def request_fingerprint():
+    """
+    计算当前请求的指纹
+
+    multipart 请求只使用表单字段、文件名和请求长度，避免把整个视频读入内存；
+    其余请求使用完整请求体的哈希。
+
+    Returns:
+        fingerprint: 请求指纹
+    """
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(request.path.encode())
+    if request.mimetype == 'multipart/form-data':
+        for name, value in sorted(request.form.items(multi=True)):
+            digest.update(f"{name}={value}\n".encode())
+        for name, file in sorted(request.files.items(multi=True), key=lambda item: item[0]):
+            digest.update(f"{name}:{file.filename}\n".encode())
+        digest.update(str(request.content_length or 0).encode())
+    else:
+        digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def idempotent(store, wait_timeout=30):
+    """
+    为视图函数添加 Idempotency-Key 支持的装饰器
+
+    - 未携带幂等键：正常处理
+    - 首次出现的键：正常处理，2xx 响应会被保存
+    - 重复的键：返回保存的响应（附带 Idempotent-Replayed 响应头）
+    - 原始请求仍在处理：最多等待 wait_timeout 秒，超时返回409
+    - 同一个键用于不同的请求：返回422
+
+    Args:
+        store: IdempotencyStore实例
+        wait_timeout: 等待进行中请求的最长时间（秒）
+
+    Returns:
+        decorator: 装饰器
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return view(*args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return jsonify({'error': f'{IDEMPOTENCY_HEADER} is too long'}), 400
+
+            scope = request.endpoint
+            state, entry = store.begin(scope, key, request_fingerprint())
+
+            if state == IdempotencyStore.MISMATCH:
+                return jsonify({'error': f'{IDEMPOTENCY_HEADER} was already used for a different request'}), 422
+
+            if state == IdempotencyStore.IN_FLIGHT:
+                entry.done.wait(wait_timeout)
+                if entry.response is None:
+                    response = jsonify({'error': 'Original request is still in progress'})
+                    response.status_code = 409
+                    response.headers['Retry-After'] = '1'
+                    return response
+                state = IdempotencyStore.REPLAY
+
+            if state == IdempotencyStore.REPLAY:
+                status_code, body, mimetype = entry.response
+                response = Response(body, status=status_code, mimetype=mimetype)
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response
+
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                store.abandon(scope, key, entry)
+                raise
+
+            # 只保存成功的响应，失败的请求允许用同一个键重试
+            if 200 <= response.status_code < 300 and not response.is_streamed:
+                store.complete(entry, response.status_code, response.get_data(), response.mimetype)
+            else:
+                store.abandon(scope, key, entry)
+            return response
+
+        return wrapper
+
+    return decorator
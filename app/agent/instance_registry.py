@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class InstanceRegistry:
+    """
+    有上限的实例注册表
+
+    按键缓存可复用的实例（如每个 提供商/模型 一个 ChatManager）。超过 max_size 时淘汰
+    最久未使用的实例，空闲超过 idle_ttl 秒的实例在下次访问注册表时淘汰。线程安全。
+    """
+
+    def __init__(self, max_size=64, idle_ttl=3600, on_evict=None):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.on_evict = on_evict
+        # 键 -> (实例, 最近使用时间)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'created': 0, 'evicted_lru': 0, 'evicted_idle': 0}
+
+    def get_or_create(self, key, factory):
+        """
+        获取实例，不存在时调用 factory 创建
+
+        Args:
+            key: 实例键
+            factory: 无参数的创建函数
+
+        Returns:
+            instance: 实例
+        """
+        now = time.monotonic()
+        with self._lock:
+            evicted = self._evict_idle(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (entry[0], now)
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                self._notify(evicted)
+                return entry[0]
+        self._notify(evicted)
+
+        # 在锁外创建，避免慢的初始化阻塞其他键；并发创建同一个键时保留先写入的实例
+        instance = factory()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[0]
+            self._entries[key] = (instance, now)
+            self.stats['created'] += 1
+            evicted = []
+            while len(self._entries) > self.max_size:
+                evicted.append(self._entries.popitem(last=False)[1][0])
+                self.stats['evicted_lru'] += 1
+        self._notify(evicted)
+        return instance
+
+    def configure(self, max_size=None, idle_ttl=None):
+        """
+        更新容量和空闲淘汰时间
+        """
+        with self._lock:
+            if max_size is not None:
+                self.max_size = max_size
+            if idle_ttl is not None:
+                self.idle_ttl = idle_ttl
+
+    def clear(self):
+        with self._lock:
+            evicted = [instance for instance, _ in self._entries.values()]
+            self._entries.clear()
+        self._notify(evicted)
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, size=len(self._entries), max_size=self.max_size, idle_ttl=self.idle_ttl)
+
+    def _evict_idle(self, now):
+        # 按最近使用时间排序，从最旧的一端开始检查
+        evicted = []
+        if not self.idle_ttl:
+            return evicted
+        while self._entries:
+            key, (instance, last_used) = next(iter(self._entries.items()))
+            if now - last_used < self.idle_ttl:
+                break
+            del self._entries[key]
+            evicted.append(instance)
+            self.stats['evicted_idle'] += 1
+        return evicted
+
+    def _notify(self, evicted):
+        if self.on_evict is None:
+            return
+        for instance in evicted:
+            try:
+                self.on_evict(instance)
+            except Exception as e:
+                print(f"Failed to release evicted instance: {str(e)}")
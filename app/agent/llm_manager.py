@@ -1,6 +1,16 @@
 from langchain_openai import ChatOpenAI
 import os
+import threading
+from urllib.parse import urlsplit
 from dotenv import load_dotenv
+import httpx
+
+# HTTP/2 需要安装 h2，未安装时使用 HTTP/1.1
+try:
+    import h2  # noqa: F401
+    has_http2 = True
+except ImportError:
+    has_http2 = False
 
 # 尝试导入Google模型
 ChatGooglePalm = None
@@ -15,6 +25,164 @@ except ImportError:
 # 加载环境变量
 load_dotenv()
 
+# 每次对话放入prompt的历史消息token预算（按模型的上下文长度和成本设置）
+HISTORY_TOKEN_BUDGETS = {
+    'gpt-3.5-turbo': 3000,
+    'gpt-4': 4000,
+    'gpt-4-turbo': 8000,
+    'gemini-pro': 6000,
+    'qwen3.5-flash-2026-02-23': 8000,
+    'qwen3.5-27b': 6000,
+    'qwen-max': 6000,
+}
+
+# 各提供商未指定模型时使用的默认模型
+DEFAULT_MODELS = {
+    'openai': 'gpt-3.5-turbo',
+    'google': 'gemini-pro',
+    'qianwen': 'qwen3.5-flash-2026-02-23',
+}
+
+DEFAULT_HISTORY_TOKEN_BUDGET = 4000
+
+OPENAI_DEFAULT_BASE = 'https://api.openai.com/v1'
+DASHSCOPE_DEFAULT_BASE = 'https://dashscope.aliyuncs.com/compatible-mode/v1'
+
+
+class HTTPClientPool:
+    """
+    按服务地址共享的 HTTP 连接池
+
+    同一服务地址（scheme://host:port）的所有 LLM 客户端共用一个 httpx.Client 和
+    一个 httpx.AsyncClient，复用 keep-alive 连接和 TLS 会话；安装了 h2 时启用 HTTP/2。
+    通过 httpcore 的 trace 扩展统计新建连接数，用于观察连接复用率。
+    """
+
+    def __init__(self, max_connections=100, max_keepalive_connections=20, keepalive_expiry=60.0,
+                 connect_timeout=10.0, read_timeout=120.0, write_timeout=30.0, pool_timeout=10.0):
+        self._clients = {}
+        self._async_clients = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        self.configure(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            write_timeout=write_timeout,
+            pool_timeout=pool_timeout
+        )
+    
+    def configure(self, max_connections=100, max_keepalive_connections=20, keepalive_expiry=60.0,
+                  connect_timeout=10.0, read_timeout=120.0, write_timeout=30.0, pool_timeout=10.0):
+        """
+        设置连接池限制和超时（只影响之后新建的客户端）
+        """
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(
+            connect=connect_timeout, read=read_timeout, write=write_timeout, pool=pool_timeout
+        )
+
+    def get_client(self, base_url):
+        """
+        获取服务地址对应的共享同步客户端
+        """
+        origin = self._origin(base_url)
+        with self._lock:
+            client = self._clients.get(origin)
+            if client is None:
+                client = self._clients[origin] = httpx.Client(
+                    http2=has_http2,
+                    limits=self.limits,
+                    timeout=self.timeout,
+                    event_hooks={'request': [self._request_hook(origin)]}
+                )
+            return client
+
+    def get_async_client(self, base_url):
+        """
+        获取服务地址对应的共享异步客户端
+        """
+        origin = self._origin(base_url)
+        with self._lock:
+            client = self._async_clients.get(origin)
+            if client is None:
+                client = self._async_clients[origin] = httpx.AsyncClient(
+                    http2=has_http2,
+                    limits=self.limits,
+                    timeout=self.timeout,
+                    event_hooks={'request': [self._async_request_hook(origin)]}
+                )
+            return client
+
+    def get_stats(self):
+        """
+        获取各服务地址的连接统计
+
+        Returns:
+            stats: {服务地址: {requests, new_connections, tls_handshakes, reused, reuse_rate, http2}}
+        """
+        with self._lock:
+            result = {}
+            for origin, stats in self._stats.items():
+                reused = max(0, stats['requests'] - stats['new_connections'])
+                result[origin] = dict(
+                    stats,
+                    reused=reused,
+                    reuse_rate=reused / stats['requests'] if stats['requests'] else 0.0,
+                    http2=has_http2,
+                )
+            return result
+
+    def close(self):
+        """
+        关闭同步客户端（异步客户端随事件循环结束释放）
+        """
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+    def _origin(self, base_url):
+        parts = urlsplit(base_url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def _record(self, origin, event_name):
+        with self._lock:
+            stats = self._stats.setdefault(origin, {'requests': 0, 'new_connections': 0, 'tls_handshakes': 0})
+            if event_name == 'request':
+                stats['requests'] += 1
+            elif event_name == 'connection.connect_tcp.complete':
+                stats['new_connections'] += 1
+            elif event_name == 'connection.start_tls.complete':
+                stats['tls_handshakes'] += 1
+
+    def _request_hook(self, origin):
+        def trace(event_name, info):
+            self._record(origin, event_name)
+
+        def hook(request):
+            self._record(origin, 'request')
+            request.extensions['trace'] = trace
+
+        return hook
+
+    def _async_request_hook(self, origin):
+        async def trace(event_name, info):
+            self._record(origin, event_name)
+
+        async def hook(request):
+            self._record(origin, 'request')
+            request.extensions['trace'] = trace
+
+        return hook
+
 class LLMManager:
     def __init__(self):
         self.models = {
@@ -27,6 +195,8 @@ class LLMManager:
             self.models['google'] = self._init_google
             
         self.llm_instances = {}
+        # 所有 OpenAI 兼容客户端共享的连接池
+        self.http_pool = HTTPClientPool()
     
     def _init_openai(self, model_name='gpt-3.5-turbo'):
         """
@@ -36,10 +206,15 @@ class LLMManager:
         if not api_key:
             raise ValueError('OpenAI API key not found in environment variables')
         
+        api_base = os.getenv('OPENAI_BASE_URL') or OPENAI_DEFAULT_BASE
+        
         return ChatOpenAI(
             api_key=api_key,
             model_name=model_name,
-            temperature=0.7
+            base_url=api_base,
+            temperature=0.7,
+            http_client=self.http_pool.get_client(api_base),
+            http_async_client=self.http_pool.get_async_client(api_base)
         )
     
     def _init_google(self, model_name='gemini-pro'):
@@ -70,15 +245,34 @@ class LLMManager:
             raise ValueError('Aliyun Dashscope API key not found in environment variables')
         
         if not api_base:
-            api_base = 'https://dashscope.aliyuncs.com/compatible-mode/v1'
+            api_base = DASHSCOPE_DEFAULT_BASE
         
         return ChatOpenAI(
             api_key=api_key,
             model=model_name,
             base_url=api_base,
-            temperature=0.7
+            temperature=0.7,
+            http_client=self.http_pool.get_client(api_base),
+            http_async_client=self.http_pool.get_async_client(api_base)
         )
     
+    def check_provider(self, provider):
+        """
+        检查LLM提供商是否可用（Flask 和异步服务共用）
+        
+        Args:
+            provider: 模型提供商
+            
+        Returns:
+            error: 不可用时返回 (状态码, 错误信息)，否则返回None
+        """
+        if provider in self.models:
+            return None
+        # 特别处理千问模型的情况
+        if provider == 'qianwen':
+            return 400, 'Qianwen model is not available. Please use OpenAI model instead.'
+        return 400, f'Unsupported LLM provider: {provider}'
+    
     def get_llm(self, provider='openai', model_name=None):
         """
         获取LLM实例
@@ -102,12 +296,33 @@ class LLMManager:
             raise ValueError(f"Unsupported LLM provider: {provider}")
         
         try:
-            llm = self.models[provider](model_name)
+            # 未指定模型时使用各提供商的默认模型（传入None会覆盖初始化函数的默认值）
+            llm = self.models[provider](model_name or DEFAULT_MODELS[provider])
             self.llm_instances[cache_key] = llm
             return llm
         except Exception as e:
             raise RuntimeError(f"Failed to initialize LLM: {str(e)}")
     
+    def get_history_token_budget(self, provider='openai', model_name=None):
+        """
+        获取模型的历史消息token预算
+        
+        环境变量 HISTORY_TOKEN_BUDGET 可统一覆盖所有模型的预算。
+        
+        Args:
+            provider: 模型提供商
+            model_name: 模型名称
+            
+        Returns:
+            budget: token预算
+        """
+        override = os.getenv('HISTORY_TOKEN_BUDGET')
+        if override:
+            return int(override)
+        
+        model_name = model_name or DEFAULT_MODELS.get(provider)
+        return HISTORY_TOKEN_BUDGETS.get(model_name, DEFAULT_HISTORY_TOKEN_BUDGET)
+    
     def get_available_models(self):
         """
         获取可用的模型列表
@@ -0,0 +1,485 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+from langchain_core.runnables import Runnable
+
+from app.agent.llm_manager import DEFAULT_MODELS, llm_manager
+from app.agent.rate_limiter import DEFAULT_PRIORITY, LLMRateLimiter, RateLimitTimeout
+from app.agent.token_utils import estimate_tokens
+
+# 各提供商失败时依次尝试的备用提供商（使用备用提供商的默认模型）
+DEFAULT_FALLBACKS = {
+    'openai': ['qianwen', 'google'],
+    'qianwen': ['openai', 'google'],
+    'google': ['openai', 'qianwen'],
+}
+
+# 模型未设置 max_tokens 时按此估算一次调用的输出token数（用于token/分钟限流）
+DEFAULT_COMPLETION_TOKENS = 500
+
+
+class _ModelStats:
+    """
+    单个 提供商/模型 的滚动统计
+    """
+
+    def __init__(self, window):
+        # 最近成功调用的耗时（秒）
+        self.latencies = deque(maxlen=window)
+        # 最近调用的结果（True 成功 / False 失败）
+        self.outcomes = deque(maxlen=window)
+        # 熔断截止时间：错误率过高时在此之前跳过该模型
+        self.open_until = 0.0
+        self.counters = {'calls': 0, 'errors': 0, 'failovers': 0, 'hedges': 0, 'hedge_wins': 0}
+
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return 1.0 - sum(self.outcomes) / len(self.outcomes)
+
+    def percentile(self, q):
+        if not self.latencies:
+            return None
+        return float(np.percentile(np.fromiter(self.latencies, dtype=np.float64), q))
+
+
+class LLMRouter:
+    """
+    LLM 路由层
+
+    按 提供商/模型 记录最近调用的耗时和错误率：
+    - 调用失败时自动切换到备用提供商；错误率超过阈值的模型熔断 cooldown 秒，期间优先使用备用提供商
+    - 开启 hedge 后，非流式请求超过该模型 p95 耗时仍未返回时向备用提供商再发一个请求，采用先返回的结果
+    - 每次调用前经过 limiter 按 提供商/模型 限流；排队超时按调用失败处理，切换到备用提供商
+    """
+
+    def __init__(self, manager=None, fallbacks=None, window=100, error_rate_threshold=0.5, min_samples=5,
+                 cooldown=30.0, hedge_enabled=False, hedge_percentile=95, hedge_min_delay=2.0,
+                 hedge_min_samples=20, max_hedge_workers=32, limiter=None):
+        self.manager = manager or llm_manager
+        self.limiter = limiter or LLMRateLimiter()
+        self.fallbacks = dict(fallbacks or DEFAULT_FALLBACKS)
+        self.window = window
+        self.error_rate_threshold = error_rate_threshold
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.max_hedge_workers = max_hedge_workers
+        self._executor = None
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def configure(self, **options):
+        """
+        根据应用配置更新路由参数
+        """
+        for name, value in options.items():
+            if value is not None and hasattr(self, name):
+                setattr(self, name, dict(value) if name == 'fallbacks' else value)
+
+    def get_llm(self, provider='openai', model_name=None, priority=DEFAULT_PRIORITY):
+        """
+        获取带故障切换的LLM
+
+        Args:
+            provider: 首选提供商
+            model_name: 首选模型名称
+            priority: 限流排队的优先级（chat/plan/background）
+
+        Returns:
+            llm: RoutedLLM（接口与 ChatModel 相同的 Runnable）
+        """
+        if provider not in self.manager.models:
+            raise ValueError(f"Unsupported LLM provider: {provider}")
+        return RoutedLLM(self, provider, model_name, priority)
+
+    def candidates(self, provider, model_name):
+        """
+        按优先级列出可用的 (键, LLM实例)：首选模型在前，熔断中的模型排到最后
+
+        Returns:
+            candidates: [((provider, model), llm), ...]
+        """
+        routes = [(provider, model_name)]
+        routes += [(fallback, None) for fallback in self.fallbacks.get(provider, []) if fallback != provider]
+
+        healthy, tripped = [], []
+        now = time.monotonic()
+        for route_provider, route_model in routes:
+            if route_provider not in self.manager.models:
+                continue
+            try:
+                llm = self.manager.get_llm(route_provider, route_model)
+            except Exception:
+                # 未配置API密钥等情况跳过
+                continue
+            key = (route_provider, route_model or DEFAULT_MODELS.get(route_provider, 'default'))
+            with self._lock:
+                open_until = self._get_stats(key).open_until
+            (tripped if open_until > now else healthy).append((key, llm))
+        return healthy + tripped
+
+    def record(self, key, latency, ok):
+        """
+        记录一次调用结果
+        """
+        with self._lock:
+            stats = self._get_stats(key)
+            stats.counters['calls'] += 1
+            stats.outcomes.append(ok)
+            if ok:
+                stats.latencies.append(latency)
+            else:
+                stats.counters['errors'] += 1
+                if len(stats.outcomes) >= self.min_samples and stats.error_rate() >= self.error_rate_threshold:
+                    stats.open_until = time.monotonic() + self.cooldown
+
+    def count(self, key, counter):
+        with self._lock:
+            self._get_stats(key).counters[counter] += 1
+
+    def hedge_delay(self, key):
+        """
+        计算对冲请求的发出时间（秒）；未开启或样本不足时返回None
+        """
+        if not self.hedge_enabled:
+            return None
+        with self._lock:
+            stats = self._get_stats(key)
+            if len(stats.latencies) < self.hedge_min_samples:
+                return None
+            return max(self.hedge_min_delay, stats.percentile(self.hedge_percentile))
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_hedge_workers, thread_name_prefix='llm-hedge')
+            return self._executor
+
+    def get_stats(self):
+        """
+        获取各 提供商/模型 的统计信息
+        """
+        now = time.monotonic()
+        with self._lock:
+            return {
+                f"{provider}:{model}": dict(
+                    stats.counters,
+                    error_rate=round(stats.error_rate(), 4),
+                    latency_p50=stats.percentile(50),
+                    latency_p95=stats.percentile(95),
+                    circuit_open=stats.open_until > now,
+                )
+                for (provider, model), stats in self._stats.items()
+            }
+
+    def _get_stats(self, key):
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = _ModelStats(self.window)
+        return stats
+
+
+class RoutedLLM(Runnable):
+    """
+    带故障切换和对冲请求的LLM
+
+    invoke/ainvoke 失败时依次尝试备用提供商，并可发出对冲请求；stream/astream 只在
+    输出第一个片段之前切换，已经开始输出后出错直接抛出，不发对冲请求。
+
+    因此对冲只作用于非流式路径：ChatManager.handle_message/ahandle_message、学习计划
+    生成、视频评价和对话摘要（经过 PromptCache 时同样走 invoke/ainvoke）；SSE 流式聊天
+    （stream_message/astream_message）只做故障切换。
+    """
+
+    def __init__(self, router, provider, model_name=None, priority=DEFAULT_PRIORITY, listeners=()):
+        self.router = router
+        self.provider = provider
+        self.model_name = model_name or DEFAULT_MODELS.get(provider)
+        self.priority = priority
+        # 每次调用得到结果时以实际生成结果的 (提供商, 模型) 调用的回调
+        self.listeners = tuple(listeners)
+
+    @property
+    def route_key(self):
+        """
+        首选模型的 (提供商, 模型)
+        """
+        return self.provider, self.model_name or 'default'
+
+    def with_priority(self, priority):
+        """
+        返回使用另一限流优先级的同一LLM
+        """
+        return RoutedLLM(self.router, self.provider, self.model_name, priority, self.listeners)
+
+    def with_listener(self, listener):
+        """
+        返回增加了结果回调的同一LLM
+
+        缓存等调用方用它判断回复是否来自首选模型（发生故障切换或对冲胜出时为备用模型）。
+
+        Args:
+            listener: 回调函数，参数为实际生成结果的 (提供商, 模型)
+        """
+        return RoutedLLM(self.router, self.provider, self.model_name, self.priority, self.listeners + (listener,))
+
+    @property
+    def temperature(self):
+        candidates = self.router.candidates(self.provider, self.model_name)
+        return getattr(candidates[0][1], 'temperature', None) if candidates else None
+
+    def invoke(self, input, config=None, **kwargs):
+        candidates = self._candidates()
+        last_error = None
+        i = 0
+        while i < len(candidates):
+            key, llm = candidates[i]
+            if i > 0:
+                self.router.count(key, 'failovers')
+            hedge = candidates[i + 1] if i + 1 < len(candidates) else None
+            attempted = []
+            try:
+                return self._invoke_hedged((key, llm), hedge, input, config, kwargs, attempted)
+            except Exception as e:
+                print(f"LLM call failed on {key[0]}:{key[1]}: {str(e)}")
+                last_error = e
+            # 已发出的对冲请求也失败了，跳过该备用模型，不再把它作为下一个首选重试
+            i += max(1, len(attempted))
+        raise last_error
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        candidates = self._candidates()
+        last_error = None
+        i = 0
+        while i < len(candidates):
+            key, llm = candidates[i]
+            if i > 0:
+                self.router.count(key, 'failovers')
+            hedge = candidates[i + 1] if i + 1 < len(candidates) else None
+            attempted = []
+            try:
+                return await self._ainvoke_hedged((key, llm), hedge, input, config, kwargs, attempted)
+            except Exception as e:
+                print(f"LLM call failed on {key[0]}:{key[1]}: {str(e)}")
+                last_error = e
+            # 已发出的对冲请求也失败了，跳过该备用模型，不再把它作为下一个首选重试
+            i += max(1, len(attempted))
+        raise last_error
+
+    def stream(self, input, config=None, **kwargs):
+        last_error = None
+        for i, (key, llm) in enumerate(self._candidates()):
+            if i > 0:
+                self.router.count(key, 'failovers')
+            try:
+                self._acquire(key, llm, input)
+            except RateLimitTimeout as e:
+                print(f"LLM stream failed on {key[0]}:{key[1]}: {str(e)}")
+                last_error = e
+                continue
+            started_at = time.perf_counter()
+            started = False
+            try:
+                for chunk in llm.stream(input, config, **kwargs):
+                    if not started:
+                        started = True
+                        self._served(key)
+                    yield chunk
+            except Exception as e:
+                self.router.record(key, time.perf_counter() - started_at, False)
+                if started:
+                    raise
+                print(f"LLM stream failed on {key[0]}:{key[1]}: {str(e)}")
+                last_error = e
+                continue
+            self.router.record(key, time.perf_counter() - started_at, True)
+            return
+        raise last_error
+
+    async def astream(self, input, config=None, **kwargs):
+        last_error = None
+        for i, (key, llm) in enumerate(self._candidates()):
+            if i > 0:
+                self.router.count(key, 'failovers')
+            try:
+                await self._aacquire(key, llm, input)
+            except RateLimitTimeout as e:
+                print(f"LLM stream failed on {key[0]}:{key[1]}: {str(e)}")
+                last_error = e
+                continue
+            started_at = time.perf_counter()
+            started = False
+            try:
+                async for chunk in llm.astream(input, config, **kwargs):
+                    if not started:
+                        started = True
+                        self._served(key)
+                    yield chunk
+            except Exception as e:
+                self.router.record(key, time.perf_counter() - started_at, False)
+                if started:
+                    raise
+                print(f"LLM stream failed on {key[0]}:{key[1]}: {str(e)}")
+                last_error = e
+                continue
+            self.router.record(key, time.perf_counter() - started_at, True)
+            return
+        raise last_error
+
+    def _candidates(self):
+        candidates = self.router.candidates(self.provider, self.model_name)
+        if not candidates:
+            raise RuntimeError(f"No available LLM for provider {self.provider}")
+        return candidates
+
+    def _estimate_tokens(self, llm, input):
+        """
+        估算一次调用消耗的token数：输入消息 + 预计输出
+        """
+        if hasattr(input, 'to_messages'):
+            input = input.to_messages()
+        if isinstance(input, str):
+            prompt_tokens = estimate_tokens(input)
+        else:
+            prompt_tokens = 0
+            for message in input:
+                content = getattr(message, 'content', message)
+                if isinstance(message, (tuple, list)):
+                    content = message[-1]
+                prompt_tokens += estimate_tokens(content if isinstance(content, str) else str(content))
+        return prompt_tokens + (getattr(llm, 'max_tokens', None) or DEFAULT_COMPLETION_TOKENS)
+
+    def _acquire(self, key, llm, input):
+        tokens = self._estimate_tokens(llm, input)
+        self.router.limiter.acquire(key, tokens, self.priority)
+        return tokens
+
+    async def _aacquire(self, key, llm, input):
+        tokens = self._estimate_tokens(llm, input)
+        await self.router.limiter.aacquire(key, tokens, self.priority)
+        return tokens
+
+    def _served(self, key):
+        for listener in self.listeners:
+            listener(key)
+
+    def _settle(self, key, tokens, result):
+        usage = getattr(result, 'usage_metadata', None)
+        if usage:
+            self.router.limiter.settle(key, tokens, usage.get('total_tokens'))
+
+    def _call(self, key, llm, input, config, kwargs):
+        # 限流排队超时直接抛出，不计入该模型的错误率
+        tokens = self._acquire(key, llm, input)
+        started_at = time.perf_counter()
+        try:
+            result = llm.invoke(input, config, **kwargs)
+        except Exception:
+            self.router.record(key, time.perf_counter() - started_at, False)
+            raise
+        self.router.record(key, time.perf_counter() - started_at, True)
+        self._settle(key, tokens, result)
+        return result
+
+    async def _acall(self, key, llm, input, config, kwargs):
+        tokens = await self._aacquire(key, llm, input)
+        started_at = time.perf_counter()
+        try:
+            result = await llm.ainvoke(input, config, **kwargs)
+        except Exception:
+            self.router.record(key, time.perf_counter() - started_at, False)
+            raise
+        self.router.record(key, time.perf_counter() - started_at, True)
+        self._settle(key, tokens, result)
+        return result
+
+    def _invoke_hedged(self, primary, hedge, input, config, kwargs, attempted):
+        """
+        调用首选模型，超过 p95 延迟仍未返回时向备用模型发出对冲请求
+
+        attempted 中依次记录实际发出请求的模型，调用方据此跳过已经失败的对冲模型。
+        """
+        key, llm = primary
+        attempted.append(key)
+        delay = self.router.hedge_delay(key) if hedge else None
+        if delay is None:
+            result = self._call(key, llm, input, config, kwargs)
+            self._served(key)
+            return result
+
+        executor = self.router.executor()
+        futures = {executor.submit(self._call, key, llm, input, config, kwargs): key}
+        done, _ = wait(futures, timeout=delay)
+        if not done:
+            # 首选请求超过 p95 仍未返回，向备用提供商发出对冲请求
+            self.router.count(key, 'hedges')
+            hedge_key, hedge_llm = hedge
+            attempted.append(hedge_key)
+            futures[executor.submit(self._call, hedge_key, hedge_llm, input, config, kwargs)] = hedge_key
+
+        last_error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if futures[future] != key:
+                    self.router.count(key, 'hedge_wins')
+                self._served(futures[future])
+                # 落后的请求在后台完成，只用于统计
+                return result
+        raise last_error
+
+    async def _ainvoke_hedged(self, primary, hedge, input, config, kwargs, attempted):
+        key, llm = primary
+        attempted.append(key)
+        delay = self.router.hedge_delay(key) if hedge else None
+        if delay is None:
+            result = await self._acall(key, llm, input, config, kwargs)
+            self._served(key)
+            return result
+
+        tasks = {asyncio.ensure_future(self._acall(key, llm, input, config, kwargs)): key}
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            self.router.count(key, 'hedges')
+            hedge_key, hedge_llm = hedge
+            attempted.append(hedge_key)
+            tasks[asyncio.ensure_future(self._acall(hedge_key, hedge_llm, input, config, kwargs))] = hedge_key
+
+        last_error = None
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        last_error = e
+                        continue
+                    if tasks[task] != key:
+                        self.router.count(key, 'hedge_wins')
+                    self._served(tasks[task])
+                    return result
+            raise last_error
+        finally:
+            # 异步请求可以直接取消落后的一方
+            for task in pending:
+                task.cancel()
+
+
+# 创建全局LLM路由实例
+llm_router = LLMRouter()
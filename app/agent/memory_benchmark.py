@@ -0,0 +1,155 @@
+"""
+对话历史内存基准测试
+
+用 tracemalloc 测量 AgentMemory 在大量用户和消息下的对话历史内存占用，与逐条保存
+LangChain 消息的旧存储方式对比（旧方式只抽样少量用户后按每条消息外推），并测量
+分页读取和构建上下文窗口的延迟。
+
+用法：
+    python -m app.agent.memory_benchmark --users 10000 --messages 200
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from app.agent.agent_memory import AgentMemory, Role, message_tokens
+
+# 合成消息的填充文本
+FILLER = '今天在中级道练习了平行转弯，换刃时重心总是偏后，小腿没有压住鞋舌。'
+
+
+def _message_text(user_index, message_index, chars):
+    # 每条消息生成独立的字符串对象，文本内存才会计入测量结果
+    prefix = f"[{user_index}:{message_index}] "
+    body = (FILLER * (chars // len(FILLER) + 1))[:max(0, chars - len(prefix))]
+    return prefix + body
+
+
+def _measure(build):
+    """
+    测量 build() 新分配并保留的内存
+
+    Returns:
+        (result, bytes): build 的返回值和保留的字节数
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return result, after - before
+
+
+def _percentiles(latencies):
+    latencies = sorted(latencies)
+    return {
+        'p50': latencies[len(latencies) // 2] * 1000.0,
+        'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000.0,
+    }
+
+
+def benchmark_memory(users=10000, messages=200, chars=80, legacy_users=100, samples=1000,
+                     token_budget=2000):
+    """
+    测量对话历史的内存占用和读取延迟
+
+    Args:
+        users: 用户数
+        messages: 每个用户的消息数
+        chars: 每条消息的字符数
+        legacy_users: 旧存储方式抽样的用户数
+        samples: 延迟测量的采样次数
+        token_budget: 构建上下文窗口的token预算
+
+    Returns:
+        report: 指标字典
+    """
+    def build_compact():
+        agent_memory = AgentMemory()
+        for u in range(users):
+            session_history = agent_memory.get_session_history(f"user_{u}")
+            for m in range(messages):
+                role = Role.USER if m % 2 == 0 else Role.ASSISTANT
+                session_history.append(role, _message_text(u, m, chars))
+        return agent_memory
+
+    def build_legacy():
+        # 旧方式：每个用户一个 LangChain 消息列表和对应的token数列表
+        histories = {}
+        for u in range(legacy_users):
+            history = []
+            token_counts = []
+            for m in range(messages):
+                text = _message_text(u, m, chars)
+                message = HumanMessage(content=text) if m % 2 == 0 else AIMessage(content=text)
+                history.append(message)
+                token_counts.append(message_tokens(message))
+            histories[f"user_{u}"] = (history, token_counts)
+        return histories
+
+    start = time.perf_counter()
+    agent_memory, compact_bytes = _measure(build_compact)
+    build_seconds = time.perf_counter() - start
+    _, legacy_sample_bytes = _measure(build_legacy)
+
+    total_messages = users * messages
+    legacy_per_message = legacy_sample_bytes / max(1, legacy_users * messages)
+    compact_per_message = compact_bytes / max(1, total_messages)
+
+    page_latencies = []
+    window_latencies = []
+    for i in range(samples):
+        user_id = f"user_{(i * 7919) % users}"
+        start = time.perf_counter()
+        agent_memory.get_history_page(user_id)
+        page_latencies.append(time.perf_counter() - start)
+
+        session_history = agent_memory.get_session_history(user_id)
+        start = time.perf_counter()
+        session_history.get_window(token_budget)
+        window_latencies.append(time.perf_counter() - start)
+
+    return {
+        'users': users,
+        'messages_per_user': messages,
+        'message_chars': chars,
+        'build_seconds': build_seconds,
+        'compact_mb': compact_bytes / (1 << 20),
+        'compact_bytes_per_message': compact_per_message,
+        'legacy_sample_users': legacy_users,
+        'legacy_bytes_per_message': legacy_per_message,
+        'legacy_mb_estimated': legacy_per_message * total_messages / (1 << 20),
+        'reduction': 1.0 - compact_per_message / legacy_per_message if legacy_per_message else None,
+        'get_history_page_ms': _percentiles(page_latencies),
+        'get_window_ms': _percentiles(window_latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark chat history memory usage')
+    parser.add_argument('--users', type=int, default=10000, help='用户数')
+    parser.add_argument('--messages', type=int, default=200, help='每个用户的消息数')
+    parser.add_argument('--chars', type=int, default=80, help='每条消息的字符数')
+    parser.add_argument('--legacy-users', type=int, default=100, help='旧存储方式抽样的用户数')
+    parser.add_argument('--samples', type=int, default=1000, help='延迟测量的采样次数')
+    parser.add_argument('--token-budget', type=int, default=2000, help='上下文窗口的token预算')
+    args = parser.parse_args()
+
+    report = benchmark_memory(
+        users=args.users,
+        messages=args.messages,
+        chars=args.chars,
+        legacy_users=min(args.legacy_users, args.users),
+        samples=args.samples,
+        token_budget=args.token_budget,
+    )
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+import json
+import os
+import threading
+import time
+import zlib
+
+# 日志文件按路径哈希分配到固定数量的锁上
+_LOCK_STRIPES = 64
+
+
+def replay(records):
+    """
+    按顺序重放日志记录，得到用户数据的当前状态
+
+    记录类型：
+    - reset: 清空全部数据（之后跟着完整快照）
+    - clear_history: 清空对话历史和摘要
+    - message / ski_history / learning_plan: 追加一条数据
+    - summary: 替换对话摘要
+
+    Args:
+        records: 日志记录的可迭代对象
+
+    Returns:
+        state: {'chat_history': [{'id', 'role', 'content'}], 'ski_history': [], 'learning_plans': [], 'summary'}
+    """
+    state = _empty_state()
+    for record in records:
+        op = record.get('op')
+        if op == 'reset':
+            state = _empty_state()
+        elif op == 'clear_history':
+            state['chat_history'] = []
+            state['summary'] = None
+        elif op == 'message':
+            state['chat_history'].append({'id': record.get('id'), 'role': record['role'], 'content': record['content']})
+        elif op == 'ski_history':
+            state['ski_history'].append(record['data'])
+        elif op == 'learning_plan':
+            state['learning_plans'].append(record['data'])
+        elif op == 'summary':
+            state['summary'] = record['data']
+    return state
+
+
+def snapshot_records(state):
+    """
+    把用户数据转换为一组日志记录（压缩日志时使用）
+    """
+    records = [{'op': 'reset'}]
+    records += [{'op': 'message', **message} for message in state['chat_history']]
+    records += [{'op': 'ski_history', 'data': data} for data in state['ski_history']]
+    records += [{'op': 'learning_plan', 'data': data} for data in state['learning_plans']]
+    if state.get('summary'):
+        records.append({'op': 'summary', 'data': state['summary']})
+    return records
+
+
+def _empty_state():
+    return {'chat_history': [], 'ski_history': [], 'learning_plans': [], 'summary': None}
+
+
+class MemoryJournal:
+    """
+    按用户追加写入的 JSONL 日志
+
+    每次保存只追加新增的记录，写入成本与新增数据量成正比；后台线程每 fsync_interval
+    秒对有新写入的文件统一 fsync 一次（fsync_interval 为0时每次写入后立即 fsync）。
+    文件超过 compact_min_bytes 且比上次压缩后增长 compact_growth 倍时，后台把日志
+    重写为当前状态的快照：写入临时文件并 fsync 后用 os.replace 原子替换，进程在任何
+    时刻崩溃都不会损坏已有数据，最多丢失最后一行未写完的记录（读取时跳过）。
+    """
+
+    def __init__(self, fsync_interval=1.0, compact_min_bytes=1 << 20, compact_growth=2.0):
+        self.fsync_interval = fsync_interval
+        self.compact_min_bytes = compact_min_bytes
+        self.compact_growth = compact_growth
+        self._locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+        # 等待 fsync 和压缩的文件
+        self._dirty = set()
+        self._compact_pending = set()
+        # 各文件上次压缩后的大小
+        self._compacted_sizes = {}
+        self._state_lock = threading.Lock()
+        self._worker = None
+        self.stats = {'appends': 0, 'records': 0, 'fsyncs': 0, 'compactions': 0, 'torn_records': 0}
+
+    def append(self, path, records):
+        """
+        追加日志记录
+
+        Args:
+            path: 日志文件路径
+            records: 记录列表
+        """
+        if not records:
+            return
+        data = ''.join(json.dumps(record, ensure_ascii=False, default=str) + '\n' for record in records)
+        data = data.encode('utf-8')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._lock_for(path):
+            with open(path, 'ab+') as f:
+                # 上次崩溃留下未写完的行时先换行，避免新记录接在残缺的行后面一起被丢弃
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        data = b'\n' + data
+                    f.seek(0, os.SEEK_END)
+                f.write(data)
+                f.flush()
+                if not self.fsync_interval:
+                    os.fsync(f.fileno())
+                size = f.tell()
+
+        with self._state_lock:
+            self.stats['appends'] += 1
+            self.stats['records'] += len(records)
+            if self.fsync_interval:
+                self._dirty.add(path)
+            last_size = self._compacted_sizes.get(path, 0)
+            if size >= self.compact_min_bytes and size >= last_size * self.compact_growth:
+                self._compact_pending.add(path)
+        self._ensure_worker()
+
+    def read(self, path):
+        """
+        逐条读取日志记录（不把整个文件读入内存）
+
+        Args:
+            path: 日志文件路径
+
+        Returns:
+            records: 记录生成器
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # 崩溃时未写完的最后一行
+                    with self._state_lock:
+                        self.stats['torn_records'] += 1
+                    print(f"Skipping torn journal record in {path}")
+
+    def compact(self, path):
+        """
+        把日志重写为当前状态的快照
+        """
+        tmp_path = f"{path}.tmp"
+        with self._lock_for(path):
+            if not os.path.exists(path):
+                return
+            state = replay(self.read(path))
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for record in snapshot_records(state):
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+                size = f.tell()
+            os.replace(tmp_path, path)
+            _fsync_dir(os.path.dirname(os.path.abspath(path)))
+
+        with self._state_lock:
+            self._compacted_sizes[path] = size
+            self._dirty.discard(path)
+            self.stats['compactions'] += 1
+
+    def sync(self):
+        """
+        立即 fsync 所有有新写入的文件
+        """
+        with self._state_lock:
+            dirty, self._dirty = self._dirty, set()
+        for path in dirty:
+            try:
+                with self._lock_for(path), open(path, 'a', encoding='utf-8') as f:
+                    os.fsync(f.fileno())
+            except OSError as e:
+                print(f"Failed to fsync journal {path}: {str(e)}")
+                continue
+            with self._state_lock:
+                self.stats['fsyncs'] += 1
+
+    def get_stats(self):
+        with self._state_lock:
+            return dict(self.stats, dirty=len(self._dirty), compact_pending=len(self._compact_pending))
+
+    def _lock_for(self, path):
+        return self._locks[zlib.crc32(path.encode('utf-8')) % _LOCK_STRIPES]
+
+    def _ensure_worker(self):
+        with self._state_lock:
+            if self._worker is not None:
+                return
+            self._worker = threading.Thread(target=self._worker_loop, name='memory-journal', daemon=True)
+            self._worker.start()
+
+    def _worker_loop(self):
+        while True:
+            time.sleep(self.fsync_interval or 1.0)
+            self.sync()
+            with self._state_lock:
+                pending, self._compact_pending = self._compact_pending, set()
+            for path in pending:
+                try:
+                    self.compact(path)
+                except Exception as e:
+                    print(f"Failed to compact journal {path}: {str(e)}")
+
+
+def _fsync_dir(directory):
+    # 目录 fsync 让 os.replace 的结果持久化；不支持的平台（Windows）直接跳过
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,312 @@
+import atexit
+import json
+import threading
+import time
+from datetime import datetime
+
+
+class SQLMemoryStore:
+    """
+    AgentMemory 的数据库存储
+
+    写入（对话消息、滑雪历史、学习计划、清空对话）先进入内存队列，由后台线程按批
+    写入数据库，不占用请求线程；队列中的操作按入队顺序执行。读取只在用户不在
+    AgentMemory 的读缓存中或缓存需要核对时发生：读取数据库中最近的记录，再叠加尚未写入的操作。
+    """
+
+    def __init__(self, app=None, batch_size=200, flush_interval=0.5, history_limit=200, plan_limit=10,
+                 max_retries=3):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # 加载用户时读取的最近消息数和学习计划数
+        self.history_limit = history_limit
+        self.plan_limit = plan_limit
+        self.max_retries = max_retries
+        # 待写入的操作：(操作类型, 用户ID, 数据)
+        self._queue = []
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        # 写入一批和读取用户数据互斥，保证读取时看到的“数据库 + 队列”不重不漏
+        self._write_lock = threading.Lock()
+        self._worker = None
+        self._stopped = False
+        self._failures = 0
+        self.stats = {'enqueued': 0, 'written': 0, 'batches': 0, 'failed_batches': 0, 'dropped': 0, 'loads': 0}
+
+    def init_app(self, app):
+        """
+        绑定 Flask 应用并启动后台写入线程
+        """
+        self.app = app
+        self.start()
+
+    def start(self):
+        with self._lock:
+            if self._worker is not None:
+                return
+            self._stopped = False
+            self._worker = threading.Thread(target=self._worker_loop, name='agent-memory-writer', daemon=True)
+            self._worker.start()
+        # 进程正常退出时写入队列中剩余的操作
+        atexit.register(self.close)
+
+    def close(self):
+        """
+        停止后台线程并写入剩余的操作
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self.flush()
+
+    def append_message(self, user_id, role, content, message_id):
+        self._enqueue('message', user_id, {
+            'message_id': message_id,
+            'role': role,
+            'content': content,
+            'created_at': datetime.utcnow(),
+        })
+
+    def append_ski_history(self, user_id, ski_data):
+        self._enqueue('ski_history', user_id, {
+            'data': json.dumps(ski_data, ensure_ascii=False, default=str),
+            'created_at': datetime.utcnow(),
+        })
+
+    def append_learning_plan(self, user_id, plan):
+        self._enqueue('learning_plan', user_id, {'plan': plan, 'created_at': datetime.utcnow()})
+
+    def clear_history(self, user_id):
+        self._enqueue('clear_history', user_id, None)
+
+    def load_user(self, user_id):
+        """
+        读取用户的最近数据
+
+        Args:
+            user_id: 用户ID
+
+        Returns:
+            data: {'chat_history': [(message_id, role, content)], 'ski_history': [dict], 'learning_plans': [dict],
+            'complete': 是否包含全部对话历史}，均按时间顺序排列
+        """
+        from app.db.models import LearningPlanRecord, SkiHistoryRecord
+
+        with self._write_lock, self.app.app_context():
+            # 多读一条用来判断是否还有更早的消息
+            messages, pending = self._read_messages(user_id, limit=self.history_limit + 1)
+            ski_history = (
+                SkiHistoryRecord.query.filter_by(user_id=user_id)
+                .order_by(SkiHistoryRecord.created_at.asc(), SkiHistoryRecord.id.asc())
+                .all()
+            )
+            plans = (
+                LearningPlanRecord.query.filter_by(user_id=user_id)
+                .order_by(LearningPlanRecord.created_at.desc(), LearningPlanRecord.id.desc())
+                .limit(self.plan_limit)
+                .all()
+            )
+            data = {
+                'chat_history': messages,
+                'ski_history': [json.loads(record.data) for record in ski_history],
+                'learning_plans': [
+                    {'plan': record.plan, 'created_at': record.created_at.isoformat()}
+                    for record in reversed(plans)
+                ],
+            }
+            with self._lock:
+                self.stats['loads'] += 1
+
+        # 叠加尚未写入数据库的滑雪历史和学习计划
+        for op, payload in pending:
+            if op == 'ski_history':
+                data['ski_history'].append(json.loads(payload['data']))
+            elif op == 'learning_plan':
+                data['learning_plans'].append({'plan': payload['plan'], 'created_at': payload['created_at'].isoformat()})
+        data['complete'] = len(data['chat_history']) <= self.history_limit
+        data['chat_history'] = data['chat_history'][-self.history_limit:]
+        return data
+
+    def read_messages(self, user_id, before=None, after=None, limit=50):
+        """
+        按消息ID范围读取一页对话历史
+
+        Args:
+            user_id: 用户ID
+            before: 返回ID小于该值的最新 limit 条
+            after: 返回ID大于该值的最早 limit 条
+            limit: 每页条数
+
+        Returns:
+            (page, has_more): 按时间顺序排列的消息字典列表；游标方向上是否还有更多消息
+        """
+        with self._write_lock, self.app.app_context():
+            messages, _ = self._read_messages(user_id, before=before, after=after, limit=limit + 1)
+        has_more = len(messages) > limit
+        if has_more:
+            messages = messages[:limit] if after is not None else messages[1:]
+        page = [
+            {'id': message_id, 'role': role, 'content': content}
+            for message_id, role, content in messages
+        ]
+        return page, has_more
+
+    def message_exists(self, user_id, message_id):
+        """
+        判断消息是否存在（对话被清空后不存在）
+        """
+        with self._write_lock, self.app.app_context():
+            messages, _ = self._read_messages(user_id, before=message_id + 1, after=message_id - 1, limit=1)
+        return bool(messages)
+
+    def latest_message_id(self, user_id):
+        """
+        获取用户最新消息的ID（对话为空或已被清空时返回None）
+        """
+        with self._write_lock, self.app.app_context():
+            messages, _ = self._read_messages(user_id, limit=1)
+        return messages[-1][0] if messages else None
+
+    def _read_messages(self, user_id, before=None, after=None, limit=50):
+        """
+        读取数据库中的消息并叠加尚未写入的操作（调用方需持有 _write_lock 和应用上下文）
+
+        Returns:
+            (messages, pending): [(message_id, role, content)] 按时间顺序排列，有 after 时取最早的
+            limit 条，否则取最新的 limit 条；pending 为该用户尚未写入的全部操作
+        """
+        from app.db.models import ChatMessageRecord
+
+        query = ChatMessageRecord.query.filter(ChatMessageRecord.user_id == user_id)
+        if before is not None:
+            query = query.filter(ChatMessageRecord.message_id < before)
+        if after is not None:
+            query = query.filter(ChatMessageRecord.message_id > after)
+            query = query.order_by(ChatMessageRecord.message_id.asc())
+        else:
+            query = query.order_by(ChatMessageRecord.message_id.desc())
+        records = query.limit(limit).all()
+        messages = [(record.message_id, record.role, record.content) for record in records]
+
+        with self._lock:
+            pending = [(op, payload) for op, op_user_id, payload in self._queue if op_user_id == user_id]
+        for op, payload in pending:
+            if op == 'clear_history':
+                messages = []
+            elif op == 'message':
+                message_id = payload['message_id']
+                if (before is None or message_id < before) and (after is None or message_id > after):
+                    messages.append((message_id, payload['role'], payload['content']))
+
+        messages.sort(key=lambda message: message[0])
+        messages = messages[:limit] if after is not None else messages[-limit:]
+        return messages, pending
+
+    def flush(self):
+        """
+        同步写入队列中的全部操作
+        """
+        while True:
+            with self._lock:
+                if not self._queue:
+                    return
+            if not self._write_batch():
+                return
+
+    def get_stats(self):
+        with self._lock:
+            batches = self.stats['batches']
+            return dict(
+                self.stats,
+                queue_depth=len(self._queue),
+                avg_batch_size=self.stats['written'] / batches if batches else 0.0,
+            )
+
+    def _enqueue(self, op, user_id, payload):
+        with self._cond:
+            self._queue.append((op, user_id, payload))
+            self.stats['enqueued'] += 1
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify()
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                if not self._stopped and len(self._queue) < self.batch_size:
+                    self._cond.wait(timeout=self.flush_interval)
+                if self._stopped:
+                    return
+                if not self._queue:
+                    continue
+            if not self._write_batch():
+                # 写入失败时退避后重试
+                time.sleep(min(30.0, self.flush_interval * (2 ** self._failures)))
+
+    def _write_batch(self):
+        """
+        写入一批操作
+
+        Returns:
+            ok: 是否写入成功（失败次数超过 max_retries 的批次被丢弃，也返回True）
+        """
+        with self._write_lock:
+            with self._lock:
+                batch = self._queue[:self.batch_size]
+                del self._queue[:len(batch)]
+            if not batch:
+                return True
+            try:
+                # 应用上下文结束时 Flask-SQLAlchemy 会释放本线程的会话
+                with self.app.app_context():
+                    self._apply(batch)
+            except Exception as e:
+                print(f"Failed to write agent memory batch: {str(e)}")
+                self._failures += 1
+                with self._lock:
+                    self.stats['failed_batches'] += 1
+                    if self._failures > self.max_retries:
+                        self.stats['dropped'] += len(batch)
+                        self._failures = 0
+                        return True
+                    # 放回队首，保持操作顺序
+                    self._queue[:0] = batch
+                return False
+
+        self._failures = 0
+        with self._lock:
+            self.stats['batches'] += 1
+            self.stats['written'] += len(batch)
+        return True
+
+    def _apply(self, batch):
+        from app.db.models import ChatMessageRecord, LearningPlanRecord, SkiHistoryRecord
+        from app.server.extensions import db
+
+        tables = {
+            'message': ChatMessageRecord.__table__,
+            'ski_history': SkiHistoryRecord.__table__,
+            'learning_plan': LearningPlanRecord.__table__,
+        }
+        rows = {op: [] for op in tables}
+
+        def insert_pending():
+            for op, op_rows in rows.items():
+                if op_rows:
+                    db.session.execute(tables[op].insert(), op_rows)
+                    op_rows.clear()
+
+        try:
+            for op, user_id, payload in batch:
+                if op == 'clear_history':
+                    # 先写入清空之前的消息，再删除
+                    insert_pending()
+                    ChatMessageRecord.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+                else:
+                    rows[op].append(dict(payload, user_id=user_id))
+            insert_pending()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
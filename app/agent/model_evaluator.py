@@ -2,27 +2,31 @@ import base64
 import os
 import requests
 from langchain_core.messages import HumanMessage
-from app.agent.llm_manager import llm_manager
+from app.agent.llm_router import llm_router
+from app.agent.pose_features import PoseFeatureExtractor
 
 class ModelEvaluator:
-    def __init__(self, llm_provider='openai', llm_model=None):
+    def __init__(self, llm_provider='openai', llm_model=None, pose_token_budget=400):
         # 初始化大语言模型
         self.llm_provider = llm_provider
         self.llm_model = llm_model
         self.llm = self._init_llm()
+        # 姿态特征提取器：把姿态数据压缩为固定大小、有token预算的prompt片段
+        self.feature_extractor = PoseFeatureExtractor(token_budget=pose_token_budget)
     
     def _init_llm(self):
         """
         初始化LLM模型
         """
         try:
-            return llm_manager.get_llm(self.llm_provider, self.llm_model)
+            # 视频评价是后台任务，限流时排在交互聊天和学习计划之后
+            return llm_router.get_llm(self.llm_provider, self.llm_model, priority='background')
         except Exception as e:
             # 如果初始化失败，返回None，使用模拟回复
             print(f"Failed to initialize LLM: {str(e)}")
             return None
     
-    def evaluate(self, frames, pose_data, ski_type, skill_level):
+    def evaluate(self, frames, pose_data, ski_type, skill_level, seconds_per_frame=None):
         """
         评价滑雪动作
         
@@ -31,20 +35,20 @@ class ModelEvaluator:
             pose_data: 姿态数据列表
             ski_type: 滑雪类型（单板/双板）
             skill_level: 技能水平（初级/中级/高级）
+            seconds_per_frame: 相邻采样帧之间的时间间隔（秒），用于估计转弯节奏
             
         Returns:
             evaluation: 评价结果
         """
         # 构建评价prompt
-        prompt = self._build_evaluation_prompt(ski_type, skill_level, pose_data)
+        prompt = self._build_evaluation_prompt(ski_type, skill_level, pose_data, seconds_per_frame)
         
         # 生成评价结果
-        # 注意：实际项目中应该调用真实的多模态大语言模型API
         evaluation = self._generate_evaluation(prompt, frames)
         
         return evaluation
     
-    def _build_evaluation_prompt(self, ski_type, skill_level, pose_data):
+    def _build_evaluation_prompt(self, ski_type, skill_level, pose_data, seconds_per_frame=None):
         """
         构建评价prompt
         
@@ -52,26 +56,17 @@ class ModelEvaluator:
             ski_type: 滑雪类型
             skill_level: 技能水平
             pose_data: 姿态数据
+            seconds_per_frame: 相邻采样帧之间的时间间隔（秒）
             
         Returns:
             prompt: 评价prompt
         """
         prompt = f"你是一位专业的滑雪教练，精通{ski_type}滑雪技术，从初级到顶级水平都有丰富的教学经验。现在请你分析一位{skill_level}滑雪者的动作，并提供专业的评价和改进建议。\n\n"
         
-        # 添加姿态数据分析
+        # 添加姿态数据分析（固定大小的描述子，prompt长度不随视频时长增长）
         if pose_data:
-            prompt += "## 姿态数据分析\n"
-            
-            # 计算平均角度
-            avg_angles = self._calculate_average_angles(pose_data)
-            
-            if avg_angles:
-                prompt += f"- 左膝角度: {avg_angles.get('left_knee', 'N/A'):.1f}°\n"
-                prompt += f"- 右膝角度: {avg_angles.get('right_knee', 'N/A'):.1f}°\n"
-                prompt += f"- 左髋角度: {avg_angles.get('left_hip', 'N/A'):.1f}°\n"
-                prompt += f"- 右髋角度: {avg_angles.get('right_hip', 'N/A'):.1f}°\n"
-                prompt += f"- 左肩角度: {avg_angles.get('left_shoulder', 'N/A'):.1f}°\n"
-                prompt += f"- 右肩角度: {avg_angles.get('right_shoulder', 'N/A'):.1f}°\n\n"
+            descriptor = self.feature_extractor.extract(pose_data, seconds_per_frame)
+            prompt += self.feature_extractor.render_prompt_section(descriptor)
         
         prompt += "## 评价要求\n"
         prompt += "1. 技术评价：分析滑雪者的动作是否标准，指出优点和不足之处\n"
@@ -82,38 +77,27 @@ class ModelEvaluator:
         
         return prompt
     
-    def _calculate_average_angles(self, pose_data):
+    def evaluate_batch(self, items, max_concurrency=4):
         """
-        计算平均角度
+        批量评价滑雪动作，多个视频的LLM请求一起并发发送
         
         Args:
-            pose_data: 姿态数据列表
+            items: 评价参数列表，每项包含 frames、pose_data、ski_type、skill_level，可选 seconds_per_frame
+            max_concurrency: 最大并发LLM请求数
             
         Returns:
-            avg_angles: 平均角度字典
-        """
-        if not pose_data:
-            return {}
-        
-        angles_sum = {}
-        angles_count = {}
-        
-        for data in pose_data:
-            if 'angles' in data:
-                for angle_name, angle_value in data['angles'].items():
-                    if angle_value is not None:
-                        if angle_name not in angles_sum:
-                            angles_sum[angle_name] = 0
-                            angles_count[angle_name] = 0
-                        angles_sum[angle_name] += angle_value
-                        angles_count[angle_name] += 1
-        
-        avg_angles = {}
-        for angle_name, total in angles_sum.items():
-            count = angles_count.get(angle_name, 1)
-            avg_angles[angle_name] = total / count
-        
-        return avg_angles
+            evaluations: 与 items 顺序一致的评价结果列表
+        """
+        prompts = [
+            self._build_evaluation_prompt(
+                item['ski_type'],
+                item['skill_level'],
+                item['pose_data'],
+                item.get('seconds_per_frame')
+            )
+            for item in items
+        ]
+        return self._generate_evaluations(prompts, [item['frames'] for item in items], max_concurrency)
     
     def _generate_evaluation(self, prompt, frames):
         """
@@ -126,45 +110,56 @@ class ModelEvaluator:
         Returns:
             evaluation: 评价结果
         """
-        # 注意：实际项目中应该调用真实的多模态大语言模型API
-        # 这里使用模拟的评价结果
+        return self._generate_evaluations([prompt], [frames])[0]
+    
+    def _generate_evaluations(self, prompts, frames_list, max_concurrency=4):
+        """
+        批量生成评价结果
         
-        # 模拟评价结果
-        evaluation = {
+        使用 Runnable.batch 并发调用LLM；LLM不可用或单个请求失败时，对应项使用默认评价。
+        目前只发送文本prompt（姿态描述子），并非所有提供商的默认模型都支持图片输入。
+        
+        Args:
+            prompts: 评价prompt列表
+            frames_list: 每个prompt对应的帧路径列表
+            max_concurrency: 最大并发LLM请求数
+            
+        Returns:
+            evaluations: 评价结果列表
+        """
+        if not self.llm:
+            return [self._default_evaluation() for _ in prompts]
+        
+        messages = [[HumanMessage(content=prompt)] for prompt in prompts]
+        responses = self.llm.batch(
+            messages,
+            config={'max_concurrency': max_concurrency},
+            return_exceptions=True
+        )
+        
+        evaluations = []
+        for response in responses:
+            if isinstance(response, Exception):
+                print(f"Failed to generate evaluation: {str(response)}")
+                evaluations.append(self._default_evaluation())
+            else:
+                evaluations.append(self._parse_llm_response(response.content))
+        return evaluations
+    
+    def _default_evaluation(self):
+        """
+        LLM不可用时的默认评价结果
+        
+        Returns:
+            evaluation: 评价结果
+        """
+        return {
             'technical_evaluation': '滑雪者的基本姿势保持良好，膝盖微屈，身体重心适中。转弯时的身体跟随动作基本协调，但在高速转弯时上半身过于僵硬，缺乏柔韧性。',
             'improvement_suggestions': '1. 加强核心力量训练，提高身体稳定性\n2. 练习转弯时的身体跟随动作，保持上半身放松\n3. 注意手臂的位置，保持自然摆动\n4. 增加平衡训练，提高在不平 terrain 上的稳定性',
             'learning_plan': '基于当前水平，建议下一步学习：\n1. 中级转弯技巧：练习更流畅的Carving转弯\n2. 速度控制：学习使用身体姿势控制速度\n3. 地形适应：练习在不同坡度和雪质上的滑行\n4. 安全技巧：学习紧急制动和规避障碍物',
             'safety_tips': '1. 始终保持对前方的观察，提前规划路线\n2. 控制速度，特别是在不熟悉的雪道上\n3. 佩戴必要的护具，如头盔、护膝等\n4. 遵守雪道规则，尊重其他滑雪者',
             'overall_rating': '良好（75/100）'
         }
-        
-        # 实际项目中，这里应该调用真实的API
-        # 例如使用OpenAI的GPT-4V
-        # if frames:
-        #     # 编码第一帧作为示例
-        #     with open(frames[0], "rb") as f:
-        #         base64_image = base64.b64encode(f.read()).decode('utf-8')
-        #     
-        #     messages = [
-        #         HumanMessage(
-        #             content=[
-        #                 {"type": "text", "text": prompt},
-        #                 {
-        #                     "type": "image_url",
-        #                     "image_url": {
-        #                         "url": f"data:image/jpeg;base64,{base64_image}"
-        #                     },
-        #                 },
-        #             ]
-        #         )
-        #     ]
-        #     
-        #     if self.llm:
-        #         response = self.llm.invoke(messages)
-        #         # 解析响应
-        #         evaluation = self._parse_llm_response(response.content)
-        
-        return evaluation
     
     def _parse_llm_response(self, response):
         """
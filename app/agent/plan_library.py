@@ -0,0 +1,221 @@
+import re
+import threading
+import time
+
+# 预生成模板覆盖的滑雪类型和技能水平
+SKI_TYPES = ('单板', '双板')
+SKILL_LEVELS = ('初级', '中级', '高级')
+
+# 目标类别：
+# - goals: 预生成模板时使用的目标描述
+# - exact: 与这些说法完全一致（忽略空白和标点）的目标直接返回模板
+# - keywords: 包含这些词的目标归入该类别，在模板基础上做个性化调整
+GOAL_BUCKETS = {
+    'fundamentals': {
+        'goals': '提高技术水平',
+        'exact': ('提高技术水平', '提高技术', '全面提高', '打好基础', '入门'),
+        'keywords': ('基础', '入门', '提高', '进阶', '稳定', 'basics', 'fundamental', 'improve'),
+    },
+    'carving': {
+        'goals': '掌握刻滑',
+        'exact': ('刻滑', '学刻滑', '学会刻滑', '掌握刻滑', '卡宾', 'carving', 'carve'),
+        'keywords': ('刻滑', '卡宾', '立刃', '压弯', 'carv'),
+    },
+    'short_turns': {
+        'goals': '掌握搓雪小回转',
+        'exact': ('小回转', '搓雪小回转', '学会小回转', '掌握小回转', 'short turns'),
+        'keywords': ('小回转', '搓雪', '换刃', 'short turn', 'skid'),
+    },
+    'flatground': {
+        'goals': '学习平花',
+        'exact': ('平花', '学平花', '学习平花', '学会平花', 'ground tricks'),
+        'keywords': ('平花', '地形花式', 'butter', 'ground trick', 'press'),
+    },
+    'park': {
+        'goals': '学习公园技巧',
+        'exact': ('公园', '公园技巧', '学习公园技巧', '跳台', 'park'),
+        'keywords': ('公园', '跳台', '道具', '铁杆', '箱子', 'jump', 'rail', 'box', 'park'),
+    },
+    'off_piste': {
+        'goals': '适应粉雪和野雪',
+        'exact': ('粉雪', '野雪', '滑粉', '滑野雪', 'powder'),
+        'keywords': ('粉雪', '野雪', '树林', '猫跳', 'powder', 'mogul', 'tree'),
+    },
+}
+
+# 个性化调整的prompt：只输出简短的补充说明，而不是重新生成整份计划
+PERSONALIZE_PROMPT = (
+    "下面是一份为{skill_level}水平{ski_type}滑雪者准备的学习计划模板（目标：{bucket_goals}）。\n"
+    "学员的实际目标是：{goals}\n\n"
+    "请不要重写整份计划，只针对学员的实际目标补充需要调整或额外注意的内容，"
+    "使用要点列表，不超过{max_chars}字。\n\n"
+    "学习计划模板：\n{template}"
+)
+
+_NORMALIZE_RE = re.compile(r'[\s\W_]+')
+
+
+def build_plan_prompt(ski_type, skill_level, goals):
+    """
+    构建完整学习计划的prompt
+
+    Args:
+        ski_type: 滑雪类型（单板/双板）
+        skill_level: 当前技能水平
+        goals: 学习目标
+
+    Returns:
+        plan_prompt: 学习计划prompt
+    """
+    plan_prompt = f"请为一位{skill_level}水平的{ski_type}滑雪者制定一个学习计划，目标是{goals}。\n\n"
+    plan_prompt += "学习计划应该包括：\n"
+    plan_prompt += "1. 短期目标（1-2周）\n"
+    plan_prompt += "2. 中期目标（1-2个月）\n"
+    plan_prompt += "3. 长期目标（3-6个月）\n"
+    plan_prompt += "4. 每周练习计划，包括具体的练习内容和时间安排\n"
+    plan_prompt += "5. 技术要点和注意事项\n"
+    plan_prompt += "6. 安全提示\n"
+    plan_prompt += "7. 装备建议（如适用）\n\n"
+    plan_prompt += "请根据滑雪者的水平和目标，制定详细、实用的学习计划。"
+    return plan_prompt
+
+
+def match_goal_bucket(goals):
+    """
+    把学习目标归入目标类别
+
+    Args:
+        goals: 学习目标
+
+    Returns:
+        (bucket, exact): 目标类别（无法归类时为None）；exact 表示目标与类别的标准说法完全一致
+    """
+    normalized = _NORMALIZE_RE.sub('', (goals or '').lower())
+    if not normalized:
+        return None, False
+
+    for bucket, spec in GOAL_BUCKETS.items():
+        if any(normalized == _NORMALIZE_RE.sub('', phrase.lower()) for phrase in spec['exact']):
+            return bucket, True
+
+    # 命中关键词最多的类别；基础类的关键词最宽泛，只在没有其他类别命中时使用
+    text = (goals or '').lower()
+    best_bucket, best_hits = None, 0
+    for bucket, spec in GOAL_BUCKETS.items():
+        hits = sum(1 for keyword in spec['keywords'] if keyword in text)
+        if hits > best_hits or (hits == best_hits and hits and best_bucket == 'fundamentals'):
+            best_bucket, best_hits = bucket, hits
+    return best_bucket, False
+
+
+class PlanLibrary:
+    """
+    预生成的学习计划模板库
+
+    模板由 app/task/precompute_plans.py 离线生成并保存在 plan_templates 表中。
+    读取结果在进程内缓存 cache_ttl 秒（包括“没有模板”的结果），避免每次请求都查库。
+    """
+
+    def __init__(self, cache_ttl=600, personalize_max_chars=300):
+        self.cache_ttl = cache_ttl
+        self.personalize_max_chars = personalize_max_chars
+        self.app = None
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.stats = {'exact': 0, 'personalized': 0, 'unmatched': 0}
+
+    def init_app(self, app):
+        """
+        绑定 Flask 应用（在没有应用上下文的线程中查询数据库时使用）
+        """
+        self.app = app
+
+    def match(self, ski_type, skill_level, goals):
+        """
+        查找适用的学习计划模板
+
+        Args:
+            ski_type: 滑雪类型
+            skill_level: 技能水平
+            goals: 学习目标
+
+        Returns:
+            (template, personalize_prompt): 没有模板时均为None；目标与类别完全一致时
+            personalize_prompt 为None，直接使用模板
+        """
+        bucket, exact = match_goal_bucket(goals)
+        template = self._get_template(ski_type, skill_level, bucket) if bucket else None
+        if template is None:
+            self._count('unmatched')
+            return None, None
+        if exact:
+            self._count('exact')
+            return template, None
+
+        self._count('personalized')
+        return template, PERSONALIZE_PROMPT.format(
+            skill_level=skill_level,
+            ski_type=ski_type,
+            bucket_goals=GOAL_BUCKETS[bucket]['goals'],
+            goals=goals,
+            max_chars=self.personalize_max_chars,
+            template=template,
+        )
+
+    def invalidate(self):
+        """
+        清空进程内缓存（模板更新后调用）
+        """
+        with self._lock:
+            self._cache.clear()
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, cached=len(self._cache))
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _get_template(self, ski_type, skill_level, bucket):
+        key = (ski_type, skill_level, bucket)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[1] > now:
+                return cached[0]
+
+        from flask import has_app_context
+        from app.db.models import get_plan_template
+
+        try:
+            if has_app_context() or self.app is None:
+                template = get_plan_template(ski_type, skill_level, bucket)
+            else:
+                with self.app.app_context():
+                    template = get_plan_template(ski_type, skill_level, bucket)
+            content = template.content if template else None
+        except Exception as e:
+            # 表不存在（尚未迁移）等情况按没有模板处理
+            print(f"Failed to load plan template: {str(e)}")
+            content = None
+
+        with self._lock:
+            self._cache[key] = (content, now + self.cache_ttl)
+        return content
+
+
+def compose_personalized_plan(template, adjustments):
+    """
+    把个性化调整附加到模板后面
+
+    Args:
+        template: 学习计划模板
+        adjustments: 个性化调整内容
+
+    Returns:
+        plan: 学习计划
+    """
+    if not adjustments:
+        return template
+    return f"{template}\n\n## 针对你的目标的调整\n{adjustments.strip()}"
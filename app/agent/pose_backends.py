@@ -0,0 +1,189 @@
+import hashlib
+
+import numpy as np
+
+# 尝试不同的mediapipe导入方式
+try:
+    import mediapipe as mp
+    has_mediapipe = True
+except ImportError:
+    mp = None
+    has_mediapipe = False
+
+# MediaPipe Pose 的关键点数量
+LANDMARK_COUNT = 33
+
+
+class PoseBackendUnavailable(RuntimeError):
+    """
+    姿态估计后端在当前环境中不可用（例如未安装 mediapipe）
+    """
+
+
+class PoseBackend:
+    """
+    姿态估计后端接口
+
+    process() 接收RGB图像，返回 LANDMARK_COUNT 个关键点（包含归一化的 x、y、z 和 visibility），
+    未检测到人体时返回None。
+    """
+
+    name = 'base'
+
+    def process(self, image_rgb):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MediaPipePoseBackend(PoseBackend):
+    """
+    MediaPipe Pose 后端，model_complexity 为 0（lite）、1（full）、2（heavy）
+    """
+
+    def __init__(self, model_complexity=2, min_detection_confidence=0.5):
+        if not has_mediapipe:
+            raise PoseBackendUnavailable('mediapipe is not installed')
+
+        try:
+            # 尝试使用较新版本的mediapipe API
+            from mediapipe import solutions
+        except ImportError:
+            # 尝试使用旧版本的mediapipe API
+            solutions = getattr(mp, 'solutions', None)
+            if solutions is None:
+                raise PoseBackendUnavailable('mediapipe solutions API is not available')
+
+        self.model_complexity = model_complexity
+        self.name = f"mediapipe_{('lite', 'full', 'heavy')[model_complexity]}"
+        self.pose = solutions.pose.Pose(
+            static_image_mode=True,
+            model_complexity=model_complexity,
+            enable_segmentation=False,
+            min_detection_confidence=min_detection_confidence
+        )
+
+    def process(self, image_rgb):
+        results = self.pose.process(image_rgb)
+        if not results.pose_landmarks:
+            return None
+        return [
+            {
+                'x': landmark.x,
+                'y': landmark.y,
+                'z': landmark.z,
+                'visibility': landmark.visibility
+            }
+            for landmark in results.pose_landmarks.landmark
+        ]
+
+    def close(self):
+        try:
+            self.pose.close()
+        except Exception:
+            pass
+
+
+class StubPoseBackend(PoseBackend):
+    """
+    确定性的测试后端
+
+    不依赖 mediapipe，根据图像内容生成固定的人体骨架：骨架位置随图像亮度重心移动，
+    身体倾斜随左右亮度差变化。同一帧总是得到同样的结果，便于测试和基准对比。
+    """
+
+    name = 'stub'
+
+    # 站立姿势的骨架模板（归一化坐标，以髋部中点为原点）
+    _TEMPLATE = {
+        0: (0.0, -0.45),
+        11: (-0.08, -0.30), 12: (0.08, -0.30),
+        13: (-0.12, -0.18), 14: (0.12, -0.18),
+        15: (-0.14, -0.06), 16: (0.14, -0.06),
+        23: (-0.06, 0.0), 24: (0.06, 0.0),
+        25: (-0.07, 0.18), 26: (0.07, 0.18),
+        27: (-0.07, 0.36), 28: (0.07, 0.36),
+    }
+
+    def process(self, image_rgb):
+        gray = image_rgb.mean(axis=2) if image_rgb.ndim == 3 else image_rgb.astype(np.float64)
+        total = gray.sum()
+        if total <= 0:
+            return None
+
+        height, width = gray.shape
+        ys, xs = np.mgrid[0:height, 0:width]
+        cx = float((xs * gray).sum() / total / width)
+        cy = float((ys * gray).sum() / total / height)
+        half = width // 2
+        left_mean = gray[:, :half].mean() if half else 0.0
+        right_mean = gray[:, half:].mean()
+        # 左右亮度差映射为 ±20° 的身体倾斜
+        lean = np.radians(20.0 * (right_mean - left_mean) / max(1.0, left_mean + right_mean))
+        cos_l, sin_l = np.cos(lean), np.sin(lean)
+
+        # 未在模板中的关键点用图像摘要生成固定的微小偏移，保证结果确定
+        seed = int.from_bytes(hashlib.md5(gray[::8, ::8].astype(np.uint8).tobytes()).digest()[:4], 'big')
+        jitter = np.random.default_rng(seed).uniform(-0.01, 0.01, size=(LANDMARK_COUNT, 2))
+
+        landmarks = []
+        for i in range(LANDMARK_COUNT):
+            dx, dy = self._TEMPLATE.get(i, self._TEMPLATE[0])
+            x = cx + dx * cos_l - dy * sin_l + jitter[i, 0]
+            y = cy + dx * sin_l + dy * cos_l + jitter[i, 1]
+            landmarks.append({
+                'x': float(x),
+                'y': float(y),
+                'z': 0.0,
+                'visibility': 1.0 if i in self._TEMPLATE else 0.5
+            })
+        return landmarks
+
+
+# 后端注册表：名称 -> 工厂函数
+POSE_BACKENDS = {
+    'mediapipe_lite': lambda: MediaPipePoseBackend(model_complexity=0),
+    'mediapipe_full': lambda: MediaPipePoseBackend(model_complexity=1),
+    'mediapipe_heavy': lambda: MediaPipePoseBackend(model_complexity=2),
+    'stub': StubPoseBackend,
+}
+
+DEFAULT_POSE_BACKEND = 'mediapipe_heavy'
+
+
+def register_pose_backend(name, factory):
+    """
+    注册姿态估计后端
+
+    Args:
+        name: 后端名称
+        factory: 无参工厂函数，返回 PoseBackend 实例
+    """
+    POSE_BACKENDS[name] = factory
+
+
+def create_pose_backend(name=DEFAULT_POSE_BACKEND):
+    """
+    创建姿态估计后端实例
+
+    Args:
+        name: 后端名称
+
+    Returns:
+        backend: PoseBackend实例
+
+    Raises:
+        ValueError: 未注册的后端
+        PoseBackendUnavailable: 后端在当前环境中不可用
+    """
+    if name not in POSE_BACKENDS:
+        raise ValueError(f"Unsupported pose backend: {name}")
+    return POSE_BACKENDS[name]()
+
+
+def available_pose_backends():
+    """
+    获取已注册的后端名称列表
+    """
+    return list(POSE_BACKENDS.keys())
@@ -0,0 +1,152 @@
+"""
+姿态估计后端基准测试
+
+在同一组帧上对比各后端的单帧延迟和关键点一致性，用于在精度和吞吐之间做取舍。
+
+用法：
+    python -m app.agent.pose_benchmark path/to/video.mp4 --backends mediapipe_lite,mediapipe_heavy
+"""
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+from app.agent.pose_backends import DEFAULT_POSE_BACKEND, available_pose_backends, create_pose_backend
+
+# 关键点一致性只比较双方可见度都高于该值的点
+VISIBILITY_THRESHOLD = 0.5
+# PCK 阈值（归一化坐标）：与参考后端的距离小于该值视为一致
+PCK_THRESHOLD = 0.05
+
+
+def benchmark_pose_backends(frame_paths, backends, reference=None, warmup=1):
+    """
+    对比多个姿态估计后端
+
+    Args:
+        frame_paths: 帧路径列表
+        backends: 后端名称列表
+        reference: 作为一致性基准的后端名称，默认使用 backends 中的第一个
+        warmup: 正式计时前的预热帧数
+
+    Returns:
+        report: {后端名称: 指标字典}
+    """
+    images = []
+    for frame_path in frame_paths:
+        image = cv2.imread(frame_path)
+        if image is not None:
+            images.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    if not images:
+        raise ValueError('No readable frames')
+
+    reference = reference or backends[0]
+    order = [reference] + [name for name in backends if name != reference]
+
+    results = {}
+    report = {}
+    for name in order:
+        try:
+            backend = create_pose_backend(name)
+        except Exception as e:
+            report[name] = {'error': str(e)}
+            continue
+
+        try:
+            for image in images[:warmup]:
+                backend.process(image)
+
+            latencies = np.empty(len(images))
+            landmarks = []
+            for i, image in enumerate(images):
+                start = time.perf_counter()
+                landmarks.append(backend.process(image))
+                latencies[i] = (time.perf_counter() - start) * 1000.0
+        finally:
+            backend.close()
+
+        results[name] = landmarks
+        detected = sum(1 for item in landmarks if item)
+        report[name] = {
+            'frames': len(images),
+            'detection_rate': detected / len(images),
+            'latency_ms_mean': float(latencies.mean()),
+            'latency_ms_p50': float(np.percentile(latencies, 50)),
+            'latency_ms_p95': float(np.percentile(latencies, 95)),
+            'throughput_fps': float(1000.0 / latencies.mean()) if latencies.mean() > 0 else None,
+        }
+
+    if reference in results:
+        for name, landmarks in results.items():
+            if name != reference:
+                report[name]['agreement'] = landmark_agreement(results[reference], landmarks)
+
+    return report
+
+
+def landmark_agreement(reference, candidate):
+    """
+    计算两组逐帧关键点的一致性
+
+    Args:
+        reference: 参考后端的逐帧关键点列表
+        candidate: 待比较后端的逐帧关键点列表
+
+    Returns:
+        agreement: 平均归一化距离、PCK 和参与比较的帧数
+    """
+    distances = []
+    frames = 0
+    for ref_frame, cand_frame in zip(reference, candidate):
+        if not ref_frame or not cand_frame:
+            continue
+        ref = np.array([[lm['x'], lm['y'], lm['visibility']] for lm in ref_frame])
+        cand = np.array([[lm['x'], lm['y'], lm['visibility']] for lm in cand_frame])
+        count = min(len(ref), len(cand))
+        ref, cand = ref[:count], cand[:count]
+        visible = (ref[:, 2] > VISIBILITY_THRESHOLD) & (cand[:, 2] > VISIBILITY_THRESHOLD)
+        if not np.any(visible):
+            continue
+        frames += 1
+        distances.append(np.linalg.norm(ref[visible, :2] - cand[visible, :2], axis=1))
+
+    if not distances:
+        return {'frames': 0, 'mean_distance': None, 'pck': None}
+
+    distances = np.concatenate(distances)
+    return {
+        'frames': frames,
+        'mean_distance': float(distances.mean()),
+        'pck': float(np.mean(distances < PCK_THRESHOLD)),
+    }
+
+
+def main():
+    from app.agent.video_processor import VideoProcessor
+
+    parser = argparse.ArgumentParser(description='Benchmark pose estimation backends')
+    parser.add_argument('video', help='视频文件路径')
+    parser.add_argument(
+        '--backends',
+        default=','.join(available_pose_backends()),
+        help='逗号分隔的后端名称'
+    )
+    parser.add_argument('--reference', default=DEFAULT_POSE_BACKEND, help='一致性基准后端')
+    parser.add_argument('--max-frames', type=int, default=50, help='最多抽取的帧数')
+    args = parser.parse_args()
+
+    video_processor = VideoProcessor()
+    frames = video_processor.extract_frames(args.video, max_frames=args.max_frames)
+    try:
+        backends = [name.strip() for name in args.backends.split(',') if name.strip()]
+        reference = args.reference if args.reference in backends else None
+        report = benchmark_pose_backends(frames, backends, reference=reference)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    finally:
+        video_processor.cleanup_frames(frames)
+
+
+if __name__ == '__main__':
+    main()
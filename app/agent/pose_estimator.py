@@ -1,64 +1,48 @@
 import cv2
+import queue
+import threading
+from contextlib import contextmanager
+
 import numpy as np
 
-# 尝试不同的mediapipe导入方式
-try:
-    import mediapipe as mp
-    from mediapipe.tasks import python
-    from mediapipe.tasks.python import vision
-    has_mediapipe = True
-except ImportError:
-    has_mediapipe = False
+from app.agent.frame_hash import dhash, phash
+
+from app.agent.pose_backends import DEFAULT_POSE_BACKEND, create_pose_backend
 
 class PoseEstimator:
-    def __init__(self):
-        self.has_mediapipe = has_mediapipe
-        self.pose = None
+    def __init__(self, backend=DEFAULT_POSE_BACKEND):
+        self.backend_name = backend
+        self.backend = None
         
-        if has_mediapipe:
-            try:
-                # 尝试使用较新版本的mediapipe API
-                from mediapipe import solutions
-                self.mp_pose = solutions.pose
-                self.pose = self.mp_pose.Pose(
-                    static_image_mode=True,
-                    model_complexity=2,
-                    enable_segmentation=False,
-                    min_detection_confidence=0.5
-                )
-                self.mp_drawing = solutions.drawing_utils
-            except ImportError:
-                # 尝试使用旧版本的mediapipe API
-                try:
-                    self.mp_pose = mp.solutions.pose
-                    self.pose = self.mp_pose.Pose(
-                        static_image_mode=True,
-                        model_complexity=2,
-                        enable_segmentation=False,
-                        min_detection_confidence=0.5
-                    )
-                    self.mp_drawing = mp.solutions.drawing_utils
-                except Exception:
-                    self.pose = None
+        try:
+            self.backend = create_pose_backend(backend)
+        except ValueError:
+            raise
+        except Exception as e:
+            # 后端不可用时使用模拟的姿态数据，并明确记录原因
+            print(f"Warning: pose backend '{backend}' is unavailable, falling back to simulated pose data: {str(e)}")
     
-    def estimate_pose(self, frames):
+    def estimate_pose(self, frames, hash_index=None, hash_namespace=None):
         """
         对视频帧进行姿态估计
         
         Args:
             frames: 帧路径列表
+            hash_index: 可选的 PoseHashIndex，与之前视频中近似重复的帧直接复用已有的姿态结果
+            hash_namespace: 复用范围（如用户ID），提供 hash_index 时必须指定，不同范围之间不复用
             
         Returns:
             pose_data: 姿态数据列表
         """
         pose_data = []
         
-        # 检查mediapipe是否可用
-        if not self.pose:
-            # 如果mediapipe不可用，返回模拟的姿态数据
+        # 检查姿态估计后端是否可用
+        if not self.backend:
+            # 如果后端不可用，返回模拟的姿态数据（标记 simulated 以便下游区分）
             for frame_path in frames:
                 pose_data.append({
                     'frame_path': frame_path,
+                    'simulated': True,
                     'landmarks': [],
                     'angles': {
                         'left_knee': 120.0,
@@ -71,30 +55,40 @@ class PoseEstimator:
                 })
             return pose_data
         
+        use_index = hash_index is not None and hash_namespace is not None
+        namespace = (self.backend_name, hash_namespace)
+        # 本视频的结果在全部帧处理完后才写入索引：同一视频的相邻帧背景相同、哈希接近，
+        # 互相复用会把不同的动作当成同一个姿态
+        new_entries = []
+        
         for frame_path in frames:
             # 读取帧
             image = cv2.imread(frame_path)
             if image is None:
                 continue
             
+            # 与之前视频近似重复的帧直接复用姿态结果
+            frame_hash = None
+            if use_index:
+                frame_hash = (dhash(image), phash(image))
+                cached = hash_index.lookup(frame_hash[0], frame_hash[1], namespace=namespace)
+                if cached is not None:
+                    pose_data.append({
+                        'frame_path': frame_path,
+                        'landmarks': cached['landmarks'],
+                        'angles': cached['angles'],
+                        'reused': True
+                    })
+                    continue
+            
             try:
                 # 转换为RGB
                 image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
                 
-                # 进行姿态估计
-                results = self.pose.process(image_rgb)
+                # 进行姿态估计，后端返回关键点列表
+                landmarks = self.backend.process(image_rgb)
                 
-                if results.pose_landmarks:
-                    # 提取关键点
-                    landmarks = []
-                    for landmark in results.pose_landmarks.landmark:
-                        landmarks.append({
-                            'x': landmark.x,
-                            'y': landmark.y,
-                            'z': landmark.z,
-                            'visibility': landmark.visibility
-                        })
-                    
+                if landmarks:
                     # 计算关键角度
                     angles = self._calculate_angles(landmarks)
                     
@@ -104,10 +98,13 @@ class PoseEstimator:
                         'landmarks': landmarks,
                         'angles': angles
                     })
+                    if frame_hash is not None:
+                        new_entries.append((frame_hash, {'landmarks': landmarks, 'angles': angles}))
             except Exception as e:
                 # 如果处理失败，返回模拟的姿态数据
                 pose_data.append({
                     'frame_path': frame_path,
+                    'simulated': True,
                     'landmarks': [],
                     'angles': {
                         'left_knee': 120.0,
@@ -119,6 +116,9 @@ class PoseEstimator:
                     }
                 })
         
+        for (frame_dhash, frame_phash), result in new_entries:
+            hash_index.add(frame_dhash, frame_phash, result, namespace=namespace)
+        
         return pose_data
     
     def _calculate_angles(self, landmarks):
@@ -193,17 +193,17 @@ class PoseEstimator:
         计算三点之间的角度
         
         Args:
-            a: 第一点
+            a: 第一点（包含x、y的字典）
             b: 第二点（顶点）
             c: 第三点
             
         Returns:
             angle: 角度值
         """
-        # 转换为numpy数组
-        a = np.array([a.x, a.y])
-        b = np.array([b.x, b.y])
-        c = np.array([c.x, c.y])
+        # 转换为numpy数组（关键点为 estimate_pose 生成的字典）
+        a = np.array([a['x'], a['y']])
+        b = np.array([b['x'], b['y']])
+        c = np.array([c['x'], c['y']])
         
         # 计算向量
         ba = a - b
@@ -247,14 +247,12 @@ class PoseEstimator:
         if 'landmarks' in pose_data:
             # 创建姿态关键点对象
             landmarks = pose_data['landmarks']
-            pose_landmarks = self.mp_pose.PoseLandmark
             
             # 绘制关键点
-            for i, landmark in enumerate(landmarks):
-                if i < len(pose_landmarks):
-                    x = int(landmark['x'] * image.shape[1])
-                    y = int(landmark['y'] * image.shape[0])
-                    cv2.circle(image, (x, y), 5, (0, 255, 0), -1)
+            for landmark in landmarks:
+                x = int(landmark['x'] * image.shape[1])
+                y = int(landmark['y'] * image.shape[0])
+                cv2.circle(image, (x, y), 5, (0, 255, 0), -1)
         
         return image
     
@@ -262,8 +260,82 @@ class PoseEstimator:
         """
         关闭姿态估计模型
         """
-        if self.pose:
+        if self.backend:
+            self.backend.close()
+
+
+class PoseEstimatorPool:
+    """
+    姿态估计模型池
+
+    MediaPipe 模型实例不是线程安全的，且初始化开销较大。模型池按需创建最多 size 个
+    PoseEstimator 并在任务之间复用，多个分析线程各自借用一个已预热的实例。
+    """
+
+    def __init__(self, size=2, backend=DEFAULT_POSE_BACKEND):
+        self.size = size
+        self.backend = backend
+        self.factory = lambda: PoseEstimator(backend)
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def lease(self):
+        """
+        借用一个姿态估计实例，用完自动归还
+
+        Returns:
+            estimator: PoseEstimator实例
+        """
+        estimator = self._acquire()
+        try:
+            yield estimator
+        finally:
+            self._idle.put(estimator)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+
+        if create:
             try:
-                self.pose.close()
+                return self.factory()
             except Exception:
-                pass
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get()
+
+    def get_stats(self):
+        """
+        获取模型池统计信息
+        """
+        return {
+            'backend': self.backend,
+            'size': self.size,
+            'created': self._created,
+            'idle': self._idle.qsize(),
+        }
+
+    def close(self):
+        """
+        关闭所有空闲的姿态估计实例
+        """
+        while True:
+            try:
+                estimator = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            estimator.close()
+            with self._lock:
+                self._created -= 1
@@ -0,0 +1,255 @@
+import warnings
+
+import numpy as np
+
+from app.agent.token_utils import estimate_tokens
+
+# 关节角度顺序，与 PoseEstimator._calculate_angles 的输出一致
+JOINTS = ['left_knee', 'right_knee', 'left_hip', 'right_hip', 'left_shoulder', 'right_shoulder']
+
+JOINT_LABELS = {
+    'knee': '膝',
+    'hip': '髋',
+    'shoulder': '肩',
+}
+
+# MediaPipe Pose 关键点索引
+LEFT_HIP, RIGHT_HIP = 23, 24
+LEFT_ANKLE, RIGHT_ANKLE = 27, 28
+
+# 身体倾斜角低于该值视为居中，避免抖动被误判为换刃
+LEAN_DEADBAND = 5.0
+
+
+class PoseFeatureExtractor:
+    """
+    姿态特征提取器
+
+    将任意长度的 pose_data 压缩为固定大小的描述子（关节角分位数、活动范围、
+    左右对称性、转弯节奏、立刃角近似），并渲染为有token预算的prompt片段，
+    使评价prompt的长度与视频时长无关。
+    """
+
+    def __init__(self, percentiles=(10, 50, 90), token_budget=400):
+        self.percentiles = tuple(percentiles)
+        self.token_budget = token_budget
+
+    def extract(self, pose_data, seconds_per_frame=None):
+        """
+        提取固定大小的姿态描述子
+
+        Args:
+            pose_data: 姿态数据列表
+            seconds_per_frame: 相邻采样帧之间的时间间隔（秒），未知时为None
+
+        Returns:
+            descriptor: 姿态描述子字典
+        """
+        angles = self._angle_matrix(pose_data)
+        descriptor = {
+            'frame_count': len(pose_data),
+            'valid_frames': int(np.sum(~np.all(np.isnan(angles), axis=1))) if angles.size else 0,
+            'joints': {},
+            'symmetry': {},
+            'lean': None,
+            'turns': None,
+        }
+
+        if angles.size and descriptor['valid_frames']:
+            descriptor['joints'] = self._joint_stats(angles)
+            descriptor['symmetry'] = self._symmetry(angles)
+
+        points = self._landmark_matrix(pose_data)
+        if points is not None:
+            lean = self._lean_angles(points)
+            if np.any(~np.isnan(lean)):
+                descriptor['lean'] = self._lean_stats(lean)
+                descriptor['turns'] = self._turn_stats(lean, seconds_per_frame)
+
+        return descriptor
+
+    def render_prompt_section(self, descriptor, token_budget=None):
+        """
+        将描述子渲染为prompt片段，按重要性依次加入，直到达到token预算
+
+        Args:
+            descriptor: 姿态描述子
+            token_budget: token预算，默认使用实例配置
+
+        Returns:
+            section: prompt片段
+        """
+        budget = token_budget if token_budget is not None else self.token_budget
+        lines = self._render_lines(descriptor)
+        if not lines:
+            return ''
+
+        section_lines = []
+        used = 0
+        for line in lines:
+            cost = estimate_tokens(line) + 1
+            if used + cost > budget:
+                break
+            section_lines.append(line)
+            used += cost
+
+        return '\n'.join(section_lines) + '\n\n' if section_lines else ''
+
+    def _render_lines(self, descriptor):
+        """
+        按重要性排序生成prompt行
+        """
+        if not descriptor['joints'] and descriptor['lean'] is None:
+            return []
+
+        p_labels = '/'.join(f"P{p}" for p in self.percentiles)
+        lines = [
+            "## 姿态数据分析",
+            f"- 采样帧数: {descriptor['frame_count']}（有效 {descriptor['valid_frames']}）",
+        ]
+
+        for part, label in JOINT_LABELS.items():
+            for side, side_label in (('left', '左'), ('right', '右')):
+                stats = descriptor['joints'].get(f'{side}_{part}')
+                if not stats:
+                    continue
+                values = '/'.join(f"{v:.0f}" for v in stats['percentiles'])
+                lines.append(
+                    f"- {side_label}{label}角 {p_labels}: {values}°，活动范围 {stats['rom']:.0f}°"
+                )
+
+        if descriptor['symmetry']:
+            parts = [
+                f"{JOINT_LABELS[part]} {value:.0f}%"
+                for part, value in descriptor['symmetry'].items()
+            ]
+            lines.append(f"- 左右不对称指数（越小越对称）: {'，'.join(parts)}")
+
+        lean = descriptor['lean']
+        if lean:
+            lines.append(
+                f"- 身体倾斜（立刃角近似）: 左倾P90 {lean['left_p90']:.0f}°，右倾P90 {lean['right_p90']:.0f}°，"
+                f"平均绝对倾斜 {lean['mean_abs']:.0f}°"
+            )
+
+        turns = descriptor['turns']
+        if turns:
+            if turns.get('per_minute') is not None:
+                lines.append(f"- 转弯节奏: {turns['count']} 次换刃，约 {turns['per_minute']:.0f} 次/分钟")
+            else:
+                lines.append(f"- 转弯节奏: {turns['count']} 次换刃，平均每 {turns['frames_per_turn']:.1f} 帧一次")
+
+        return lines
+
+    def _angle_matrix(self, pose_data):
+        """
+        构建 帧数 × 关节 的角度矩阵，缺失值为NaN
+        """
+        matrix = np.full((len(pose_data), len(JOINTS)), np.nan, dtype=np.float64)
+        for i, data in enumerate(pose_data):
+            angles = data.get('angles') or {}
+            for j, joint in enumerate(JOINTS):
+                value = angles.get(joint)
+                if value is not None:
+                    matrix[i, j] = value
+        return matrix
+
+    def _joint_stats(self, angles):
+        """
+        计算每个关节的分位数和活动范围（P95-P5）
+        """
+        stats = {}
+        valid = ~np.all(np.isnan(angles), axis=0)
+        if not np.any(valid):
+            return stats
+
+        columns = angles[:, valid]
+        percentiles = np.nanpercentile(columns, self.percentiles, axis=0)
+        p5, p95 = np.nanpercentile(columns, [5, 95], axis=0)
+
+        for k, j in enumerate(np.flatnonzero(valid)):
+            stats[JOINTS[j]] = {
+                'percentiles': [float(v) for v in percentiles[:, k]],
+                'rom': float(p95[k] - p5[k]),
+            }
+        return stats
+
+    def _symmetry(self, angles):
+        """
+        计算左右对称指数：|左-右| 的均值占左右均值的百分比
+        """
+        symmetry = {}
+        left = angles[:, 0::2]
+        right = angles[:, 1::2]
+        diff = np.abs(left - right)
+        mean = (left + right) / 2.0
+        with warnings.catch_warnings(), np.errstate(invalid='ignore', divide='ignore'):
+            # 某个关节在所有帧都缺失时 nanmean 会告警，结果为NaN并在下面被过滤
+            warnings.simplefilter('ignore', RuntimeWarning)
+            index = np.nanmean(diff, axis=0) / np.nanmean(mean, axis=0) * 100.0
+        for k, part in enumerate(JOINT_LABELS):
+            if np.isfinite(index[k]):
+                symmetry[part] = float(index[k])
+        return symmetry
+
+    def _landmark_matrix(self, pose_data):
+        """
+        构建 帧数 × 关键点 × 2 的坐标矩阵，缺失帧为NaN；没有任何关键点时返回None
+        """
+        count = max((len(data.get('landmarks') or []) for data in pose_data), default=0)
+        if count <= max(LEFT_ANKLE, RIGHT_ANKLE):
+            return None
+
+        points = np.full((len(pose_data), count, 2), np.nan, dtype=np.float64)
+        for i, data in enumerate(pose_data):
+            landmarks = data.get('landmarks') or []
+            if len(landmarks) == count:
+                points[i] = [(lm['x'], lm['y']) for lm in landmarks]
+        return points
+
+    def _lean_angles(self, points):
+        """
+        计算每帧身体相对竖直方向的倾斜角（踝中点 -> 髋中点），向右为正
+        """
+        hip_mid = (points[:, LEFT_HIP] + points[:, RIGHT_HIP]) / 2.0
+        ankle_mid = (points[:, LEFT_ANKLE] + points[:, RIGHT_ANKLE]) / 2.0
+        vector = hip_mid - ankle_mid
+        # 图像坐标系y轴向下，竖直向上对应 (0, -1)
+        return np.degrees(np.arctan2(vector[:, 0], -vector[:, 1]))
+
+    def _lean_stats(self, lean):
+        """
+        统计左右倾斜幅度
+        """
+        valid = lean[~np.isnan(lean)]
+        left = -valid[valid < 0]
+        right = valid[valid > 0]
+        return {
+            'left_p90': float(np.percentile(left, 90)) if left.size else 0.0,
+            'right_p90': float(np.percentile(right, 90)) if right.size else 0.0,
+            'mean_abs': float(np.mean(np.abs(valid))),
+        }
+
+    def _turn_stats(self, lean, seconds_per_frame):
+        """
+        根据倾斜方向的切换次数估计转弯节奏
+        """
+        valid = lean[~np.isnan(lean)]
+        if valid.size < 3:
+            return None
+
+        # 3帧滑动平均平滑抖动，再去掉死区内的帧，只保留明确的左右倾斜方向
+        smoothed = np.convolve(valid, np.ones(3) / 3.0, mode='same')
+        signs = np.sign(smoothed)
+        signs[np.abs(smoothed) < LEAN_DEADBAND] = 0
+        signs = signs[signs != 0]
+        count = int(np.count_nonzero(np.diff(signs))) if signs.size > 1 else 0
+
+        stats = {
+            'count': count,
+            'frames_per_turn': float(valid.size / count) if count else float(valid.size),
+            'per_minute': None,
+        }
+        if seconds_per_frame and count:
+            stats['per_minute'] = count / (lean.size * seconds_per_frame) * 60.0
+        return stats
@@ -0,0 +1,256 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import Runnable
+
+
+def _message_payload(message):
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content, sort_keys=True)
+    return [message.type, content]
+
+
+def prompt_cache_key(provider, model, temperature, messages):
+    """
+    计算LLM调用的确定性缓存键
+
+    第一条（系统提示词）和最后一条（当前输入）消息原样参与哈希，中间的上下文消息
+    （摘要、学习计划、对话历史）先单独计算摘要，两次调用只有在模型参数、提示词和
+    上下文都完全相同时才得到同一个键。
+
+    Args:
+        provider: 模型提供商
+        model: 模型名称
+        temperature: 采样温度
+        messages: 渲染后的消息列表
+
+    Returns:
+        key: sha256 十六进制字符串
+    """
+    payloads = [_message_payload(message) for message in messages]
+    rendered = [payloads[0], payloads[-1]] if len(payloads) > 1 else payloads
+    history = payloads[1:-1]
+    history_digest = hashlib.sha256(
+        json.dumps(history, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    ).hexdigest() if history else ''
+
+    key_data = {
+        'provider': provider,
+        'model': model,
+        'temperature': temperature,
+        'messages': rendered,
+        'history': history_digest,
+    }
+    return hashlib.sha256(
+        json.dumps(key_data, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    ).hexdigest()
+
+
+class PromptCache:
+    """
+    LLM调用的精确匹配缓存
+
+    内存LRU为第一层；配置 sqlite_path 时增加SQLite第二层，进程重启后仍可命中，
+    第二层命中的条目会提升回内存。每个条目有自己的过期时间。
+    """
+
+    def __init__(self, max_entries=1024, default_ttl=3600, sqlite_path=None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.sqlite_path = sqlite_path
+        # 缓存键 -> (回复, 过期时间)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_lock = threading.Lock()
+        if sqlite_path:
+            os.makedirs(os.path.dirname(os.path.abspath(sqlite_path)), exist_ok=True)
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS prompt_cache ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            self._db.execute('CREATE INDEX IF NOT EXISTS ix_prompt_cache_expires_at ON prompt_cache (expires_at)')
+            self._db.commit()
+        self.stats = {'memory_hits': 0, 'sqlite_hits': 0, 'misses': 0, 'stores': 0, 'bypassed': 0}
+
+    def get(self, key):
+        """
+        读取缓存
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            value: 缓存的回复；不存在或已过期时返回None
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.stats['memory_hits'] += 1
+                    return entry[0]
+                del self._entries[key]
+
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    'SELECT value, expires_at FROM prompt_cache WHERE key = ? AND expires_at > ?',
+                    (key, now)
+                ).fetchone()
+            if row is not None:
+                self._set_memory(key, row[0], row[1])
+                with self._lock:
+                    self.stats['sqlite_hits'] += 1
+                return row[0]
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def set(self, key, value, ttl=None):
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            value: 回复
+            ttl: 有效期（秒），默认使用 default_ttl
+        """
+        expires_at = time.time() + (ttl if ttl is not None else self.default_ttl)
+        self._set_memory(key, value, expires_at)
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO prompt_cache (key, value, expires_at) VALUES (?, ?, ?)',
+                    (key, value, expires_at)
+                )
+                self._db.execute('DELETE FROM prompt_cache WHERE expires_at <= ?', (time.time(),))
+                self._db.commit()
+        with self._lock:
+            self.stats['stores'] += 1
+
+    def record_bypass(self):
+        with self._lock:
+            self.stats['bypassed'] += 1
+
+    def wrap(self, llm, provider, model, temperature, ttl=None):
+        """
+        给LLM加上缓存，得到“提示词 -> 回复文本”的可运行对象
+
+        返回的可运行对象支持 invoke/stream 和 ainvoke/astream：命中时直接返回（或一次
+        输出）完整回复；未命中时 invoke/ainvoke 调用 LLM 的 invoke/ainvoke（保留
+        RoutedLLM 的对冲请求），stream/astream 透传流式输出，完整生成后写入缓存。
+        RoutedLLM 故障切换或对冲到备用模型时，回复不是 provider/model 生成的，不写入缓存。
+
+        Args:
+            llm: 聊天模型（通常为 RoutedLLM）
+            provider: 模型提供商
+            model: 模型名称
+            temperature: 采样温度
+            ttl: 条目有效期（秒）
+
+        Returns:
+            runnable: 带缓存的可运行对象
+        """
+        return _CachedGenerate(self, llm, provider, model, temperature, ttl)
+
+    def get_stats(self):
+        """
+        获取缓存统计信息
+        """
+        with self._lock:
+            lookups = self.stats['memory_hits'] + self.stats['sqlite_hits'] + self.stats['misses']
+            hits = self.stats['memory_hits'] + self.stats['sqlite_hits']
+            return dict(
+                self.stats,
+                size=len(self._entries),
+                sqlite_enabled=self._db is not None,
+                hit_rate=hits / lookups if lookups else 0.0,
+            )
+
+    def _set_memory(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class _CachedGenerate(Runnable):
+    """
+    PromptCache.wrap 返回的带缓存的可运行对象
+    """
+
+    def __init__(self, cache, llm, provider, model, temperature, ttl=None):
+        self.cache = cache
+        self.llm = llm
+        self.provider = provider
+        self.model = model
+        self.temperature = temperature
+        self.ttl = ttl
+
+    def invoke(self, input, config=None, **kwargs):
+        key, cached = self._lookup(input)
+        if cached is not None:
+            return cached
+        served = []
+        result = self._generate(served).invoke(input, config, **kwargs)
+        self._store(key, result, served)
+        return result
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        key, cached = self._lookup(input)
+        if cached is not None:
+            return cached
+        served = []
+        result = await self._generate(served).ainvoke(input, config, **kwargs)
+        self._store(key, result, served)
+        return result
+
+    def stream(self, input, config=None, **kwargs):
+        key, cached = self._lookup(input)
+        if cached is not None:
+            yield cached
+            return
+        served = []
+        chunks = []
+        for chunk in self._generate(served).stream(input, config, **kwargs):
+            chunks.append(chunk)
+            yield chunk
+        self._store(key, ''.join(chunks), served)
+
+    async def astream(self, input, config=None, **kwargs):
+        key, cached = self._lookup(input)
+        if cached is not None:
+            yield cached
+            return
+        served = []
+        chunks = []
+        async for chunk in self._generate(served).astream(input, config, **kwargs):
+            chunks.append(chunk)
+            yield chunk
+        self._store(key, ''.join(chunks), served)
+
+    def _generate(self, served):
+        # 每次调用单独记录实际生成回复的模型
+        llm = self.llm.with_listener(served.append) if hasattr(self.llm, 'with_listener') else self.llm
+        return llm | StrOutputParser()
+
+    def _store(self, key, value, served):
+        route_key = getattr(self.llm, 'route_key', None)
+        if route_key is not None and any(served_key != route_key for served_key in served):
+            # 备用模型的回复不能作为首选模型的结果缓存
+            return
+        self.cache.set(key, value, self.ttl)
+
+    def _lookup(self, prompt_value):
+        key = prompt_cache_key(self.provider, self.model, self.temperature, prompt_value.to_messages())
+        return key, self.cache.get(key)
@@ -0,0 +1,243 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+
+# 调用优先级：数值越小越优先
+PRIORITIES = {
+    'chat': 0,
+    'plan': 1,
+    'background': 2,
+}
+DEFAULT_PRIORITY = 'chat'
+
+# 各优先级在队列中的最长等待时间（秒），超时后放弃（由路由层切换到备用提供商）
+DEFAULT_MAX_WAIT = {
+    'chat': 15.0,
+    'plan': 60.0,
+    'background': 300.0,
+}
+
+# 异步等待时的最长轮询间隔（秒）
+_ASYNC_POLL_INTERVAL = 0.05
+
+
+class RateLimitTimeout(RuntimeError):
+    """
+    在限流队列中等待超时
+    """
+
+
+def _new_stats():
+    return {'granted': 0, 'queued': 0, 'timeouts': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+
+
+class _TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated_at = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount):
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+
+class _ModelLimiter:
+    """
+    单个 提供商/模型 的令牌桶（请求数/分钟 和 token数/分钟）和优先级队列
+    """
+
+    def __init__(self, rpm=None, tpm=None):
+        self.requests = _TokenBucket(rpm) if rpm else None
+        self.tokens = _TokenBucket(tpm) if tpm else None
+        self.queue = []
+        self.stats = {priority: _new_stats() for priority in PRIORITIES}
+
+    def wait_time(self, tokens, now):
+        wait = 0.0
+        for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+            if bucket is not None:
+                bucket.refill(now)
+                wait = max(wait, bucket.wait_time(amount))
+        return wait
+
+    def consume(self, tokens):
+        if self.requests is not None:
+            self.requests.level -= 1
+        if self.tokens is not None:
+            self.tokens.level -= min(tokens, self.tokens.capacity)
+
+
+class LLMRateLimiter:
+    """
+    LLM 调用限流
+
+    每个 提供商/模型 各有一个请求数令牌桶和一个token数令牌桶。桶内余量不足时按优先级
+    排队（交互聊天 > 学习计划 > 后台视频评价），同一优先级先到先得；队首请求获得
+    额度前，后面的请求即使额度够用也不会插队，避免大请求被饿死。
+    """
+
+    def __init__(self, limits=None, max_wait=None):
+        # 限制配置：{'openai': {'rpm': 500, 'tpm': 200000}, 'openai:gpt-4': {...}}
+        self.limits = dict(limits or {})
+        self.max_wait = dict(DEFAULT_MAX_WAIT, **(max_wait or {}))
+        self._limiters = {}
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def configure(self, limits=None, max_wait=None):
+        """
+        更新限流配置（已创建的令牌桶会按新配置重建）
+        """
+        with self._cond:
+            if limits is not None:
+                self.limits = dict(limits)
+                self._limiters.clear()
+            if max_wait:
+                self.max_wait.update(max_wait)
+
+    def acquire(self, key, tokens, priority=DEFAULT_PRIORITY):
+        """
+        获取一次调用的额度，额度不足时阻塞等待
+
+        Args:
+            key: (提供商, 模型)
+            tokens: 预计消耗的token数（输入 + 预计输出）
+            priority: 优先级（chat/plan/background）
+
+        Returns:
+            waited: 排队等待的时间（秒）
+
+        Raises:
+            RateLimitTimeout: 等待超过该优先级的最长等待时间
+        """
+        started_at = time.monotonic()
+        deadline = started_at + self.max_wait.get(priority, DEFAULT_MAX_WAIT['background'])
+        with self._cond:
+            limiter, entry = self._enqueue(key, tokens, priority)
+            if limiter is None:
+                return 0.0
+            while True:
+                delay = self._try_grant(limiter, entry, time.monotonic())
+                if delay is None:
+                    return self._granted(limiter, priority, started_at)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._abandon(limiter, entry, priority)
+                    raise RateLimitTimeout(f"Rate limit queue timeout for {key[0]}:{key[1]}")
+                self._cond.wait(timeout=min(delay, remaining))
+
+    async def aacquire(self, key, tokens, priority=DEFAULT_PRIORITY):
+        """
+        异步获取一次调用的额度，语义与 acquire 相同，等待期间不占用线程
+        """
+        started_at = time.monotonic()
+        deadline = started_at + self.max_wait.get(priority, DEFAULT_MAX_WAIT['background'])
+        with self._cond:
+            limiter, entry = self._enqueue(key, tokens, priority)
+            if limiter is None:
+                return 0.0
+        while True:
+            with self._cond:
+                delay = self._try_grant(limiter, entry, time.monotonic())
+                if delay is None:
+                    return self._granted(limiter, priority, started_at)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._abandon(limiter, entry, priority)
+                    raise RateLimitTimeout(f"Rate limit queue timeout for {key[0]}:{key[1]}")
+            await asyncio.sleep(min(delay, remaining, _ASYNC_POLL_INTERVAL))
+
+    def settle(self, key, estimated_tokens, actual_tokens):
+        """
+        调用完成后按实际token用量修正token桶
+        """
+        if actual_tokens is None:
+            return
+        with self._cond:
+            limiter = self._limiters.get(key)
+            if limiter is None or limiter.tokens is None:
+                return
+            bucket = limiter.tokens
+            bucket.level = min(bucket.capacity, bucket.level + estimated_tokens - actual_tokens)
+            self._cond.notify_all()
+
+    def get_stats(self):
+        """
+        获取各 提供商/模型 的排队统计
+        """
+        with self._cond:
+            result = {}
+            for (provider, model), limiter in self._limiters.items():
+                by_priority = {}
+                for priority, stats in limiter.stats.items():
+                    granted = stats['granted']
+                    by_priority[priority] = dict(
+                        stats,
+                        avg_wait_seconds=stats['wait_seconds'] / granted if granted else 0.0,
+                    )
+                result[f"{provider}:{model}"] = {
+                    'queue_depth': len(limiter.queue),
+                    'requests_available': round(limiter.requests.level, 2) if limiter.requests else None,
+                    'tokens_available': round(limiter.tokens.level) if limiter.tokens else None,
+                    'priorities': by_priority,
+                }
+            return result
+
+    def _limits_for(self, key):
+        provider, model = key
+        return self.limits.get(f"{provider}:{model}") or self.limits.get(provider)
+
+    def _enqueue(self, key, tokens, priority):
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            limits = self._limits_for(key)
+            if not limits or not (limits.get('rpm') or limits.get('tpm')):
+                return None, None
+            limiter = self._limiters[key] = _ModelLimiter(limits.get('rpm'), limits.get('tpm'))
+
+        # 队列条目：(优先级, 入队序号, 预计token数)
+        entry = (PRIORITIES.get(priority, len(PRIORITIES)), next(self._sequence), tokens)
+        heapq.heappush(limiter.queue, entry)
+        return limiter, entry
+
+    def _try_grant(self, limiter, entry, now):
+        """
+        队首且额度足够时扣除额度并出队；否则返回需要等待的秒数
+        """
+        if limiter.queue[0] is not entry:
+            # 不是队首：等队首获得额度后再检查
+            return max(_ASYNC_POLL_INTERVAL, limiter.wait_time(limiter.queue[0][2], now))
+        delay = limiter.wait_time(entry[2], now)
+        if delay > 0:
+            return delay
+        limiter.consume(entry[2])
+        heapq.heappop(limiter.queue)
+        # 唤醒下一个队首
+        self._cond.notify_all()
+        return None
+
+    def _granted(self, limiter, priority, started_at):
+        waited = time.monotonic() - started_at
+        stats = limiter.stats.setdefault(priority, _new_stats())
+        stats['granted'] += 1
+        if waited > 0.001:
+            stats['queued'] += 1
+        stats['wait_seconds'] += waited
+        stats['max_wait_seconds'] = max(stats['max_wait_seconds'], waited)
+        return waited
+
+    def _abandon(self, limiter, entry, priority):
+        limiter.queue.remove(entry)
+        heapq.heapify(limiter.queue)
+        limiter.stats.setdefault(priority, _new_stats())['timeouts'] += 1
+        self._cond.notify_all()
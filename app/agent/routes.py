@@ -1,25 +1,131 @@
-from flask import Blueprint, jsonify, request, current_app
+from flask import Blueprint, Response, jsonify, request, current_app, make_response, send_file
+from werkzeug.utils import secure_filename
+import hmac
+import mimetypes
 import os
+import secrets
+import threading
 import uuid
 from datetime import datetime
 
 from app.agent.video_processor import VideoProcessor
-from app.agent.pose_estimator import PoseEstimator
+from app.agent.pose_estimator import PoseEstimatorPool
+from app.agent.pose_backends import DEFAULT_POSE_BACKEND, POSE_BACKENDS
 from app.agent.model_evaluator import ModelEvaluator
-from app.agent.agent_memory import AgentMemory
+from app.agent.agent_memory import DEFAULT_HISTORY_PAGE_SIZE, AgentMemory
 from app.agent.chat_manager import ChatManager
+from app.agent.frame_preview import FramePreviewCache
+from app.agent.frame_hash import PoseHashIndex
+from app.agent.task_store import TaskPayloadStore
+from app.agent.idempotency import IdempotencyStore, idempotent
+from app.agent.analysis_scheduler import AnalysisScheduler
+from app.agent.admission import AdmissionController, AdmissionRejected, rejection_response
+from app.agent.streaming import stream_with_keepalive
+from app.agent.summarizer import ConversationSummarizer
+from app.agent.semantic_cache import SemanticCache
+from app.agent.prompt_cache import PromptCache
+from app.agent.plan_library import PlanLibrary
+from app.agent.instance_registry import InstanceRegistry
+from app.agent.memory_store import SQLMemoryStore
 from app.agent.llm_manager import llm_manager
+from app.agent.llm_router import llm_router
 
 # 创建蓝图
 bp = Blueprint('agent', __name__, url_prefix='/api/agent')
 
 # 初始化各个模块
 video_processor = VideoProcessor()
-pose_estimator = PoseEstimator()
+# 姿态估计模型池（每个后端一个）：分析线程之间复用已预热的模型实例
+pose_estimator_pools = {}
+# 帧感知哈希索引：同一用户重新上传的近似重复帧复用已有的姿态结果
+pose_hash_index = PoseHashIndex()
 agent_memory = AgentMemory()
+# 幂等键响应存储：移动端重试上传/分析请求时返回原始结果
+idempotency_store = IdempotencyStore(ttl=3600)
+# 视频分析调度器：后台线程按最短作业优先执行分析任务
+analysis_scheduler = AnalysisScheduler()
+# 准入控制：按端点类别（video/chat/plan）限制并发和排队深度
+admission = AdmissionController()
+# 通用问题的语义回复缓存（按配置创建，未启用时为None）
+semantic_cache = None
+# LLM调用的精确匹配缓存（按配置创建，未启用时为None）
+prompt_cache = None
+# 预生成的学习计划模板库
+plan_library = PlanLibrary()
 
-# 创建模型管理器的全局实例字典，用于存储不同用户的ChatManager实例
-chat_managers = {}
+
+@bp.record_once
+def _configure_agent(state):
+    """
+    注册蓝图时根据应用配置初始化各模块
+    """
+    global semantic_cache, prompt_cache
+    config = state.app.config
+    analysis_scheduler.max_workers = config.get('ANALYSIS_WORKERS', analysis_scheduler.max_workers)
+    pose_hash_index.max_distance = config.get('POSE_HASH_MAX_DISTANCE', pose_hash_index.max_distance)
+    pose_hash_index.confirm_distance = config.get('POSE_HASH_CONFIRM_DISTANCE', pose_hash_index.confirm_distance)
+    analysis_scheduler.aging_rate = config.get('ANALYSIS_AGING_RATE', analysis_scheduler.aging_rate)
+    analysis_scheduler.fairness_penalty = config.get('ANALYSIS_FAIRNESS_PENALTY', analysis_scheduler.fairness_penalty)
+    if config.get('AGENT_ADMISSION_LIMITS'):
+        admission.configure(config['AGENT_ADMISSION_LIMITS'])
+    if config.get('SEMANTIC_CACHE_ENABLED', True):
+        semantic_cache = SemanticCache(
+            threshold=config.get('SEMANTIC_CACHE_THRESHOLD', 0.86),
+            ttl=config.get('SEMANTIC_CACHE_TTL', 86400),
+            max_entries=config.get('SEMANTIC_CACHE_MAX_ENTRIES', 5000)
+        )
+    if config.get('PROMPT_CACHE_ENABLED', True):
+        prompt_cache = PromptCache(
+            max_entries=config.get('PROMPT_CACHE_MAX_ENTRIES', 1024),
+            default_ttl=config.get('PROMPT_CACHE_TTL', 3600),
+            sqlite_path=config.get('PROMPT_CACHE_SQLITE_PATH')
+        )
+    if config.get('LLM_HTTP_POOL'):
+        llm_manager.http_pool.configure(**config['LLM_HTTP_POOL'])
+    llm_router.configure(
+        fallbacks=config.get('LLM_FALLBACKS'),
+        hedge_enabled=config.get('LLM_HEDGE_ENABLED'),
+        hedge_percentile=config.get('LLM_HEDGE_PERCENTILE'),
+        hedge_min_delay=config.get('LLM_HEDGE_MIN_DELAY'),
+        cooldown=config.get('LLM_CIRCUIT_COOLDOWN'),
+        error_rate_threshold=config.get('LLM_CIRCUIT_ERROR_RATE')
+    )
+    llm_router.limiter.configure(
+        limits=config.get('LLM_RATE_LIMITS'),
+        max_wait=config.get('LLM_RATE_LIMIT_MAX_WAIT')
+    )
+    if config.get('AGENT_MEMORY_BACKEND', 'memory') == 'sql' and agent_memory.store is None:
+        agent_memory.max_cached_users = config.get('AGENT_MEMORY_CACHE_MAX_USERS', agent_memory.max_cached_users)
+        agent_memory.cache_revalidate_interval = config.get(
+            'AGENT_MEMORY_CACHE_REVALIDATE_SECONDS', agent_memory.cache_revalidate_interval
+        )
+        agent_memory.cache_max_age = config.get('AGENT_MEMORY_CACHE_MAX_AGE', agent_memory.cache_max_age)
+        agent_memory.store = SQLMemoryStore(
+            batch_size=config.get('AGENT_MEMORY_WRITE_BATCH_SIZE', 200),
+            flush_interval=config.get('AGENT_MEMORY_FLUSH_INTERVAL', 0.5),
+            history_limit=config.get('AGENT_MEMORY_HISTORY_LOAD_LIMIT', 200)
+        )
+        agent_memory.store.init_app(state.app)
+    if config.get('AGENT_INSTANCE_REGISTRY'):
+        chat_managers.configure(**config['AGENT_INSTANCE_REGISTRY'])
+        model_evaluators.configure(**config['AGENT_INSTANCE_REGISTRY'])
+    plan_library.init_app(state.app)
+    plan_library.cache_ttl = config.get('PLAN_TEMPLATE_CACHE_TTL', plan_library.cache_ttl)
+    if config.get('CHAT_SUMMARY_ENABLED', True):
+        agent_memory.summarizer = ConversationSummarizer(
+            agent_memory,
+            llm_provider=config.get('CHAT_SUMMARY_LLM_PROVIDER', 'openai'),
+            llm_model=config.get('CHAT_SUMMARY_LLM_MODEL'),
+            trigger_tokens=config.get('CHAT_SUMMARY_TRIGGER_TOKENS', 3000),
+            keep_recent_tokens=config.get('CHAT_SUMMARY_KEEP_RECENT_TOKENS', 1500)
+        )
+
+# 分析进行中的任务状态
+ANALYSIS_IN_PROGRESS_STATUSES = ('queued', 'processing', 'extracting_frames', 'estimating_pose')
+
+# ChatManager 不保存用户状态（对话历史、摘要、学习计划都在 agent_memory 中），
+# 每个 提供商/模型 共享一个实例
+chat_managers = InstanceRegistry(max_size=32, idle_ttl=3600)
 
 # 获取或创建ChatManager实例
 def get_chat_manager(user_id, llm_provider='openai', llm_model=None):
@@ -27,17 +133,37 @@ def get_chat_manager(user_id, llm_provider='openai', llm_model=None):
     获取或创建ChatManager实例
     
     Args:
-        user_id: 用户ID
+        user_id: 用户ID（实例按 提供商/模型 共享，用户ID在调用各方法时传入）
         llm_provider: LLM提供商
         llm_model: LLM模型名称
         
     Returns:
         chat_manager: ChatManager实例
     """
-    key = f"{user_id}_{llm_provider}_{llm_model or 'default'}"
-    if key not in chat_managers:
-        chat_managers[key] = ChatManager(agent_memory, llm_provider, llm_model)
-    return chat_managers[key]
+    key = (llm_provider, llm_model or 'default')
+    return chat_managers.get_or_create(key, lambda: ChatManager(
+        agent_memory, llm_provider, llm_model,
+        semantic_cache=semantic_cache, prompt_cache=prompt_cache, plan_library=plan_library
+    ))
+
+def cache_requested(data):
+    """
+    判断请求是否允许使用回复缓存
+    
+    请求体中 cache 为 false，或请求头 Cache-Control 包含 no-cache 时跳过缓存。
+    
+    Args:
+        data: 请求体
+        
+    Returns:
+        use_cache: 是否使用缓存
+    """
+    if data.get('cache', True) is False:
+        return False
+    return 'no-cache' not in request.headers.get('Cache-Control', '').lower()
+
+# 每个 提供商/模型 一个ModelEvaluator实例
+model_evaluators = InstanceRegistry(max_size=32, idle_ttl=3600)
 
 # 获取或创建ModelEvaluator实例
 def get_model_evaluator(llm_provider='openai', llm_model=None):
@@ -51,15 +177,236 @@ def get_model_evaluator(llm_provider='openai', llm_model=None):
     Returns:
         model_evaluator: ModelEvaluator实例
     """
-    key = f"{llm_provider}_{llm_model or 'default'}"
-    if not hasattr(current_app, 'model_evaluators'):
-        current_app.model_evaluators = {}
-    if key not in current_app.model_evaluators:
-        current_app.model_evaluators[key] = ModelEvaluator(llm_provider, llm_model)
-    return current_app.model_evaluators[key]
+    key = (llm_provider, llm_model or 'default')
+    return model_evaluators.get_or_create(key, lambda: ModelEvaluator(llm_provider, llm_model))
+
+# 检查LLM提供商是否可用
+def _check_llm_provider(llm_provider):
+    """
+    检查LLM提供商是否可用
+
+    Args:
+        llm_provider: LLM提供商
+
+    Returns:
+        error_response: 不可用时返回 (响应, 状态码)，否则返回None
+    """
+    error = llm_manager.check_provider(llm_provider)
+    if error is None:
+        return None
+    status, message = error
+    return jsonify({'error': message}), status
+
+# 获取姿态估计模型池
+def get_pose_estimator_pool(backend):
+    """
+    获取指定姿态估计后端的模型池
+
+    Args:
+        backend: 后端名称
+
+    Returns:
+        pool: PoseEstimatorPool实例
+    """
+    if backend not in pose_estimator_pools:
+        size = current_app.config.get('ANALYSIS_WORKERS', analysis_scheduler.max_workers)
+        pose_estimator_pools.setdefault(backend, PoseEstimatorPool(size, backend))
+    return pose_estimator_pools[backend]
+
+# 选择姿态估计后端
+def _resolve_pose_backend(requested, skill_level):
+    """
+    选择姿态估计后端：请求指定 > 按技能水平配置 > 默认
+
+    Args:
+        requested: 请求指定的后端名称
+        skill_level: 技能水平
+
+    Returns:
+        backend: 后端名称
+
+    Raises:
+        ValueError: 不支持的后端
+    """
+    backend = (
+        requested
+        or current_app.config.get('POSE_BACKEND_BY_SKILL', {}).get(skill_level)
+        or current_app.config.get('POSE_BACKEND', DEFAULT_POSE_BACKEND)
+    )
+    if backend not in POSE_BACKENDS:
+        raise ValueError(f'Unsupported pose backend: {backend}')
+    return backend
+
+# 保存上传的视频并创建任务
+def _create_video_task(video_file, user_id, ski_type, skill_level, batch_id=None):
+    """
+    保存上传的视频文件并登记任务信息
+
+    Args:
+        video_file: 上传的文件对象
+        user_id: 用户ID
+        ski_type: 滑雪类型
+        skill_level: 技能水平
+        batch_id: 所属批次ID
+
+    Returns:
+        task_info: 任务信息
+    """
+    # 生成唯一的任务ID
+    task_id = str(uuid.uuid4())
+
+    # 确保上传目录存在
+    upload_dir = os.path.join(current_app.root_path, '..', 'uploads')
+    os.makedirs(upload_dir, exist_ok=True)
+
+    # 保存视频文件
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f"{task_id}_{timestamp}_{secure_filename(video_file.filename) or 'video'}"
+    filepath = os.path.join(upload_dir, filename)
+    video_file.save(filepath)
+
+    # 保存任务信息
+    task_info = {
+        'task_id': task_id,
+        'user_id': user_id,
+        'access_token': secrets.token_urlsafe(24),
+        'filepath': filepath,
+        'ski_type': ski_type,
+        'skill_level': skill_level,
+        'status': 'uploaded',
+        'created_at': datetime.now().isoformat()
+    }
+    if batch_id:
+        task_info['batch_id'] = batch_id
+
+    # 存储任务信息（这里使用内存存储，实际项目中应该使用数据库）
+    if not hasattr(current_app, 'video_tasks'):
+        current_app.video_tasks = {}
+    current_app.video_tasks[task_id] = task_info
+    return task_info
+
+# 抽帧并做姿态估计
+def _extract_pose(task_info, estimator):
+    """
+    对任务视频抽帧并进行姿态估计，同时更新任务状态
+
+    Args:
+        task_info: 任务信息
+        estimator: PoseEstimator实例
+
+    Returns:
+        evaluation_item: ModelEvaluator.evaluate_batch 所需的评价参数
+    """
+    # 1. 视频抽帧
+    task_info['status'] = 'extracting_frames'
+    task_info['message'] = '正在提取视频帧...'
+    frames = video_processor.extract_frames(task_info['filepath'])
+    task_info['frames'] = frames
+
+    # 2. 姿态估计
+    task_info['status'] = 'estimating_pose'
+    task_info['message'] = '正在分析姿态...'
+    # 姿态结果只在同一用户的视频之间复用
+    pose_data = estimator.estimate_pose(
+        frames, hash_index=pose_hash_index, hash_namespace=task_info.get('user_id', 'default')
+    )
+    task_info['pose_data'] = pose_data
+
+    return {
+        'frames': frames,
+        'pose_data': pose_data,
+        'ski_type': task_info['ski_type'],
+        'skill_level': task_info['skill_level'],
+        'seconds_per_frame': _seconds_per_frame(task_info['filepath'], len(frames)),
+    }
+
+# 估算采样帧之间的时间间隔
+def _seconds_per_frame(video_path, frame_count):
+    """
+    根据视频时长和抽帧数量估算相邻采样帧之间的时间间隔
+
+    Args:
+        video_path: 视频文件路径
+        frame_count: 抽取的帧数量
+
+    Returns:
+        seconds_per_frame: 时间间隔（秒），无法估算时返回None
+    """
+    if not frame_count:
+        return None
+    try:
+        info = video_processor.get_video_info(video_path)
+    except Exception:
+        return None
+    if not info['fps']:
+        return None
+    return info['total_frames'] / info['fps'] / frame_count
+
+# 获取帧预览缓存
+def get_frame_preview_cache():
+    """
+    获取帧预览缓存实例
+
+    Returns:
+        preview_cache: FramePreviewCache实例
+    """
+    if not hasattr(current_app, 'frame_preview_cache'):
+        cache_dir = os.path.join(current_app.root_path, '..', 'uploads', 'previews')
+        current_app.frame_preview_cache = FramePreviewCache(cache_dir)
+    return current_app.frame_preview_cache
+
+# 获取任务数据存储
+def get_task_payload_store():
+    """
+    获取任务大字段的磁盘存储实例
+
+    Returns:
+        task_store: TaskPayloadStore实例
+    """
+    if not hasattr(current_app, 'task_payload_store'):
+        blob_dir = os.path.join(current_app.root_path, '..', 'uploads', 'task_blobs')
+        current_app.task_payload_store = TaskPayloadStore(blob_dir)
+    return current_app.task_payload_store
+
+# 任务结束后把大字段移出内存
+def _spill_task_payload(task_info):
+    try:
+        get_task_payload_store().spill(task_info)
+    except Exception as e:
+        print(f"Failed to spill task payload {task_info['task_id']}: {str(e)}")
+
+# 构建带强ETag和不可变缓存头的图片响应
+def _image_response(data, mimetype, etag):
+    response = make_response(data)
+    response.mimetype = mimetype
+    response.set_etag(etag)
+    # 分析完成后帧内容不再变化，允许客户端长期缓存；需要任务令牌才能访问，不允许共享缓存
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    response.vary.add('Accept')
+    return response.make_conditional(request)
+
+# 校验任务访问令牌
+def _check_task_token(task_info):
+    """
+    校验请求携带的任务访问令牌
+
+    令牌可通过 X-Task-Token 请求头或 token 查询参数传递（<video> 标签无法设置请求头）
+
+    Args:
+        task_info: 任务信息
+
+    Returns:
+        authorized: 是否有权访问该任务
+    """
+    expected = task_info.get('access_token')
+    provided = request.headers.get('X-Task-Token') or request.args.get('token')
+    if not expected or not provided:
+        return False
+    return hmac.compare_digest(expected, provided)
 
 
 @bp.route('/video/upload', methods=['POST'])
+@idempotent(idempotency_store)
 def upload_video():
     """
     上传视频文件
@@ -69,6 +416,11 @@ def upload_video():
     consumes:
       - multipart/form-data
     parameters:
+      - name: Idempotency-Key
+        in: header
+        type: string
+        required: false
+        description: 幂等键，重试时携带相同的键将返回原始结果而不会重复处理
       - name: video
         in: formData
         type: file
@@ -84,6 +436,11 @@ def upload_video():
         type: string
         required: true
         description: 技能水平（初级/中级/高级）
+      - name: user_id
+        in: formData
+        type: string
+        required: false
+        description: 用户ID
     responses:
       200:
         description: 上传成功
@@ -93,6 +450,9 @@ def upload_video():
             task_id:
               type: string
               description: 任务ID
+            access_token:
+              type: string
+              description: 任务访问令牌，用于视频回放等受保护资源
             message:
               type: string
               description: 上传成功消息
@@ -104,40 +464,17 @@ def upload_video():
         video_file = request.files['video']
         ski_type = request.form.get('ski_type', '双板')
         skill_level = request.form.get('skill_level', '中级')
+        user_id = request.form.get('user_id', 'default')
         
         if video_file.filename == '':
             return jsonify({'error': 'No video file selected'}), 400
         
-        # 生成唯一的任务ID
-        task_id = str(uuid.uuid4())
-        
-        # 确保上传目录存在
-        upload_dir = os.path.join(current_app.root_path, '..', 'uploads')
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        # 保存视频文件
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{task_id}_{timestamp}_{video_file.filename}"
-        filepath = os.path.join(upload_dir, filename)
-        video_file.save(filepath)
-        
-        # 保存任务信息
-        task_info = {
-            'task_id': task_id,
-            'filepath': filepath,
-            'ski_type': ski_type,
-            'skill_level': skill_level,
-            'status': 'uploaded',
-            'created_at': datetime.now().isoformat()
-        }
-        
-        # 存储任务信息（这里使用内存存储，实际项目中应该使用数据库）
-        if not hasattr(current_app, 'video_tasks'):
-            current_app.video_tasks = {}
-        current_app.video_tasks[task_id] = task_info
+        task_info = _create_video_task(video_file, user_id, ski_type, skill_level)
+        task_id = task_info['task_id']
         
         return jsonify({
             'task_id': task_id,
+            'access_token': task_info['access_token'],
             'message': 'Video uploaded successfully'
         })
         
@@ -145,6 +482,85 @@ def upload_video():
         return jsonify({'error': str(e)}), 500
 
 
+@bp.route('/video/<task_id>/stream', methods=['GET'])
+def stream_video(task_id):
+    """
+    回放上传的视频（支持HTTP Range断点拖动）
+    ---
+    tags:
+      - agent
+    produces:
+      - video/mp4
+    parameters:
+      - name: task_id
+        in: path
+        type: string
+        required: true
+        description: 任务ID
+      - name: token
+        in: query
+        type: string
+        required: false
+        description: 任务访问令牌（也可通过 X-Task-Token 请求头传递）
+      - name: variant
+        in: query
+        type: string
+        required: false
+        description: 视频版本（original/annotated），默认original
+      - name: Range
+        in: header
+        type: string
+        required: false
+        description: 字节范围，例如 bytes=0-1048575
+    responses:
+      200:
+        description: 完整视频
+      206:
+        description: 部分视频内容
+      403:
+        description: 无权访问该任务
+      404:
+        description: 任务或视频不存在
+      416:
+        description: 请求的范围无效
+    """
+    try:
+        if not hasattr(current_app, 'video_tasks') or task_id not in current_app.video_tasks:
+            return jsonify({'error': 'Task not found'}), 404
+
+        task_info = current_app.video_tasks[task_id]
+        if not _check_task_token(task_info):
+            return jsonify({'error': 'Forbidden'}), 403
+
+        variant = request.args.get('variant', 'original')
+        if variant == 'original':
+            video_path = task_info.get('filepath')
+        elif variant == 'annotated':
+            video_path = task_info.get('annotated_path')
+        else:
+            return jsonify({'error': f'Unsupported variant: {variant}'}), 400
+
+        if not video_path or not os.path.isfile(video_path):
+            return jsonify({'error': 'Video not found'}), 404
+
+        # send_file 在 conditional=True 时处理 Range/If-Range 并返回206，
+        # 文件对象交给 wsgi.file_wrapper（如 gunicorn 的 sendfile）输出，不会整体读入内存；
+        # 部署在 nginx 之后时可开启 USE_X_SENDFILE 由前端服务器直接发送文件
+        mimetype = mimetypes.guess_type(video_path)[0] or 'application/octet-stream'
+        response = send_file(
+            video_path,
+            mimetype=mimetype,
+            conditional=True,
+            etag=True,
+            max_age=3600
+        )
+        response.headers['Cache-Control'] = 'private, max-age=3600'
+        return response
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @bp.route('/video/status/<task_id>', methods=['GET'])
 def get_video_status(task_id):
     """
@@ -176,17 +592,21 @@ def get_video_status(task_id):
             return jsonify({'error': 'Task not found'}), 404
         
         task_info = current_app.video_tasks[task_id]
-        return jsonify({
+        response = {
             'task_id': task_id,
             'status': task_info.get('status', 'unknown'),
             'message': task_info.get('message', '')
-        })
+        }
+        if response['status'] == 'queued':
+            response['queue_position'] = analysis_scheduler.queue_position(task_id)
+        return jsonify(response)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @bp.route('/analysis/process/<task_id>', methods=['POST'])
+@idempotent(idempotency_store)
 def process_video(task_id):
     """
     处理视频并分析
@@ -194,6 +614,11 @@ def process_video(task_id):
     tags:
       - agent
     parameters:
+      - name: Idempotency-Key
+        in: header
+        type: string
+        required: false
+        description: 幂等键，重试时携带相同的键将返回原始结果而不会重复处理
       - name: task_id
         in: path
         type: string
@@ -210,14 +635,24 @@ def process_video(task_id):
             llm_model:
               type: string
               description: LLM模型名称
+            pose_backend:
+              type: string
+              description: 姿态估计后端（mediapipe_lite/mediapipe_full/mediapipe_heavy/stub），默认按技能水平选择
     responses:
-      200:
-        description: 分析任务已启动
+      429:
+        description: 分析任务过多，请按 Retry-After 稍后重试
+      202:
+        description: 分析任务已进入队列
         schema:
           type: object
           properties:
             task_id:
               type: string
+            status:
+              type: string
+            queue_position:
+              type: integer
+              description: 在队列中的大致位置
             message:
               type: string
     """
@@ -226,55 +661,94 @@ def process_video(task_id):
             return jsonify({'error': 'Task not found'}), 404
         
         task_info = current_app.video_tasks[task_id]
-        task_info['status'] = 'processing'
-        task_info['message'] = '视频分析中...'
+        
+        # 任务已在处理中时直接返回，不重复启动分析
+        if task_info['status'] in ANALYSIS_IN_PROGRESS_STATUSES:
+            return jsonify({
+                'task_id': task_id,
+                'status': task_info['status'],
+                'message': 'Video analysis already in progress'
+            })
         
         # 获取LLM配置
-        data = request.get_json() or {}
+        data = request.get_json(silent=True) or {}
         llm_provider = data.get('llm_provider', 'openai')
         llm_model = data.get('llm_model', None)
         
         # 检查提供商是否可用
-        if llm_provider not in llm_manager.models:
-            # 特别处理千问模型的情况
-            if llm_provider == 'qianwen':
-                return jsonify({'error': 'Qianwen model is not available. Please use OpenAI model instead.'}), 400
-            else:
-                return jsonify({'error': f'Unsupported LLM provider: {llm_provider}'}), 400
-        
-        # 异步处理视频（这里简化处理，实际项目中应该使用任务队列）
+        provider_error = _check_llm_provider(llm_provider)
+        if provider_error is not None:
+            return provider_error
+        
+        try:
+            pose_backend = _resolve_pose_backend(data.get('pose_backend'), task_info['skill_level'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        # 预留视频分析容量，任务结束前一直占用；容量已满时快速失败
+        try:
+            reserved_at = admission.try_reserve('video')
+        except AdmissionRejected as e:
+            return rejection_response(e)
+        
+        app = current_app._get_current_object()
+        
+        # 后台处理视频：在调度器的工作线程中执行，需要手动推入应用上下文
         def process_task():
-            try:
-                # 1. 视频抽帧
-                frames = video_processor.extract_frames(task_info['filepath'])
-                task_info['frames'] = frames
-                task_info['status'] = 'extracting_frames'
-                task_info['message'] = '正在提取视频帧...'
-                
-                # 2. 姿态估计
-                pose_data = pose_estimator.estimate_pose(frames)
-                task_info['pose_data'] = pose_data
-                task_info['status'] = 'estimating_pose'
-                task_info['message'] = '正在分析姿态...'
-                
-                # 3. 模型评价
-                model_evaluator = get_model_evaluator(llm_provider, llm_model)
-                evaluation = model_evaluator.evaluate(frames, pose_data, task_info['ski_type'], task_info['skill_level'])
-                task_info['evaluation'] = evaluation
-                task_info['status'] = 'completed'
-                task_info['message'] = '分析完成'
-                
-            except Exception as e:
-                task_info['status'] = 'error'
-                task_info['message'] = f'分析失败: {str(e)}'
+            with app.app_context():
+                try:
+                    # 任务已被接受：重新分析会产生新的帧，清理旧的预览缓存和上次的分析数据
+                    get_frame_preview_cache().clear(task_id)
+                    get_task_payload_store().discard(task_info)
+                    task_info['pose_backend'] = pose_backend
+                    with get_pose_estimator_pool(pose_backend).lease() as estimator:
+                        item = _extract_pose(task_info, estimator)
+                    
+                    # 3. 模型评价
+                    task_info['status'] = 'processing'
+                    task_info['message'] = '视频分析中...'
+                    model_evaluator = get_model_evaluator(llm_provider, llm_model)
+                    evaluation = model_evaluator.evaluate(
+                        item['frames'],
+                        item['pose_data'],
+                        item['ski_type'],
+                        item['skill_level'],
+                        seconds_per_frame=item['seconds_per_frame']
+                    )
+                    task_info['evaluation'] = evaluation
+                    outcome = ('completed', '分析完成')
+                    
+                except Exception as e:
+                    outcome = ('error', f'分析失败: {str(e)}')
+                finally:
+                    # 大字段移出内存之后再公布最终状态，读取方看到 completed 时数据已经就位
+                    _spill_task_payload(task_info)
+                    task_info['status'], task_info['message'] = outcome
+                    admission.release('video', reserved_at)
         
-        # 启动处理（这里使用同步处理，实际项目中应该使用异步）
-        process_task()
+        # 按 时长×分辨率 和LLM提供商估算成本，交给调度器按最短作业优先排队
+        try:
+            video_info = video_processor.get_video_info(task_info['filepath'])
+        except Exception:
+            video_info = None
+        cost = analysis_scheduler.estimate_cost(video_info, llm_provider)
+        previous_status = task_info['status'], task_info.get('message')
+        task_info['estimated_cost'] = cost
+        task_info['status'] = 'queued'
+        task_info['message'] = '排队等待分析...'
+        try:
+            position = analysis_scheduler.submit(task_id, task_info.get('user_id', 'default'), cost, process_task)
+        except Exception:
+            # 未能排队时保留上次的状态和结果
+            task_info['status'], task_info['message'] = previous_status
+            admission.release('video', reserved_at)
+            raise
         
         return jsonify({
             'task_id': task_id,
+            'status': 'queued',
+            'queue_position': position,
             'message': 'Video analysis started'
-        })
+        }), 202
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -322,14 +796,335 @@ def get_analysis_result(task_id):
         return jsonify({
             'task_id': task_id,
             'status': task_info['status'],
-            'evaluation': task_info.get('evaluation', {})
+            'evaluation': get_task_payload_store().get(task_info, 'evaluation', {})
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@bp.route('/video/batch', methods=['POST'])
+@idempotent(idempotency_store)
+def submit_video_batch():
+    """
+    批量上传并分析视频
+    ---
+    tags:
+      - agent
+    consumes:
+      - multipart/form-data
+    parameters:
+      - name: Idempotency-Key
+        in: header
+        type: string
+        required: false
+        description: 幂等键，重试时携带相同的键将返回原始结果而不会重复处理
+      - name: videos
+        in: formData
+        type: file
+        required: true
+        description: 滑雪视频文件（可重复多次，数量不超过 BATCH_MAX_CLIPS 和视频分析准入容量）
+      - name: ski_type
+        in: formData
+        type: string
+        required: true
+        description: 滑雪类型（单板/双板），所有视频共用
+      - name: skill_level
+        in: formData
+        type: string
+        required: true
+        description: 技能水平（初级/中级/高级），所有视频共用
+      - name: user_id
+        in: formData
+        type: string
+        required: false
+        description: 用户ID
+      - name: llm_provider
+        in: formData
+        type: string
+        required: false
+        description: LLM提供商 (openai/google/qianwen)
+      - name: llm_model
+        in: formData
+        type: string
+        required: false
+        description: LLM模型名称
+      - name: pose_backend
+        in: formData
+        type: string
+        required: false
+        description: 姿态估计后端（mediapipe_lite/mediapipe_full/mediapipe_heavy/stub），默认按技能水平选择
+    responses:
+      202:
+        description: 批次已进入队列
+        schema:
+          type: object
+          properties:
+            batch_id:
+              type: string
+            tasks:
+              type: array
+              items:
+                type: object
+                properties:
+                  task_id:
+                    type: string
+                  access_token:
+                    type: string
+                  filename:
+                    type: string
+      429:
+        description: 分析任务过多，请按 Retry-After 稍后重试
+    """
+    try:
+        video_files = [f for f in request.files.getlist('videos') if f.filename]
+        if not video_files:
+            return jsonify({'error': 'No video files provided'}), 400
+
+        # 每个视频占用一份视频分析容量，超过总容量的批次即使服务器空闲也无法被接受
+        max_clips = min(current_app.config.get('BATCH_MAX_CLIPS', 20), admission.capacity('video'))
+        if len(video_files) > max_clips:
+            return jsonify({'error': f'Too many video files, at most {max_clips} per batch'}), 400
+
+        ski_type = request.form.get('ski_type', '双板')
+        skill_level = request.form.get('skill_level', '中级')
+        user_id = request.form.get('user_id', 'default')
+        llm_provider = request.form.get('llm_provider', 'openai')
+        llm_model = request.form.get('llm_model') or None
+
+        # 检查提供商是否可用
+        provider_error = _check_llm_provider(llm_provider)
+        if provider_error is not None:
+            return provider_error
+
+        try:
+            pose_backend = _resolve_pose_backend(request.form.get('pose_backend'), skill_level)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # 每个视频预留一份分析容量，整批要么全部接受要么全部拒绝
+        reservations = []
+        try:
+            for _ in video_files:
+                reservations.append(admission.try_reserve('video'))
+        except AdmissionRejected as e:
+            for reserved_at in reservations:
+                admission.release('video', reserved_at)
+            return rejection_response(e)
+
+        # 每个视频的预留在整批的LLM评价结束后统一释放
+        pending = {'count': len(video_files), 'items': []}
+        pending_lock = threading.Lock()
+
+        def release_reservations():
+            for reserved_at in reservations:
+                admission.release('video', reserved_at)
+
+        try:
+            batch_id = str(uuid.uuid4())
+            tasks = [
+                _create_video_task(video_file, user_id, ski_type, skill_level, batch_id)
+                for video_file in video_files
+            ]
+
+            if not hasattr(current_app, 'video_batches'):
+                current_app.video_batches = {}
+            current_app.video_batches[batch_id] = {
+                'batch_id': batch_id,
+                'user_id': user_id,
+                'task_ids': [task_info['task_id'] for task_info in tasks],
+                'ski_type': ski_type,
+                'skill_level': skill_level,
+                'pose_backend': pose_backend,
+                'created_at': datetime.now().isoformat()
+            }
+
+            app = current_app._get_current_object()
+
+            def evaluate_batch(items):
+                # 最后一个完成姿态估计的视频负责整批的LLM评价，请求一次性批量并发发送
+                outcomes = {}
+                try:
+                    if items:
+                        for task_info, _ in items:
+                            task_info['status'] = 'processing'
+                            task_info['message'] = '视频分析中...'
+                        model_evaluator = get_model_evaluator(llm_provider, llm_model)
+                        evaluations = model_evaluator.evaluate_batch([item for _, item in items])
+                        for (task_info, _), evaluation in zip(items, evaluations):
+                            task_info['evaluation'] = evaluation
+                            outcomes[task_info['task_id']] = ('completed', '分析完成')
+
+                except Exception as e:
+                    for task_info, _ in items:
+                        outcomes.setdefault(task_info['task_id'], ('error', f'分析失败: {str(e)}'))
+                finally:
+                    # 大字段移出内存之后再公布最终状态，读取方看到 completed 时数据已经就位
+                    for task_info in tasks:
+                        _spill_task_payload(task_info)
+                    for task_info in tasks:
+                        if task_info['task_id'] in outcomes:
+                            task_info['status'], task_info['message'] = outcomes[task_info['task_id']]
+                    release_reservations()
+
+            def finish_clip(item):
+                with pending_lock:
+                    if item is not None:
+                        pending['items'].append(item)
+                    pending['count'] -= 1
+                    last = pending['count'] == 0
+                if last:
+                    evaluate_batch(pending['items'])
+
+            # 每个视频是调度器中的一个任务，按各自的成本排队；姿态估计复用同一个预热的模型池
+            def make_clip_job(task_info):
+                def process_clip():
+                    with app.app_context():
+                        item = None
+                        try:
+                            with get_pose_estimator_pool(pose_backend).lease() as estimator:
+                                item = (task_info, _extract_pose(task_info, estimator))
+                            task_info['status'] = 'processing'
+                            task_info['message'] = '等待批次中的其他视频...'
+                        except Exception as e:
+                            task_info['status'] = 'error'
+                            task_info['message'] = f'分析失败: {str(e)}'
+                        finally:
+                            finish_clip(item)
+
+                return process_clip
+
+            for task_info in tasks:
+                try:
+                    video_info = video_processor.get_video_info(task_info['filepath'])
+                except Exception:
+                    video_info = None
+                task_info['estimated_cost'] = analysis_scheduler.estimate_cost(video_info, llm_provider)
+                task_info['status'] = 'queued'
+                task_info['message'] = '排队等待分析...'
+
+            submitted = 0
+            try:
+                for task_info in tasks:
+                    analysis_scheduler.submit(
+                        task_info['task_id'], user_id, task_info['estimated_cost'], make_clip_job(task_info)
+                    )
+                    submitted += 1
+            except Exception as e:
+                if not submitted:
+                    raise
+                # 已提交的视频照常执行；未提交的视频标记失败，最后一个结束的视频负责评价和释放容量
+                for task_info in tasks[submitted:]:
+                    task_info['status'] = 'error'
+                    task_info['message'] = f'分析失败: {str(e)}'
+                    finish_clip(None)
+        except Exception:
+            release_reservations()
+            raise
+
+        return jsonify({
+            'batch_id': batch_id,
+            'tasks': [
+                {
+                    'task_id': task_info['task_id'],
+                    'access_token': task_info['access_token'],
+                    'filename': video_file.filename
+                }
+                for task_info, video_file in zip(tasks, video_files)
+            ],
+            'message': 'Batch analysis started'
+        }), 202
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/video/batch/<batch_id>', methods=['GET'])
+def get_video_batch(batch_id):
+    """
+    获取批量分析的进度和结果
+    ---
+    tags:
+      - agent
+    parameters:
+      - name: batch_id
+        in: path
+        type: string
+        required: true
+        description: 批次ID
+    responses:
+      200:
+        description: 批次进度和每个视频的结果
+        schema:
+          type: object
+          properties:
+            batch_id:
+              type: string
+            status:
+              type: string
+              description: queued/processing/completed/partial_error
+            progress:
+              type: number
+              description: 已结束的视频比例（0-1）
+            counts:
+              type: object
+            tasks:
+              type: array
+              items:
+                type: object
+    """
+    try:
+        batches = getattr(current_app, 'video_batches', {})
+        if batch_id not in batches:
+            return jsonify({'error': 'Batch not found'}), 404
+
+        batch = batches[batch_id]
+        task_store = get_task_payload_store()
+        counts = {}
+        results = []
+        for task_id in batch['task_ids']:
+            task_info = current_app.video_tasks[task_id]
+            status = task_info['status']
+            counts[status] = counts.get(status, 0) + 1
+            result = {
+                'task_id': task_id,
+                'status': status,
+                'message': task_info.get('message', '')
+            }
+            if status == 'completed':
+                result['evaluation'] = task_store.get(task_info, 'evaluation', {})
+            results.append(result)
+
+        # 批次中排在最前面的视频的位置
+        positions = [
+            position for position in map(analysis_scheduler.queue_position, batch['task_ids'])
+            if position is not None
+        ]
+
+        total = len(batch['task_ids'])
+        finished = counts.get('completed', 0) + counts.get('error', 0)
+        if finished == total:
+            status = 'completed' if not counts.get('error') else 'partial_error'
+        elif counts.get('queued', 0) == total:
+            status = 'queued'
+        else:
+            status = 'processing'
+
+        return jsonify({
+            'batch_id': batch_id,
+            'status': status,
+            'progress': finished / total if total else 1.0,
+            'counts': counts,
+            'queue_position': min(positions) if positions else None,
+            'tasks': results
+        })
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @bp.route('/chat/message', methods=['POST'])
+@admission.limit('chat')
 def send_chat_message():
     """
     发送聊天消息
@@ -355,7 +1150,14 @@ def send_chat_message():
             llm_model:
               type: string
               description: LLM模型名称
+            cache:
+              type: boolean
+              description: 设为false时跳过回复缓存（也可发送 Cache-Control: no-cache）
     responses:
+      429:
+        description: 请求过多，请按 Retry-After 稍后重试
+      503:
+        description: 排队超时，请按 Retry-After 稍后重试
       200:
         description: 聊天响应
         schema:
@@ -379,18 +1181,15 @@ def send_chat_message():
             return jsonify({'error': 'No message provided'}), 400
         
         # 检查提供商是否可用
-        if llm_provider not in llm_manager.models:
-            # 特别处理千问模型的情况
-            if llm_provider == 'qianwen':
-                return jsonify({'error': 'Qianwen model is not available. Please use OpenAI model instead.'}), 400
-            else:
-                return jsonify({'error': f'Unsupported LLM provider: {llm_provider}'}), 400
+        provider_error = _check_llm_provider(llm_provider)
+        if provider_error is not None:
+            return provider_error
         
         # 获取ChatManager实例
         chat_manager = get_chat_manager(user_id, llm_provider, llm_model)
         
         # 处理聊天消息
-        response = chat_manager.handle_message(message, user_id)
+        response = chat_manager.handle_message(message, user_id, use_cache=cache_requested(data))
         
         return jsonify({
             'response': response,
@@ -401,10 +1200,103 @@ def send_chat_message():
         return jsonify({'error': str(e)}), 500
 
 
+@bp.route('/chat/message/stream', methods=['POST'])
+def stream_chat_message():
+    """
+    发送聊天消息（SSE流式返回）
+    ---
+    tags:
+      - agent
+    produces:
+      - text/event-stream
+    parameters:
+      - name: message
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            message:
+              type: string
+              description: 聊天消息
+            user_id:
+              type: string
+              description: 用户ID
+            llm_provider:
+              type: string
+              description: LLM提供商 (openai/google/qianwen)
+            llm_model:
+              type: string
+              description: LLM模型名称
+            cache:
+              type: boolean
+              description: 设为false时跳过回复缓存（也可发送 Cache-Control: no-cache）
+    responses:
+      200:
+        description: |
+          SSE 事件流：start 开始；token 增量文本 {"token": "..."}；
+          done 完成 {"response": "完整回复"}；error 出错 {"error": "..."}。
+          等待期间定期发送 ": keep-alive" 注释行。
+      429:
+        description: 请求过多，请按 Retry-After 稍后重试
+      503:
+        description: 排队超时，请按 Retry-After 稍后重试
+    """
+    try:
+        data = request.get_json() or {}
+        message = data.get('message', '')
+        user_id = data.get('user_id', 'default')
+        llm_provider = data.get('llm_provider', 'openai')
+        llm_model = data.get('llm_model', None)
+        
+        if not message:
+            return jsonify({'error': 'No message provided'}), 400
+        
+        # 检查提供商是否可用
+        provider_error = _check_llm_provider(llm_provider)
+        if provider_error is not None:
+            return provider_error
+        
+        chat_manager = get_chat_manager(user_id, llm_provider, llm_model)
+        
+        # 流式响应在视图返回后才开始生成，槽位在 WSGI 服务器关闭响应时释放：
+        # 客户端在第一个事件之前断开时生成器不会运行，不能依赖生成器结束来释放
+        try:
+            started_at = admission.acquire('chat')
+        except AdmissionRejected as e:
+            return rejection_response(e)
+        release_slot = admission.releaser('chat', started_at)
+        
+        try:
+            # 在请求线程中先加载对话历史，避免数据库读取阻塞后台事件循环
+            agent_memory.get_session_history(user_id)
+            # 使用异步流：客户端断开时立即取消LLM请求，释放限流额度和连接
+            events = stream_with_keepalive(
+                chat_manager.astream_message(message, user_id, use_cache=cache_requested(data)),
+                keepalive_interval=current_app.config.get('SSE_KEEPALIVE_SECONDS', 15)
+            )
+            response = Response(events, mimetype='text/event-stream')
+            response.call_on_close(release_slot)
+        except Exception:
+            release_slot()
+            raise
+        
+        response.headers['Cache-Control'] = 'no-cache'
+        # 关闭 nginx 的响应缓冲，保证token及时送达
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @bp.route('/chat/history/<user_id>', methods=['GET'])
 def get_chat_history(user_id):
     """
     获取聊天历史
+    
+    默认返回最新的50条消息。before/after 按消息ID翻页（before 向更早、after 向更新）；
+    since 为增量模式，返回该消息之后的新消息，对话已被清空时返回最新一页并标记 reset。
     ---
     tags:
       - agent
@@ -414,6 +1306,26 @@ def get_chat_history(user_id):
         type: string
         required: true
         description: 用户ID
+      - name: before
+        in: query
+        type: integer
+        required: false
+        description: 返回ID小于该值的消息
+      - name: after
+        in: query
+        type: integer
+        required: false
+        description: 返回ID大于该值的消息
+      - name: since
+        in: query
+        type: integer
+        required: false
+        description: 客户端已有的最新消息ID（增量模式）
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: 每页条数（默认50，最大200）
     responses:
       200:
         description: 聊天历史
@@ -425,14 +1337,43 @@ def get_chat_history(user_id):
               items:
                 type: object
                 properties:
+                  id:
+                    type: integer
                   role:
                     type: string
                   content:
                     type: string
+            has_more:
+              type: boolean
+              description: 游标方向上是否还有更多消息
+            reset:
+              type: boolean
+              description: since 指向的消息已不存在，客户端应丢弃已缓存的历史
+      400:
+        description: 参数错误
     """
     try:
-        history = agent_memory.get_history(user_id)
-        return jsonify({'history': history})
+        # type=int 会把格式错误的值静默当作未传，这里显式校验
+        params = {}
+        for name in ('before', 'after', 'since', 'limit'):
+            value = request.args.get(name)
+            if value is None:
+                continue
+            try:
+                params[name] = int(value)
+            except ValueError:
+                return jsonify({'error': f'{name} must be an integer'}), 400
+        before = params.get('before')
+        after = params.get('after')
+        since = params.get('since')
+        limit = params.get('limit', DEFAULT_HISTORY_PAGE_SIZE)
+        if sum(cursor is not None for cursor in (before, after, since)) > 1:
+            return jsonify({'error': 'Only one of before, after and since can be used'}), 400
+        if limit <= 0:
+            return jsonify({'error': 'limit must be positive'}), 400
+        
+        page = agent_memory.get_history_page(user_id, before=before, after=after, since=since, limit=limit)
+        return jsonify(page)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -468,6 +1409,7 @@ def clear_chat_history(user_id):
 
 
 @bp.route('/plan/generate', methods=['POST'])
+@admission.limit('plan')
 def generate_plan():
     """
     生成学习计划
@@ -499,7 +1441,14 @@ def generate_plan():
             llm_model:
               type: string
               description: LLM模型名称
+            cache:
+              type: boolean
+              description: 设为false时跳过回复缓存（也可发送 Cache-Control: no-cache）
     responses:
+      429:
+        description: 请求过多，请按 Retry-After 稍后重试
+      503:
+        description: 排队超时，请按 Retry-After 稍后重试
       200:
         description: 学习计划
         schema:
@@ -519,20 +1468,195 @@ def generate_plan():
         llm_model = data.get('llm_model', None)
         
         # 检查提供商是否可用
-        if llm_provider not in llm_manager.models:
-            # 特别处理千问模型的情况
-            if llm_provider == 'qianwen':
-                return jsonify({'error': 'Qianwen model is not available. Please use OpenAI model instead.'}), 400
-            else:
-                return jsonify({'error': f'Unsupported LLM provider: {llm_provider}'}), 400
+        provider_error = _check_llm_provider(llm_provider)
+        if provider_error is not None:
+            return provider_error
         
         # 获取ChatManager实例
         chat_manager = get_chat_manager(user_id, llm_provider, llm_model)
         
         # 生成学习计划
-        plan = chat_manager.generate_learning_plan(ski_type, skill_level, goals, user_id)
+        plan = chat_manager.generate_learning_plan(
+            ski_type, skill_level, goals, user_id, use_cache=cache_requested(data)
+        )
         
         return jsonify({'plan': plan})
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/analysis/<task_id>/frames/<int:n>', methods=['GET'])
+def get_frame_preview(task_id, n):
+    """
+    获取分析帧预览图
+    ---
+    tags:
+      - agent
+    produces:
+      - image/webp
+      - image/jpeg
+    parameters:
+      - name: task_id
+        in: path
+        type: string
+        required: true
+        description: 任务ID
+      - name: token
+        in: query
+        type: string
+        required: false
+        description: 任务访问令牌（也可通过 X-Task-Token 请求头传递）
+      - name: n
+        in: path
+        type: integer
+        required: true
+        description: 帧序号（从0开始）
+      - name: format
+        in: query
+        type: string
+        required: false
+        description: 输出格式（webp/jpeg），默认根据Accept头选择
+    responses:
+      200:
+        description: 预览图
+      304:
+        description: 客户端缓存仍然有效
+      403:
+        description: 无权访问该任务
+      404:
+        description: 任务或帧不存在
+      409:
+        description: 分析尚未完成
+    """
+    try:
+        if not hasattr(current_app, 'video_tasks') or task_id not in current_app.video_tasks:
+            return jsonify({'error': 'Task not found'}), 404
+
+        task_info = current_app.video_tasks[task_id]
+        if not _check_task_token(task_info):
+            return jsonify({'error': 'Forbidden'}), 403
+        if task_info['status'] != 'completed':
+            return jsonify({'error': 'Analysis not completed'}), 409
+
+        preview_cache = get_frame_preview_cache()
+        fmt = preview_cache.negotiate_format(request.accept_mimetypes, request.args.get('format'))
+        preview = preview_cache.get_frame_preview(
+            task_id,
+            get_task_payload_store().get(task_info, 'frames', []),
+            n,
+            fmt
+        )
+        if preview is None:
+            return jsonify({'error': 'Frame not found'}), 404
+
+        data, mimetype, etag = preview
+        return _image_response(data, mimetype, etag)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/analysis/<task_id>/frames/sprite', methods=['GET'])
+def get_frame_sprite(task_id):
+    """
+    获取分析帧雪碧图
+    ---
+    tags:
+      - agent
+    produces:
+      - image/webp
+      - image/jpeg
+    parameters:
+      - name: task_id
+        in: path
+        type: string
+        required: true
+        description: 任务ID
+      - name: token
+        in: query
+        type: string
+        required: false
+        description: 任务访问令牌（也可通过 X-Task-Token 请求头传递）
+      - name: format
+        in: query
+        type: string
+        required: false
+        description: 输出格式（webp/jpeg），默认根据Accept头选择
+    responses:
+      200:
+        description: 雪碧图，布局信息见 X-Sprite-Columns/X-Sprite-Rows/X-Sprite-Tile-Width/X-Sprite-Tile-Height/X-Sprite-Count 响应头
+      304:
+        description: 客户端缓存仍然有效
+      403:
+        description: 无权访问该任务
+      404:
+        description: 任务不存在或没有可用帧
+      409:
+        description: 分析尚未完成
+    """
+    try:
+        if not hasattr(current_app, 'video_tasks') or task_id not in current_app.video_tasks:
+            return jsonify({'error': 'Task not found'}), 404
+
+        task_info = current_app.video_tasks[task_id]
+        if not _check_task_token(task_info):
+            return jsonify({'error': 'Forbidden'}), 403
+        if task_info['status'] != 'completed':
+            return jsonify({'error': 'Analysis not completed'}), 409
+
+        preview_cache = get_frame_preview_cache()
+        fmt = preview_cache.negotiate_format(request.accept_mimetypes, request.args.get('format'))
+        sprite = preview_cache.get_sprite_sheet(
+            task_id,
+            get_task_payload_store().get(task_info, 'frames', []),
+            fmt
+        )
+        if sprite is None:
+            return jsonify({'error': 'No frames available'}), 404
+
+        data, mimetype, etag, layout = sprite
+        response = _image_response(data, mimetype, etag)
+        response.headers['X-Sprite-Columns'] = str(layout['columns'])
+        response.headers['X-Sprite-Rows'] = str(layout['rows'])
+        response.headers['X-Sprite-Tile-Width'] = str(layout['tile_width'])
+        response.headers['X-Sprite-Tile-Height'] = str(layout['tile_height'])
+        response.headers['X-Sprite-Count'] = str(layout['count'])
+        return response
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/metrics', methods=['GET'])
+def get_agent_metrics():
+    """
+    获取Agent运行指标
+    ---
+    tags:
+      - agent
+    responses:
+      200:
+        description: 准入控制、分析调度和幂等存储的运行指标
+    """
+    try:
+        return jsonify({
+            'admission': admission.get_stats(),
+            'analysis_scheduler': analysis_scheduler.get_stats(),
+            'idempotency': dict(idempotency_store.stats, size=idempotency_store.size()),
+            'pose_estimator_pools': [pool.get_stats() for pool in list(pose_estimator_pools.values())],
+            'pose_hash_index': pose_hash_index.get_stats(),
+            'task_payloads': get_task_payload_store().get_stats(getattr(current_app, 'video_tasks', {})),
+            'agent_memory': agent_memory.get_cache_stats(),
+            'chat_summarizer': agent_memory.summarizer.get_stats() if agent_memory.summarizer else None,
+            'semantic_cache': semantic_cache.get_stats() if semantic_cache else None,
+            'prompt_cache': prompt_cache.get_stats() if prompt_cache else None,
+            'plan_library': plan_library.get_stats(),
+            'llm_router': llm_router.get_stats(),
+            'llm_rate_limiter': llm_router.limiter.get_stats(),
+            'chat_managers': chat_managers.get_stats(),
+            'model_evaluators': model_evaluators.get_stats(),
+            'llm_http_pool': llm_manager.http_pool.get_stats(),
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,235 @@
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+# 滑雪术语的中英文别名，归一化为同一个规范词，使“怎么刻滑”和“how do I carve”落在一起
+SKI_TERM_ALIASES = {
+    'carve': ('刻滑', '卡宾', 'carving', 'carved', 'carve'),
+    'skid': ('搓雪', 'skidding', 'skidded', 'skid'),
+    'flatground': ('平花', 'ground tricks', 'ground trick', 'flatground'),
+    'edgechange': ('换刃', 'edge change', 'edge transition', 'edge changes'),
+    'shortturn': ('小回转', 'short turns', 'short turn', 'short radius'),
+    'longturn': ('大回转', 'long turns', 'long turn', 'giant slalom'),
+    'park': ('公园', 'terrain park', 'park'),
+    'snowboard': ('单板', 'snowboarding', 'snowboard'),
+    'ski': ('双板', 'skiing', 'skis', 'ski'),
+    'mogul': ('猫跳', 'moguls', 'mogul', 'bumps'),
+    'powder': ('粉雪', 'powder'),
+    'difference': ('区别', '不同', 'difference', 'differences', 'vs'),
+    'beginner': ('初学者', '新手', '初级', 'beginner', 'beginners'),
+    'fall': ('摔倒', '摔跤', 'falling', 'fall'),
+    'stop': ('刹车', '停下', 'stopping', 'stop'),
+}
+
+# 提问用的虚词，不影响问题的语义
+FILLER_PATTERNS = [
+    r'请问', r'想问一下', r'想问', r'怎么样才能', r'怎么才能', r'怎么', r'如何', r'怎样',
+    r'什么是', r'是什么', r'什么叫', r'吗', r'呢', r'啊', r'呀',
+    r'\bhow (do|can|should) (i|you|we)\b', r'\bhow to\b', r'\bwhat is\b', r'\bwhat\'s\b',
+    r'\bwhat are\b', r'\bplease\b', r'\bcan you\b', r'\btell me\b', r'\bexplain\b',
+    r'\bthe\b', r'\ba\b', r'\ban\b',
+]
+
+# 指代上下文的表达：包含这些词的问题依赖对话历史，不走语义缓存
+ANAPHORA_MARKERS_CJK = (
+    '这个', '那个', '这些', '那些', '这样', '那样', '刚才', '上面', '前面', '之前', '上次',
+    '你说', '继续', '还有呢', '再说', '它', '他', '她', '我的视频', '我的计划', '我的情况',
+)
+ANAPHORA_MARKERS_EN = {
+    'this', 'that', 'these', 'those', 'it', 'its', 'they', 'them', 'above', 'again',
+    'previous', 'earlier', 'before', 'continue', 'more', 'my', 'mine', 'he', 'she',
+}
+
+# 超过该长度的消息通常包含个人情况描述，不视为通用问题
+MAX_CONTEXT_FREE_CHARS = 80
+
+_ALIAS_LOOKUP = {alias: canonical for canonical, aliases in SKI_TERM_ALIASES.items() for alias in aliases}
+# 一次扫描完成替换（长别名优先），英文别名按整词匹配，避免 ski 匹配到 skid 内部
+_ALIAS_RE = re.compile('|'.join(
+    rf'\b{re.escape(alias)}\b' if alias.isascii() else re.escape(alias)
+    for alias in sorted(_ALIAS_LOOKUP, key=len, reverse=True)
+))
+_FILLER_RE = re.compile('|'.join(FILLER_PATTERNS), re.IGNORECASE)
+_WORD_RE = re.compile(r'[a-z0-9]+')
+_NON_TEXT_RE = re.compile(r'[\s\W_]+')
+
+
+def normalize_question(text):
+    """
+    归一化问题文本：小写、统一滑雪术语别名、去掉提问虚词和标点
+
+    Args:
+        text: 问题文本
+
+    Returns:
+        normalized: 归一化后的文本（词之间用空格分隔）
+    """
+    text = _FILLER_RE.sub(' ', text.lower())
+    text = _ALIAS_RE.sub(lambda match: f" {_ALIAS_LOOKUP[match.group(0)]} ", text)
+    return ' '.join(token for token in _NON_TEXT_RE.split(text) if token)
+
+
+def is_context_free(message):
+    """
+    判断消息是否为不依赖对话上下文的通用问题
+
+    Args:
+        message: 用户消息
+
+    Returns:
+        context_free: 是否为通用问题
+    """
+    if not message or len(message) > MAX_CONTEXT_FREE_CHARS:
+        return False
+    if any(marker in message for marker in ANAPHORA_MARKERS_CJK):
+        return False
+    words = set(_WORD_RE.findall(message.lower()))
+    return not (words & ANAPHORA_MARKERS_EN)
+
+
+def embed_question(text, dim=512):
+    """
+    用哈希字符n-gram生成问题向量（离线、无需模型）
+
+    特征包括归一化后的整词和每个词内的2、3字符片段，通过 crc32 哈希到固定维度，
+    并用哈希的一位决定符号以减少冲突的影响。
+
+    Args:
+        text: 问题文本
+        dim: 向量维度
+
+    Returns:
+        vector: L2归一化的 float32 向量
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in normalize_question(text).split(' '):
+        if not token:
+            continue
+        features = [(f"w:{token}", 1.0)]
+        if token not in SKI_TERM_ALIASES:
+            for n in (2, 3):
+                features.extend((f"c{n}:{token[i:i + n]}", 0.5) for i in range(len(token) - n + 1))
+        for feature, weight in features:
+            h = zlib.crc32(feature.encode('utf-8'))
+            vector[h % dim] += weight if (h >> 31) & 1 else -weight
+
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+class SemanticCache:
+    """
+    通用问题的语义回复缓存
+
+    问题向量存放在预分配的矩阵中，查询时一次矩阵乘法得到与所有条目的余弦相似度，
+    在同一命名空间（提供商/模型）内取最相似且未过期的条目，相似度达到阈值即命中。
+    条目有TTL，满了以后淘汰最久未访问的条目。
+    """
+
+    def __init__(self, threshold=0.86, ttl=86400, max_entries=5000, dim=512):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.dim = dim
+        self._vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self._expires_at = np.zeros(max_entries, dtype=np.float64)
+        self._last_access = np.zeros(max_entries, dtype=np.float64)
+        # 每行的 (命名空间, 问题, 回复, 生成耗时)，空行为None
+        self._entries = [None] * max_entries
+        self._lock = threading.Lock()
+        self.stats = {
+            'lookups': 0,
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'expired': 0,
+            'latency_saved_seconds': 0.0,
+        }
+
+    def lookup(self, question, namespace='default'):
+        """
+        查找语义相近问题的缓存回复
+
+        Args:
+            question: 问题
+            namespace: 命名空间
+
+        Returns:
+            response: 缓存的回复；未命中时返回None
+        """
+        query = embed_question(question, self.dim)
+        now = time.time()
+        with self._lock:
+            self.stats['lookups'] += 1
+            scores = self._vectors @ query
+            # 过期、空行和其他命名空间的条目不参与比较
+            for row in np.flatnonzero(scores >= self.threshold):
+                entry = self._entries[row]
+                if entry is None or entry[0] != namespace:
+                    scores[row] = -1.0
+                elif self._expires_at[row] <= now:
+                    self._remove(row)
+                    self.stats['expired'] += 1
+                    scores[row] = -1.0
+
+            row = int(np.argmax(scores))
+            if scores[row] < self.threshold:
+                self.stats['misses'] += 1
+                return None
+
+            self._last_access[row] = now
+            self.stats['hits'] += 1
+            self.stats['latency_saved_seconds'] += self._entries[row][3]
+            return self._entries[row][2]
+
+    def store(self, question, response, latency=0.0, namespace='default'):
+        """
+        缓存问题的回复
+
+        Args:
+            question: 问题
+            response: 回复
+            latency: 生成回复的耗时（秒），命中时计入节省的延迟
+            namespace: 命名空间
+        """
+        vector = embed_question(question, self.dim)
+        now = time.time()
+        with self._lock:
+            free = [row for row, entry in enumerate(self._entries) if entry is None]
+            if free:
+                row = free[0]
+            else:
+                # 优先淘汰已过期的条目，否则淘汰最久未访问的条目
+                expired = np.flatnonzero(self._expires_at <= now)
+                row = int(expired[0]) if len(expired) else int(np.argmin(self._last_access))
+                self.stats['evictions'] += 1
+
+            self._vectors[row] = vector
+            self._expires_at[row] = now + self.ttl
+            self._last_access[row] = now
+            self._entries[row] = (namespace, question, response, latency)
+            self.stats['stores'] += 1
+
+    def get_stats(self):
+        """
+        获取缓存统计信息
+        """
+        with self._lock:
+            lookups = self.stats['lookups']
+            return dict(
+                self.stats,
+                size=sum(1 for entry in self._entries if entry is not None),
+                hit_rate=self.stats['hits'] / lookups if lookups else 0.0,
+            )
+
+    def _remove(self, row):
+        self._vectors[row] = 0.0
+        self._expires_at[row] = 0.0
+        self._last_access[row] = 0.0
+        self._entries[row] = None
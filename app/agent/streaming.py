@@ -0,0 +1,124 @@
+import asyncio
+import json
+import queue
+import threading
+
+# 运行异步文本块迭代器的后台事件循环（进程内共享，LLM的异步HTTP客户端绑定在这个循环上）
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def sse_event(data, event=None):
+    """
+    格式化一条 Server-Sent Events 消息
+
+    Args:
+        data: 消息数据（会序列化为JSON）
+        event: 事件名称
+
+    Returns:
+        message: SSE 文本
+    """
+    lines = []
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def _background_loop():
+    """
+    获取（首次调用时启动）运行异步文本块迭代器的后台事件循环
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='sse-event-loop', daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+def stream_with_keepalive(chunks, keepalive_interval=15):
+    """
+    把文本块迭代器转换为带心跳的SSE流
+
+    等待LLM期间定期发送注释行作为心跳，防止代理和移动网络断开空闲连接。客户端断开时
+    WSGI 服务器会关闭本生成器：
+    - 异步迭代器（例如 ChatManager.astream_message）在后台事件循环中运行，关闭时立即
+      取消，正在等待的HTTP流随之关闭，不再占用限流额度和提供商的连接。
+    - 同步迭代器在后台线程中运行，只能在收到下一个文本块时发现已停止并关闭上游迭代器。
+
+    生成器在第一次迭代前被关闭时不会执行任何清理，迭代器也尚未开始运行；请求级别的
+    资源（如准入槽位）应通过 Response.call_on_close 释放，而不是依赖本生成器结束。
+
+    Args:
+        chunks: 文本块迭代器或异步迭代器
+        keepalive_interval: 心跳间隔（秒）
+
+    Returns:
+        events: SSE 文本生成器
+    """
+    items = queue.Queue()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if stop.is_set():
+                    break
+                items.put(('token', chunk))
+            else:
+                items.put(('done', None))
+        except Exception as e:
+            items.put(('error', str(e)))
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close:
+                close()
+
+    async def aproduce():
+        try:
+            async for chunk in chunks:
+                items.put(('token', chunk))
+            items.put(('done', None))
+        except Exception as e:
+            items.put(('error', str(e)))
+        finally:
+            aclose = getattr(chunks, 'aclose', None)
+            if aclose:
+                await aclose()
+
+    def generate():
+        future = None
+        if hasattr(chunks, '__aiter__'):
+            future = asyncio.run_coroutine_threadsafe(aproduce(), _background_loop())
+        else:
+            producer = threading.Thread(target=produce, name='sse-producer', daemon=True)
+            producer.start()
+        parts = []
+        try:
+            yield sse_event({}, event='start')
+            while True:
+                try:
+                    kind, value = items.get(timeout=keepalive_interval)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+
+                if kind == 'token':
+                    parts.append(value)
+                    yield sse_event({'token': value}, event='token')
+                elif kind == 'done':
+                    yield sse_event({'response': ''.join(parts)}, event='done')
+                    break
+                else:
+                    yield sse_event({'error': value}, event='error')
+                    break
+        finally:
+            stop.set()
+            if future is not None:
+                # 取消会在后台事件循环中抛出 CancelledError，关闭正在进行的LLM流
+                future.cancel()
+
+    return generate()
@@ -0,0 +1,139 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import HumanMessage
+
+from app.agent.agent_memory import Role
+from app.agent.llm_router import llm_router
+
+SUMMARY_PROMPT = (
+    "你在为一位滑雪教练整理与学员的对话记录。请把下面的新对话合并进已有摘要，"
+    "输出一份更新后的完整摘要。\n"
+    "摘要需要保留：学员的单双板类型、技术水平、学习目标、身体情况和顾虑、"
+    "教练给出的关键建议和练习安排、尚未解决的问题。省略寒暄和重复内容，"
+    "不超过{max_chars}字。\n\n"
+    "已有摘要：\n{summary}\n\n"
+    "新对话：\n{transcript}\n\n"
+    "更新后的摘要："
+)
+
+
+class ConversationSummarizer:
+    """
+    对话滚动摘要
+
+    用户的未摘要对话超过 trigger_tokens 后，在后台线程中把较早的轮次合并进摘要，
+    只保留最近约 keep_recent_tokens 的原文。摘要按版本递增，每次只处理上一版本
+    covered_until 之后的新消息，不在用户请求路径上调用LLM。
+    """
+
+    def __init__(self, agent_memory, llm_provider='openai', llm_model=None,
+                 trigger_tokens=3000, keep_recent_tokens=1500, max_summary_chars=600, max_workers=1):
+        self.agent_memory = agent_memory
+        self.llm_provider = llm_provider
+        self.llm_model = llm_model
+        self.trigger_tokens = trigger_tokens
+        self.keep_recent_tokens = keep_recent_tokens
+        self.max_summary_chars = max_summary_chars
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='summarizer')
+        self._pending = set()
+        self._lock = threading.Lock()
+        self.stats = {'scheduled': 0, 'completed': 0, 'failed': 0, 'stale': 0}
+
+    def maybe_schedule(self, user_id):
+        """
+        检查用户的未摘要对话长度，超过阈值时提交后台摘要任务
+
+        Args:
+            user_id: 用户ID
+
+        Returns:
+            scheduled: 是否提交了任务
+        """
+        summary = self.agent_memory.get_summary(user_id)
+        session_history = self.agent_memory.get_session_history(user_id)
+        covered_until = summary['covered_until'] if summary else 0
+        if sum(record.tokens for record in session_history.records[covered_until:]) <= self.trigger_tokens:
+            return False
+
+        with self._lock:
+            # 同一用户同时只有一个摘要任务
+            if user_id in self._pending:
+                return False
+            self._pending.add(user_id)
+            self.stats['scheduled'] += 1
+
+        self._executor.submit(self._run, user_id)
+        return True
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, pending=len(self._pending))
+
+    def _run(self, user_id):
+        try:
+            if self._summarize(user_id):
+                with self._lock:
+                    self.stats['completed'] += 1
+        except Exception as e:
+            print(f"Failed to summarize conversation for {user_id}: {str(e)}")
+            with self._lock:
+                self.stats['failed'] += 1
+        finally:
+            with self._lock:
+                self._pending.discard(user_id)
+
+    def _summarize(self, user_id):
+        """
+        生成下一版本的摘要
+
+        Returns:
+            saved: 是否保存了新摘要
+        """
+        summary = self.agent_memory.get_summary(user_id)
+        version = summary['version'] if summary else 0
+        covered_until = summary['covered_until'] if summary else 0
+
+        session_history = self.agent_memory.get_session_history(user_id)
+        records = list(session_history.records)
+        cut = self._find_cut(records, covered_until)
+        if cut <= covered_until:
+            return False
+
+        llm = llm_router.get_llm(self.llm_provider, self.llm_model, priority='background')
+        prompt = SUMMARY_PROMPT.format(
+            max_chars=self.max_summary_chars,
+            summary=summary['text'] if summary else '（无）',
+            transcript=self._render_transcript(records[covered_until:cut]),
+        )
+        text = llm.invoke([HumanMessage(content=prompt)]).content.strip()
+
+        # 期间对话被清空或摘要已被其他任务更新时放弃本次结果
+        if not self.agent_memory.save_summary(
+            user_id, text, cut, expected_version=version, session_history=session_history
+        ):
+            with self._lock:
+                self.stats['stale'] += 1
+            return False
+        return True
+
+    def _find_cut(self, records, covered_until):
+        """
+        找到摘要的截止位置：之后保留约 keep_recent_tokens 的原文，并从用户消息开始
+        """
+        kept = 0
+        cut = len(records)
+        while cut > covered_until and kept + records[cut - 1].tokens <= self.keep_recent_tokens:
+            cut -= 1
+            kept += records[cut].tokens
+        # 保留的原文从用户消息开始，不把一轮对话拆进摘要和原文两边
+        while covered_until < cut < len(records) and records[cut].role != Role.USER:
+            cut -= 1
+        return cut
+
+    def _render_transcript(self, records):
+        lines = []
+        for record in records:
+            role = '学员' if record.role == Role.USER else '教练'
+            lines.append(f"{role}：{record.text}")
+        return '\n'.join(lines)
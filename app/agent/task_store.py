@@ -0,0 +1,171 @@
+import gzip
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# 任务完成后移出内存的大字段
+SPILL_KEYS = ('frames', 'pose_data', 'evaluation')
+
+_MISSING = object()
+
+
+class TaskPayloadStore:
+    """
+    分析任务大字段的磁盘存储
+
+    任务完成后把 frames、pose_data、evaluation 压缩写入磁盘，task_info 中只保留
+    小的摘要和文件路径；读取时按需从磁盘加载，并用一个小的LRU缓存最近访问的任务。
+    """
+
+    def __init__(self, blob_dir, cache_size=32):
+        self.blob_dir = blob_dir
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            'spilled_tasks': 0,
+            'spilled_bytes': 0,
+            'rehydrations': 0,
+            'cache_hits': 0,
+        }
+
+    def spill(self, task_info):
+        """
+        把任务的大字段写入磁盘并从 task_info 中移除
+
+        Args:
+            task_info: 任务信息
+        """
+        payload = {key: task_info[key] for key in SPILL_KEYS if key in task_info}
+        if not payload:
+            return
+
+        os.makedirs(self.blob_dir, exist_ok=True)
+        blob_path = os.path.join(self.blob_dir, f"{task_info['task_id']}.json.gz")
+        data = gzip.compress(
+            json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+            compresslevel=6
+        )
+        # 先写临时文件再原子替换，避免读到写了一半的文件
+        tmp_path = f"{blob_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, blob_path)
+
+        evaluation = payload.get('evaluation') or {}
+        task_info['summary'] = {
+            'frame_count': len(payload.get('frames') or []),
+            'pose_frame_count': len(payload.get('pose_data') or []),
+            'overall_rating': evaluation.get('overall_rating'),
+        }
+        task_info['payload_path'] = blob_path
+        task_info['payload_bytes'] = len(data)
+        for key in payload:
+            del task_info[key]
+
+        with self._lock:
+            self._cache.pop(task_info['task_id'], None)
+            self.stats['spilled_tasks'] += 1
+            self.stats['spilled_bytes'] += len(data)
+
+    def get(self, task_info, key, default=None):
+        """
+        读取任务字段，已写入磁盘的字段按需加载
+
+        Args:
+            task_info: 任务信息
+            key: 字段名
+            default: 字段不存在时的默认值
+
+        Returns:
+            value: 字段值
+        """
+        # 分析线程可能正在把字段移出内存：只读一次，避免检查后再读取时字段已被删除
+        value = task_info.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if key not in SPILL_KEYS or not task_info.get('payload_path'):
+            return default
+        payload = self._load(task_info)
+        return payload.get(key, default) if payload is not None else default
+
+    def discard(self, task_info):
+        """
+        删除任务已写入磁盘的数据（任务重新分析前调用）
+
+        Args:
+            task_info: 任务信息
+        """
+        blob_path = task_info.pop('payload_path', None)
+        task_info.pop('payload_bytes', None)
+        task_info.pop('summary', None)
+        with self._lock:
+            self._cache.pop(task_info['task_id'], None)
+        if blob_path and os.path.exists(blob_path):
+            try:
+                os.remove(blob_path)
+            except OSError:
+                pass
+
+    def get_stats(self, tasks=None):
+        """
+        获取存储统计信息
+
+        Args:
+            tasks: 所有任务信息（用于统计仍在内存中的大字段大小）
+
+        Returns:
+            stats: 统计信息，resident_payload_bytes 为内存中大字段的估算大小
+        """
+        resident_bytes = 0
+        resident_tasks = 0
+        for task_info in list((tasks or {}).values()):
+            sizes = [self._approx_size(task_info[key]) for key in SPILL_KEYS if key in task_info]
+            if sizes:
+                resident_tasks += 1
+                resident_bytes += sum(sizes)
+
+        with self._lock:
+            return dict(
+                self.stats,
+                cached_tasks=len(self._cache),
+                resident_tasks=resident_tasks,
+                resident_payload_bytes=resident_bytes,
+            )
+
+    def _load(self, task_info):
+        """
+        从缓存或磁盘加载任务数据
+        """
+        task_id = task_info['task_id']
+        with self._lock:
+            payload = self._cache.get(task_id)
+            if payload is not None:
+                self._cache.move_to_end(task_id)
+                self.stats['cache_hits'] += 1
+                return payload
+
+        try:
+            with gzip.open(task_info['payload_path'], 'rb') as f:
+                payload = json.loads(f.read().decode('utf-8'))
+        except (OSError, ValueError) as e:
+            print(f"Failed to load task payload {task_id}: {str(e)}")
+            return None
+
+        with self._lock:
+            self._cache[task_id] = payload
+            self._cache.move_to_end(task_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            self.stats['rehydrations'] += 1
+        return payload
+
+    def _approx_size(self, value):
+        """
+        估算字段序列化后的大小（字节）
+        """
+        try:
+            return len(json.dumps(value, ensure_ascii=False, separators=(',', ':')))
+        except (TypeError, ValueError):
+            return 0
@@ -0,0 +1,24 @@
+import re
+
+# CJK 字符（中日韩统一表意文字及全角标点）通常每个字符约占1个token
+_CJK_PATTERN = re.compile(r'[　-〿㐀-䶿一-鿿＀-￯]')
+
+
+def estimate_tokens(text):
+    """
+    估算文本的token数量
+
+    不依赖具体模型的分词器：CJK字符按1个token计，其余字符按约4个字符1个token计。
+    用于预算控制，允许有少量误差。
+
+    Args:
+        text: 文本
+
+    Returns:
+        tokens: 估算的token数量
+    """
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + (other_count + 3) // 4
@@ -144,6 +144,87 @@ class CurrentWeather(db.Model):
         }
 
 
+class PlanTemplate(db.Model):
+    """预生成的学习计划模板（按 滑雪类型 × 技能水平 × 目标类别）"""
+
+    __tablename__ = "plan_templates"
+    __table_args__ = (
+        db.UniqueConstraint("ski_type", "skill_level", "goal_bucket", name="uq_plan_templates_key"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    ski_type = db.Column(db.String(16), nullable=False)  # 单板、双板
+    skill_level = db.Column(db.String(16), nullable=False)  # 初级、中级、高级
+    goal_bucket = db.Column(db.String(32), nullable=False)  # 目标类别，见 app.agent.plan_library.GOAL_BUCKETS
+    content = db.Column(db.Text, nullable=False)  # 学习计划正文
+    llm_model = db.Column(db.String(64))  # 生成模板所用的模型
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "ski_type": self.ski_type,
+            "skill_level": self.skill_level,
+            "goal_bucket": self.goal_bucket,
+            "content": self.content,
+            "llm_model": self.llm_model,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+
+class ChatMessageRecord(db.Model):
+    """Agent 对话消息"""
+
+    __tablename__ = "chat_messages"
+    __table_args__ = (
+        db.Index("ix_chat_messages_user_id_created_at", "user_id", "created_at"),
+        db.Index("ix_chat_messages_user_id_message_id", "user_id", "message_id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(64), nullable=False)
+    message_id = db.Column(db.BigInteger, nullable=False)  # 递增的消息ID，用作分页游标
+    role = db.Column(db.String(16), nullable=False)  # user、assistant
+    content = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.message_id,
+            "role": self.role,
+            "content": self.content,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
+
+class SkiHistoryRecord(db.Model):
+    """用户滑雪历史（视频分析结果等）"""
+
+    __tablename__ = "ski_history"
+    __table_args__ = (
+        db.Index("ix_ski_history_user_id_created_at", "user_id", "created_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(64), nullable=False)
+    data = db.Column(db.Text, nullable=False)  # JSON 文本
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class LearningPlanRecord(db.Model):
+    """用户学习计划"""
+
+    __tablename__ = "learning_plans"
+    __table_args__ = (
+        db.Index("ix_learning_plans_user_id_created_at", "user_id", "created_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(64), nullable=False)
+    plan = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
 def list_items() -> List[Item]:
     """获取所有 Item 记录."""
     return Item.query.order_by(Item.id.asc()).all()
@@ -172,6 +253,26 @@ def get_slopes_by_resort(resort_id: str) -> List[Slope]:
     return Slope.query.filter_by(resort_id=resort_id).all()
 
 
+def get_plan_template(ski_type: str, skill_level: str, goal_bucket: str) -> Optional[PlanTemplate]:
+    """获取指定组合的学习计划模板."""
+    return PlanTemplate.query.filter_by(
+        ski_type=ski_type, skill_level=skill_level, goal_bucket=goal_bucket
+    ).first()
+
+
+def upsert_plan_template(ski_type: str, skill_level: str, goal_bucket: str, content: str,
+                         llm_model: Optional[str] = None) -> PlanTemplate:
+    """创建或更新学习计划模板."""
+    template = get_plan_template(ski_type, skill_level, goal_bucket)
+    if template is None:
+        template = PlanTemplate(ski_type=ski_type, skill_level=skill_level, goal_bucket=goal_bucket)
+        db.session.add(template)
+    template.content = content
+    template.llm_model = llm_model
+    db.session.commit()
+    return template
+
+
 def seed_items_if_empty() -> None:
     """在应用启动时，如果表为空则写入一些初始数据."""
     if Item.query.first() is not None:
@@ -27,6 +27,141 @@ class Config:
     # 分页配置
     POSTS_PER_PAGE = 10
 
+    # 文件下载配置：部署在 nginx 等前端服务器之后时开启，由其直接发送视频文件
+    USE_X_SENDFILE = os.environ.get("USE_X_SENDFILE", "false").lower() == "true"
+
+    # 视频分析调度配置：工作线程数、老化速率（每等待1秒抵扣的成本）、同一用户每个运行中任务的惩罚
+    ANALYSIS_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", 2))
+    ANALYSIS_AGING_RATE = float(os.environ.get("ANALYSIS_AGING_RATE", 1.0))
+    ANALYSIS_FAIRNESS_PENALTY = float(os.environ.get("ANALYSIS_FAIRNESS_PENALTY", 30.0))
+    # 批量分析单次最多上传的视频数量（实际上限不超过视频分析的准入容量 max_concurrent + max_queue）
+    BATCH_MAX_CLIPS = int(os.environ.get("BATCH_MAX_CLIPS", 20))
+    # 帧感知哈希复用姿态结果的最大汉明距离：dHash（0-7，0 表示只复用 dHash 完全相同的帧），
+    # 以及确认复用所需的 32×32 pHash 距离
+    POSE_HASH_MAX_DISTANCE = int(os.environ.get("POSE_HASH_MAX_DISTANCE", 0))
+    POSE_HASH_CONFIRM_DISTANCE = int(os.environ.get("POSE_HASH_CONFIRM_DISTANCE", 2))
+
+    # 姿态估计后端：默认后端，以及按技能水平选择的后端（初级动作幅度大，轻量模型即可）
+    POSE_BACKEND = os.environ.get("POSE_BACKEND", "mediapipe_heavy")
+    POSE_BACKEND_BY_SKILL = {
+        "初级": os.environ.get("POSE_BACKEND_BEGINNER", "mediapipe_full"),
+        "中级": os.environ.get("POSE_BACKEND_INTERMEDIATE", "mediapipe_heavy"),
+        "高级": os.environ.get("POSE_BACKEND_ADVANCED", "mediapipe_heavy"),
+    }
+
+    # SSE 流式聊天的心跳间隔（秒）
+    SSE_KEEPALIVE_SECONDS = float(os.environ.get("SSE_KEEPALIVE_SECONDS", 15))
+
+    # 对话滚动摘要：未摘要对话超过 TRIGGER_TOKENS 后在后台合并较早轮次，保留约 KEEP_RECENT_TOKENS 的原文
+    CHAT_SUMMARY_ENABLED = os.environ.get("CHAT_SUMMARY_ENABLED", "true").lower() == "true"
+    CHAT_SUMMARY_LLM_PROVIDER = os.environ.get("CHAT_SUMMARY_LLM_PROVIDER", "openai")
+    CHAT_SUMMARY_LLM_MODEL = os.environ.get("CHAT_SUMMARY_LLM_MODEL") or None
+    CHAT_SUMMARY_TRIGGER_TOKENS = int(os.environ.get("CHAT_SUMMARY_TRIGGER_TOKENS", 3000))
+    CHAT_SUMMARY_KEEP_RECENT_TOKENS = int(os.environ.get("CHAT_SUMMARY_KEEP_RECENT_TOKENS", 1500))
+
+    # 通用问题的语义回复缓存：余弦相似度阈值、有效期（秒）、最大条目数
+    SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", 0.86))
+    SEMANTIC_CACHE_TTL = int(os.environ.get("SEMANTIC_CACHE_TTL", 86400))
+    SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", 5000))
+
+    # LLM调用的精确匹配缓存：内存LRU条目数、默认有效期（秒）、可选的SQLite文件路径
+    PROMPT_CACHE_ENABLED = os.environ.get("PROMPT_CACHE_ENABLED", "true").lower() == "true"
+    PROMPT_CACHE_MAX_ENTRIES = int(os.environ.get("PROMPT_CACHE_MAX_ENTRIES", 1024))
+    PROMPT_CACHE_TTL = int(os.environ.get("PROMPT_CACHE_TTL", 3600))
+    PROMPT_CACHE_SQLITE_PATH = os.environ.get("PROMPT_CACHE_SQLITE_PATH") or None
+
+    # LLM 客户端共享的 HTTP 连接池：连接数限制、keep-alive 时长和各阶段超时（秒）
+    LLM_HTTP_POOL = {
+        "max_connections": int(os.environ.get("LLM_HTTP_MAX_CONNECTIONS", 100)),
+        "max_keepalive_connections": int(os.environ.get("LLM_HTTP_MAX_KEEPALIVE", 20)),
+        "keepalive_expiry": float(os.environ.get("LLM_HTTP_KEEPALIVE_EXPIRY", 60)),
+        "connect_timeout": float(os.environ.get("LLM_HTTP_CONNECT_TIMEOUT", 10)),
+        "read_timeout": float(os.environ.get("LLM_HTTP_READ_TIMEOUT", 120)),
+        "write_timeout": float(os.environ.get("LLM_HTTP_WRITE_TIMEOUT", 30)),
+        "pool_timeout": float(os.environ.get("LLM_HTTP_POOL_TIMEOUT", 10)),
+    }
+
+    # LLM 故障切换：各提供商失败时依次尝试的备用提供商
+    LLM_FALLBACKS = {
+        "openai": ["qianwen", "google"],
+        "qianwen": ["openai", "google"],
+        "google": ["openai", "qianwen"],
+    }
+    # 错误率超过阈值的模型熔断一段时间（秒），期间优先使用备用提供商
+    LLM_CIRCUIT_ERROR_RATE = float(os.environ.get("LLM_CIRCUIT_ERROR_RATE", 0.5))
+    LLM_CIRCUIT_COOLDOWN = float(os.environ.get("LLM_CIRCUIT_COOLDOWN", 30))
+    # 对冲请求：首选请求超过该模型的 p95 耗时（不少于 MIN_DELAY 秒）仍未返回时向备用提供商再发一个请求
+    # （只作用于非流式调用，SSE 流式聊天只做故障切换）
+    LLM_HEDGE_ENABLED = os.environ.get("LLM_HEDGE_ENABLED", "false").lower() == "true"
+    LLM_HEDGE_PERCENTILE = float(os.environ.get("LLM_HEDGE_PERCENTILE", 95))
+    LLM_HEDGE_MIN_DELAY = float(os.environ.get("LLM_HEDGE_MIN_DELAY", 2.0))
+    # LLM 调用限流：各提供商每分钟的请求数和token数上限（0 表示不限制），可用 "提供商:模型" 为单个模型单独配置
+    LLM_RATE_LIMITS = {
+        "openai": {
+            "rpm": int(os.environ.get("OPENAI_RPM_LIMIT", 500)),
+            "tpm": int(os.environ.get("OPENAI_TPM_LIMIT", 200000)),
+        },
+        "qianwen": {
+            "rpm": int(os.environ.get("QIANWEN_RPM_LIMIT", 600)),
+            "tpm": int(os.environ.get("QIANWEN_TPM_LIMIT", 1000000)),
+        },
+        "google": {
+            "rpm": int(os.environ.get("GOOGLE_RPM_LIMIT", 60)),
+            "tpm": int(os.environ.get("GOOGLE_TPM_LIMIT", 120000)),
+        },
+    }
+    # 限流排队的最长等待时间（秒）：交互聊天 > 学习计划 > 后台视频评价/对话摘要，超时后切换到备用提供商
+    LLM_RATE_LIMIT_MAX_WAIT = {
+        "chat": float(os.environ.get("LLM_RATE_LIMIT_CHAT_MAX_WAIT", 15)),
+        "plan": float(os.environ.get("LLM_RATE_LIMIT_PLAN_MAX_WAIT", 60)),
+        "background": float(os.environ.get("LLM_RATE_LIMIT_BACKGROUND_MAX_WAIT", 300)),
+    }
+
+    # Agent 记忆存储：memory（只保存在进程内存中）或 sql（保存到数据库，进程内存作为最近活跃用户的读缓存）
+    AGENT_MEMORY_BACKEND = os.environ.get("AGENT_MEMORY_BACKEND", "memory")
+    # 数据库写入的批大小和最长间隔（秒）、加载用户时读取的最近消息数、读缓存最多缓存的用户数
+    AGENT_MEMORY_WRITE_BATCH_SIZE = int(os.environ.get("AGENT_MEMORY_WRITE_BATCH_SIZE", 200))
+    AGENT_MEMORY_FLUSH_INTERVAL = float(os.environ.get("AGENT_MEMORY_FLUSH_INTERVAL", 0.5))
+    AGENT_MEMORY_HISTORY_LOAD_LIMIT = int(os.environ.get("AGENT_MEMORY_HISTORY_LOAD_LIMIT", 200))
+    AGENT_MEMORY_CACHE_MAX_USERS = int(os.environ.get("AGENT_MEMORY_CACHE_MAX_USERS", 1000))
+    # 读缓存命中超过该时间（秒）后与数据库核对最新消息（多进程部署时其他进程可能已写入），以及缓存的最长保留时间（秒）
+    AGENT_MEMORY_CACHE_REVALIDATE_SECONDS = float(os.environ.get("AGENT_MEMORY_CACHE_REVALIDATE_SECONDS", 5))
+    AGENT_MEMORY_CACHE_MAX_AGE = float(os.environ.get("AGENT_MEMORY_CACHE_MAX_AGE", 300))
+
+    # ChatManager/ModelEvaluator 实例注册表：每类最多保留的 提供商/模型 实例数和空闲淘汰时间（秒）
+    AGENT_INSTANCE_REGISTRY = {
+        "max_size": int(os.environ.get("AGENT_INSTANCE_REGISTRY_MAX_SIZE", 32)),
+        "idle_ttl": int(os.environ.get("AGENT_INSTANCE_REGISTRY_IDLE_TTL", 3600)),
+    }
+
+    # 学习计划模板在进程内的缓存时间（秒）
+    PLAN_TEMPLATE_CACHE_TTL = int(os.environ.get("PLAN_TEMPLATE_CACHE_TTL", 600))
+
+    # 异步LLM服务（app.agent.async_server）：同时进行中的LLM调用上限、最大排队数、排队超时（秒）
+    ASYNC_AGENT_MAX_INFLIGHT = int(os.environ.get("ASYNC_AGENT_MAX_INFLIGHT", 500))
+    ASYNC_AGENT_MAX_QUEUE = int(os.environ.get("ASYNC_AGENT_MAX_QUEUE", 1000))
+    ASYNC_AGENT_QUEUE_TIMEOUT = float(os.environ.get("ASYNC_AGENT_QUEUE_TIMEOUT", 10))
+
+    # Agent 端点准入控制：每类端点的最大并发数、最大排队数、排队超时（秒）
+    AGENT_ADMISSION_LIMITS = {
+        "video": {
+            "max_concurrent": int(os.environ.get("ADMISSION_VIDEO_MAX_CONCURRENT", 2)),
+            "max_queue": int(os.environ.get("ADMISSION_VIDEO_MAX_QUEUE", 16)),
+            "queue_timeout": 0,
+        },
+        "chat": {
+            "max_concurrent": int(os.environ.get("ADMISSION_CHAT_MAX_CONCURRENT", 16)),
+            "max_queue": int(os.environ.get("ADMISSION_CHAT_MAX_QUEUE", 32)),
+            "queue_timeout": float(os.environ.get("ADMISSION_CHAT_QUEUE_TIMEOUT", 10)),
+        },
+        "plan": {
+            "max_concurrent": int(os.environ.get("ADMISSION_PLAN_MAX_CONCURRENT", 4)),
+            "max_queue": int(os.environ.get("ADMISSION_PLAN_MAX_QUEUE", 8)),
+            "queue_timeout": float(os.environ.get("ADMISSION_PLAN_QUEUE_TIMEOUT", 15)),
+        },
+    }
+
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -35,6 +170,9 @@ class DevelopmentConfig(Config):
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
+    # 测试环境使用确定性的姿态估计后端，不依赖 mediapipe
+    POSE_BACKEND = "stub"
+    POSE_BACKEND_BY_SKILL = {}
 
 
 class ProductionConfig(Config):
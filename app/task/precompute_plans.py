@@ -0,0 +1,93 @@
+"""
+预生成学习计划模板
+
+为 滑雪类型 × 技能水平 × 目标类别 的每个组合调用LLM生成完整的学习计划，
+保存到 plan_templates 表。在线生成学习计划时直接使用模板或只做简短的个性化调整。
+
+用法：
+    python app/task/precompute_plans.py --provider qianwen
+    python app/task/precompute_plans.py --only-missing
+"""
+import argparse
+import logging
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from langchain_core.messages import HumanMessage
+
+from app.agent.llm_manager import DEFAULT_MODELS, llm_manager
+from app.agent.plan_library import GOAL_BUCKETS, SKI_TYPES, SKILL_LEVELS, build_plan_prompt
+from app.db.models import get_plan_template, upsert_plan_template
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('precompute_plans')
+
+
+def precompute_plans(provider='openai', model=None, only_missing=False, max_concurrency=4):
+    """
+    生成并保存所有组合的学习计划模板（需要在应用上下文中调用）
+
+    Args:
+        provider: LLM提供商
+        model: LLM模型名称
+        only_missing: 只生成数据库中还没有的组合
+        max_concurrency: 并发调用LLM的数量
+
+    Returns:
+        (saved, failed): 保存成功和失败的组合数量
+    """
+    combos = [
+        (ski_type, skill_level, bucket)
+        for ski_type in SKI_TYPES
+        for skill_level in SKILL_LEVELS
+        for bucket in GOAL_BUCKETS
+    ]
+    if only_missing:
+        combos = [combo for combo in combos if get_plan_template(*combo) is None]
+    if not combos:
+        logger.info("所有学习计划模板均已存在")
+        return 0, 0
+
+    llm = llm_manager.get_llm(provider, model)
+    prompts = [
+        [HumanMessage(content=build_plan_prompt(ski_type, skill_level, GOAL_BUCKETS[bucket]['goals']))]
+        for ski_type, skill_level, bucket in combos
+    ]
+    logger.info(f"开始生成 {len(combos)} 个学习计划模板")
+    results = llm.batch(prompts, config={'max_concurrency': max_concurrency}, return_exceptions=True)
+
+    model_name = model or DEFAULT_MODELS.get(provider)
+    saved = failed = 0
+    for (ski_type, skill_level, bucket), result in zip(combos, results):
+        if isinstance(result, Exception) or not getattr(result, 'content', None):
+            logger.error(f"生成 {ski_type}/{skill_level}/{bucket} 失败: {result}")
+            failed += 1
+            continue
+        upsert_plan_template(ski_type, skill_level, bucket, result.content, llm_model=model_name)
+        saved += 1
+
+    logger.info(f"学习计划模板生成完成：成功 {saved} 个，失败 {failed} 个")
+    return saved, failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="预生成学习计划模板")
+    parser.add_argument("--provider", default="openai", help="LLM提供商 (openai/google/qianwen)")
+    parser.add_argument("--model", default=None, help="LLM模型名称")
+    parser.add_argument("--only-missing", action="store_true", help="只生成数据库中还没有的组合")
+    parser.add_argument("--max-concurrency", type=int, default=4, help="并发调用LLM的数量")
+    args = parser.parse_args()
+
+    from app.server import create_app
+
+    app = create_app()
+    with app.app_context():
+        precompute_plans(
+            provider=args.provider,
+            model=args.model,
+            only_missing=args.only_missing,
+            max_concurrency=args.max_concurrency,
+        )
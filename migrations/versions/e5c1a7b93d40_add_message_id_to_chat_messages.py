@@ -0,0 +1,34 @@
+"""Add message_id to chat_messages
+
+Revision ID: e5c1a7b93d40
+Revises: d3a9f58e1b27
+Create Date: 2026-10-19 18:21:37.904512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5c1a7b93d40'
+down_revision = 'd3a9f58e1b27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('chat_messages', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('message_id', sa.BigInteger(), nullable=True))
+
+    # 已有消息用自增主键作为消息ID，小于新生成的微秒时间戳ID，顺序不变
+    op.execute('UPDATE chat_messages SET message_id = id')
+
+    with op.batch_alter_table('chat_messages', schema=None) as batch_op:
+        batch_op.alter_column('message_id', existing_type=sa.BigInteger(), nullable=False)
+        batch_op.create_index('ix_chat_messages_user_id_message_id', ['user_id', 'message_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('chat_messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_chat_messages_user_id_message_id')
+        batch_op.drop_column('message_id')